@@ -0,0 +1,228 @@
+/*
+-----------------------------------------------------------------
+FILE INFORMATION
+-----------------------------------------------------------------
+file:       AccumulatorHavven.sol
+version:    0.1
+
+date:       2018-03-12
+
+-----------------------------------------------------------------
+MODULE DESCRIPTION
+-----------------------------------------------------------------
+
+An alternative fee distribution engine for havven, for comparison
+with the three-period bookkeeping of Havven.rolloverFee.
+
+Each closed fee period's fees are added to a global accumulator of
+fees per havven held, and recorded with the period's start and end.
+An account keeps, besides its balance sum in the period it last
+transferred in, the index of that period and the fees it has accrued.
+When the account next transfers, in a later period, its balance sum
+earns its share of that period's fees, and its balance throughout
+every intervening period earns the difference in the accumulator
+across them. So accrual takes a constant amount of work however long
+the account was idle, and fees accrued in any number of periods may be
+withdrawn at any time.
+
+The fees shared out at the end of a period are those in the pool which
+are not already owed to holders. The share of the havven contract's
+own balance returns to the pool for the next period, just as its
+share goes unclaimed under the existing scheme.
+
+This engine maintains neither the last nor the penultimate average
+balances, so it cannot supply vote weights to a Court, nor does it
+support the escrow contract, whose fee handling relies on withdrawals
+being made once per period.
+
+-----------------------------------------------------------------
+*/
+
+pragma solidity ^0.4.19;
+
+
+import "contracts/Havven.sol";
+
+
+contract AccumulatorHavven is Havven {
+
+    /* ========== STATE VARIABLES ========== */
+
+    // A closed fee period: the fees shared out at its end, and its bounds.
+    struct FeePeriodRecord {
+        uint128 fees;
+        uint64 startTime;
+        uint64 endTime;
+    }
+
+    FeePeriodRecord[] public feePeriods;
+
+    // The fees owed to a holder of one havven for the whole of every fee period
+    // before the given index. The first entry is zero, so there is one more
+    // entry than there are closed periods.
+    // range: decimals; units: nomins per havven
+    uint[] public cumulativeFeesPerHavven;
+
+    // The fees an account has accrued but not withdrawn, and the index of the
+    // fee period its balance sum in the FeeState structure belongs to.
+    struct AccrualState {
+        uint128 accruedFees;
+        uint128 feePeriod;
+    }
+
+    mapping(address => AccrualState) accrualStates;
+
+    // The fees shared out which holders have not yet withdrawn.
+    uint public feesOwed;
+
+
+    /* ========== CONSTRUCTOR ========== */
+
+    function AccumulatorHavven(address _owner)
+        Havven(_owner)
+        public
+    {
+        cumulativeFeesPerHavven.push(0);
+    }
+
+
+    /* ========== SETTERS ========== */
+
+    function setEscrow(HavvenEscrow)
+        public
+    {
+        revert();
+    }
+
+
+    /* ========== VIEW FUNCTIONS ========== */
+
+    function feePeriodCount()
+        public
+        view
+        returns (uint)
+    {
+        return feePeriods.length;
+    }
+
+    /* The fees the account may withdraw now: those accrued in every closed fee period. */
+    function feesAvailable(address account)
+        public
+        view
+        returns (uint)
+    {
+        return safeAdd(accrualStates[account].accruedFees, pendingFees(account, balanceOf[account]));
+    }
+
+    /* The fees earned in closed periods since the account's last transfer,
+     * given the balance it has held since then. */
+    function pendingFees(address account, uint preBalance)
+        internal
+        view
+        returns (uint)
+    {
+        uint period = accrualStates[account].feePeriod;
+        uint current = feePeriods.length;
+        if (period == current) {
+            return 0;
+        }
+
+        // Its share of the period it last transferred in, by its balance sum...
+        FeePeriodRecord storage record = feePeriods[period];
+        FeeState storage state = feeStates[account];
+        uint balanceSum = safeAdd(state.currentBalanceSum,
+                                  safeMul(preBalance, record.endTime - state.lastTransferTimestamp));
+        uint fees = safeDiv(safeMul(balanceSum, record.fees),
+                            safeMul(totalSupply, record.endTime - record.startTime));
+
+        // ...and its share of each later closed period, for which its balance was constant.
+        return safeAdd(fees, safeDecMul(preBalance, cumulativeFeesPerHavven[current] -
+                                                    cumulativeFeesPerHavven[period + 1]));
+    }
+
+
+    /* ========== MUTATIVE FUNCTIONS ========== */
+
+    /* Deposit every fee the account has accrued in the closed fee periods into its
+     * nomin account. As fees may be withdrawn at any time, this always succeeds. */
+    function settleFeeEntitlement(address account)
+        internal
+        returns (bool)
+    {
+        accrue(account, balanceOf[account]);
+
+        AccrualState storage accrual = accrualStates[account];
+        uint fees = accrual.accruedFees;
+        if (fees != 0) {
+            accrual.accruedFees = 0;
+            feesOwed = safeSub(feesOwed, fees);
+            nomin.withdrawFee(account, fees);
+            FeesWithdrawn(account, account, fees);
+        }
+        return true;
+    }
+
+    /* Accrue the fees earned since the account's last transfer, then
+     * bring its balance sum in the current fee period up to date. */
+    function adjustFeeEntitlement(address account, uint preBalance)
+        internal
+    {
+        accrue(account, preBalance);
+        checkpointBalance(account, preBalance);
+    }
+
+    function accrue(address account, uint preBalance)
+        internal
+    {
+        FeeState storage state = feeStates[account];
+        AccrualState storage accrual = accrualStates[account];
+        uint current = feePeriods.length;
+
+        if (accrual.feePeriod != current) {
+            uint accrued = safeAdd(accrual.accruedFees, pendingFees(account, preBalance));
+            require(accrued < 2**128);
+            accrual.accruedFees = uint128(accrued);
+            accrual.feePeriod = uint128(current);
+
+            state.currentBalanceSum = 0;
+            state.lastTransferTimestamp = uint64(feePeriodStartTime);
+        }
+
+        uint balanceSum = safeAdd(
+            state.currentBalanceSum,
+            safeMul(preBalance, now - state.lastTransferTimestamp)
+        );
+        require(balanceSum < 2**184);
+
+        state.currentBalanceSum = uint184(balanceSum);
+        state.lastTransferTimestamp = uint64(now);
+    }
+
+
+    /* ========== MODIFIERS ========== */
+
+    /* Roll the fee period over as Havven does, and if it rolled over,
+     * share the fees not already owed out over the period just closed. */
+    function checkFeePeriodRollover()
+        internal
+    {
+        uint closedPeriodStartTime = feePeriodStartTime;
+        super.checkFeePeriodRollover();
+        if (feePeriodStartTime == closedPeriodStartTime) {
+            return;
+        }
+
+        uint fees = safeSub(lastFeesCollected, feesOwed);
+        require(fees < 2**128);
+        feePeriods.push(FeePeriodRecord(uint128(fees), uint64(closedPeriodStartTime), uint64(feePeriodStartTime)));
+        uint last = cumulativeFeesPerHavven[cumulativeFeesPerHavven.length - 1];
+        cumulativeFeesPerHavven.push(safeAdd(last, safeDecDiv(fees, totalSupply)));
+        feesOwed = safeAdd(feesOwed, fees);
+
+        // Return the share of the havven contract's own balance to the pool.
+        accrue(this, balanceOf[this]);
+        AccrualState storage accrual = accrualStates[this];
+        feesOwed = safeSub(feesOwed, accrual.accruedFees);
+        accrual.accruedFees = 0;
+    }
+}
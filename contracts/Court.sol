@@ -175,13 +175,6 @@ contract Court is Owned, SafeDecimalMath {
     mapping(address => uint) public votesFor;
     mapping(address => uint) public votesAgainst;
 
-    // The last/penultimate average balance of a user at the time they voted.
-    // If we did not save this information then we would have to
-    // disallow transfers into an account lest it cancel a vote
-    // with greater weight than that with which it originally voted,
-    // and the fee period rolled over in between.
-    mapping(address => uint) voteWeight;
-
     // The possible vote types.
     // Absention: not participating in a vote; This is the default value.
     // Yea: voting in favour of a motion.
@@ -189,10 +182,25 @@ contract Court is Owned, SafeDecimalMath {
     enum Vote {Abstention, Yea, Nay}
 
     // A given account's vote in some confiscation motion.
-    // This requires the default value of the Vote enum to correspond to an abstention.
-    mapping(address => Vote) public userVote;
-    // The vote a user last participated in.
-    mapping(address => address) public voteTarget;
+    // The fields are sized so that the whole structure occupies a single storage slot,
+    // which casting or cancelling a vote writes once.
+    // 88 bits suffice for the weight, since it can be no greater than the havven supply (< 2^87).
+    struct VoterState {
+        // This requires the default value of the Vote enum to correspond to an abstention.
+        Vote vote;
+
+        // The target of the motion the account last participated in.
+        address target;
+
+        // The last/penultimate average balance of the account at the time it voted.
+        // If we did not save this information then we would have to
+        // disallow transfers into an account lest it cancel a vote
+        // with greater weight than that with which it originally voted,
+        // and the fee period rolled over in between.
+        uint88 weight;
+    }
+
+    mapping(address => VoterState) voterStates;
 
     /* ========== CONSTRUCTOR ========== */
 
@@ -257,13 +265,28 @@ contract Court is Owned, SafeDecimalMath {
 
     /* ========== VIEW FUNCTIONS ========== */
 
+    function userVote(address account)
+        public
+        view
+        returns (Vote)
+    {
+        return voterStates[account].vote;
+    }
+
+    function voteTarget(address account)
+        public
+        view
+        returns (address)
+    {
+        return voterStates[account].target;
+    }
 
     function hasVoted(address account)
         public
         view
         returns (bool)
     {
-        return userVote[account] != Court.Vote.Abstention;
+        return voterStates[account].vote != Court.Vote.Abstention;
     }
 
     /* There is a motion in progress on the specified
@@ -330,6 +353,17 @@ contract Court is Owned, SafeDecimalMath {
     }
 
 
+    /* The motion on the target account may be closed by anyone: it has concluded,
+     * or it has lasted its full duration but did not pass. */
+    function canCloseVote(address target)
+        public
+        view
+        returns (bool)
+    {
+        return (confirming(target) && !votePasses(target)) || waiting(target);
+    }
+
+
     /* ========== MUTATIVE FUNCTIONS ========== */
 
     /* Begin a vote to confiscate the funds in a given nomin account.
@@ -393,8 +427,7 @@ contract Court is Owned, SafeDecimalMath {
         public
     {
         uint weight = voteSetup(target);
-        setVotedYea(msg.sender, target);
-        voteWeight[msg.sender] = weight;
+        setVotedYea(msg.sender, target, weight);
         votesFor[target] = safeAdd(votesFor[target], weight);
         VoteFor(msg.sender, msg.sender, target, target, weight);
     }
@@ -405,8 +438,7 @@ contract Court is Owned, SafeDecimalMath {
         public
     {
         uint weight = voteSetup(target);
-        setVotedNay(msg.sender, target);
-        voteWeight[msg.sender] = weight;
+        setVotedNay(msg.sender, target, weight);
         votesAgainst[target] = safeAdd(votesAgainst[target], weight);
         VoteAgainst(msg.sender, msg.sender, target, target, weight);
     }
@@ -422,31 +454,29 @@ contract Court is Owned, SafeDecimalMath {
         // But the totals must not change during the confirmation phase itself.
         require(!confirming(target));
 
+        VoterState storage state = voterStates[msg.sender];
+
         // If we are not voting, there is no reason to update the vote totals.
         if (voting(target)) {
-            // This call to getVote() must come before the later call to cancelVote(), obviously.
-            Vote vote = userVote[msg.sender];
-
-            if (vote == Vote.Yea) {
-                votesFor[target] = safeSub(votesFor[target], voteWeight[msg.sender]);
+            if (state.vote == Vote.Yea) {
+                votesFor[target] = safeSub(votesFor[target], state.weight);
             }
-            else if (vote == Vote.Nay) {
-                votesAgainst[target] = safeSub(votesAgainst[target], voteWeight[msg.sender]);
+            else if (state.vote == Vote.Nay) {
+                votesAgainst[target] = safeSub(votesAgainst[target], state.weight);
             } else {
                 // The sender has not voted.
                 return;
             }
 
             // A cancelled vote is only meaningful if a vote is running
-            voteWeight[msg.sender] = 0;
             CancelledVote(msg.sender, msg.sender, target, target);
         }
 
         // Disallow users from cancelling a vote for a different target
         // than the one they have previously voted for.
-        require(voteTarget[msg.sender] == target);
-        userVote[msg.sender] = Court.Vote.Abstention;
-        voteTarget[msg.sender] = 0;
+        require(state.target == target);
+        // Clearing the whole state, weight included, frees its slot in a single write.
+        delete voterStates[msg.sender];
     }
 
     /* If a vote has concluded, or if it lasted its full duration but not passed,
@@ -454,12 +484,21 @@ contract Court is Owned, SafeDecimalMath {
     function closeVote(address target)
         public
     {
-        require((confirming(target) && !votePasses(target)) || waiting(target));
+        require(canCloseVote(target));
+        clearMotion(target);
+    }
 
-        voteStartTimes[target] = 0;
-        votesFor[target] = 0;
-        votesAgainst[target] = 0;
-        VoteClosed(target, target);
+    /* Close every motion in the list which may be closed, skipping those which
+     * may not yet be closed, or which have already been. */
+    function closeVotes(address[] targets)
+        public
+    {
+        for (uint i = 0; i < targets.length; i++) {
+            address target = targets[i];
+            if (voteStartTimes[target] != 0 && canCloseVote(target)) {
+                clearMotion(target);
+            }
+        }
     }
 
     /* The foundation may only confiscate a balance during the confirmation
@@ -472,10 +511,7 @@ contract Court is Owned, SafeDecimalMath {
         require(votePasses(target));
 
         nomin.confiscateBalance(target);
-        voteStartTimes[target] = 0;
-        votesFor[target] = 0;
-        votesAgainst[target] = 0;
-        VoteClosed(target, target);
+        clearMotion(target);
         ConfiscationApproval(target, target);
     }
 
@@ -485,33 +521,48 @@ contract Court is Owned, SafeDecimalMath {
         onlyOwner
     {
         require(!waiting(target));
+        clearMotion(target);
+        Veto(target, target);
+    }
+
+    /* Reset the motion on the target account, returning it to the Waiting state. */
+    function clearMotion(address target)
+        internal
+    {
         voteStartTimes[target] = 0;
         votesFor[target] = 0;
         votesAgainst[target] = 0;
         VoteClosed(target, target);
-        Veto(target, target);
     }
 
     /* Indicate that the given account voted yea in a confiscation
-     * motion on the target account.
+     * motion on the target account, with the given weight.
      * The account must not have an active vote in any motion. */
-    function setVotedYea(address account, address target)
+    function setVotedYea(address account, address target, uint weight)
         internal
     {
-        require(userVote[account] == Court.Vote.Abstention);
-        userVote[account] = Court.Vote.Yea;
-        voteTarget[account] = target;
+        setVote(account, target, Vote.Yea, weight);
     }
 
     /* Indicate that the given account voted nay in a confiscation
-     * motion on the target account.
+     * motion on the target account, with the given weight.
      * The account must not have an active vote in any motion. */
-    function setVotedNay(address account, address target)
+    function setVotedNay(address account, address target, uint weight)
+        internal
+    {
+        setVote(account, target, Vote.Nay, weight);
+    }
+
+    /* Record an account's vote, writing all of its state into its single slot. */
+    function setVote(address account, address target, Vote vote, uint weight)
         internal
     {
-        require(userVote[account] == Court.Vote.Abstention);
-        userVote[account] = Court.Vote.Nay;
-        voteTarget[account] = target;
+        require(weight < 2**88);
+        VoterState storage state = voterStates[account];
+        require(state.vote == Court.Vote.Abstention);
+        state.vote = vote;
+        state.target = target;
+        state.weight = uint88(weight);
     }
 
     /* ========== EVENTS ========== */
@@ -187,6 +187,42 @@ contract ERC20FeeToken is Owned, SafeDecimalMath {
         return true;
     }
 
+    /* Transfer tokens from the sender to many recipients in a single transaction.
+     * Each recipient is charged the same fee as a single transfer of its value,
+     * but the sender's balance and the fee pool are each written only once. */
+    function transferBatch(address[] recipients, uint[] values)
+        public
+        returns (bool)
+    {
+        require(recipients.length == values.length);
+
+        uint total = 0;
+        uint fee = 0;
+        for (uint i = 0; i < values.length; i++) {
+            total = safeAdd(total, values[i]);
+            fee = safeAdd(fee, transferFeeIncurred(values[i]));
+        }
+
+        // Insufficient balance will be handled by the safe subtraction.
+        balanceOf[msg.sender] = safeSub(balanceOf[msg.sender], safeAdd(total, fee));
+
+        for (i = 0; i < recipients.length; i++) {
+            // Zero-value transfers must fire the transfer event...
+            Transfer(msg.sender, recipients[i], values[i]);
+            // ...but don't spend gas updating state unnecessarily.
+            if (values[i] != 0) {
+                balanceOf[recipients[i]] = safeAdd(balanceOf[recipients[i]], values[i]);
+            }
+        }
+        TransferFeePaid(msg.sender, fee);
+
+        if (fee != 0) {
+            feePool = safeAdd(feePool, fee);
+        }
+
+        return true;
+    }
+
     function approve(address _spender, uint _value)
         public
         returns (bool)
@@ -302,6 +302,25 @@ contract EtherNomin is ERC20FeeToken {
         return etherValueAllowStale(saleProceedsFiat(n));
     }
 
+    /* Return the ether cost of purchasing, and the ether proceeds of selling, each of the
+     * given quantities of nomins, with the time the price was last updated and whether it is stale.
+     * Unlike purchaseCostEther and saleProceedsEther, this does not revert if the price is stale:
+     * the quotes are computed at the stale price. buy will not accept them, and sell will
+     * only accept them while the contract is liquidating. */
+    function quotes(uint[] quantities)
+        public
+        view
+        returns (uint[] purchaseCosts, uint[] saleProceeds, uint priceUpdateTime, bool stale)
+    {
+        purchaseCosts = new uint[](quantities.length);
+        saleProceeds = new uint[](quantities.length);
+        for (uint i = 0; i < quantities.length; i++) {
+            purchaseCosts[i] = etherValueAllowStale(purchaseCostFiat(quantities[i]));
+            saleProceeds[i] = saleProceedsEtherAllowStale(quantities[i]);
+        }
+        return (purchaseCosts, saleProceeds, lastPriceUpdate, priceIsStale());
+    }
+
     /* True iff the current block timestamp is later than the time
      * the price was last updated, plus the stale period. */
     function priceIsStale()
@@ -366,6 +385,19 @@ contract EtherNomin is ERC20FeeToken {
         return super.transferFrom(_from, _to, _value);
     }
 
+    /* Override ERC20FeeToken transferBatch function in order to check
+     * whether the sender or any recipient account is frozen. */
+    function transferBatch(address[] recipients, uint[] values)
+        public
+        returns (bool)
+    {
+        require(!isFrozen[msg.sender]);
+        for (uint i = 0; i < recipients.length; i++) {
+            require(!isFrozen[recipients[i]]);
+        }
+        return super.transferBatch(recipients, values);
+    }
+
     /* Update the current ether price and update the last updated time,
      * refreshing the price staleness.
      * Also checks whether the contract's collateral levels have fallen to low,
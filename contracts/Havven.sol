@@ -95,6 +95,12 @@ operations are performed.
 Additionally, we keep track also of the penultimate and not just the last
 average balance, in order to support the voting functionality detailed in Court.sol.
 
+Accounts may also opt in to a full balance history. For such an account, each
+transfer appends a checkpoint recording the area under its balance graph since
+the history began, so that its average balance over any window since then can
+be found by binary search over the checkpoints, rather than by replaying its
+transfers.
+
 -----------------------------------------------------------------
 
 */
@@ -113,26 +119,56 @@ contract Havven is ERC20Token, Owned {
 
     /* ========== STATE VARIABLES ========== */
 
-    // Sums of balances*duration in the current fee period.
-    // range: decimals; units: havven-seconds
-    mapping(address => uint) public currentBalanceSum;
+    // Fee entitlement information for a given account.
+    // The fields are ordered and sized so that the whole structure occupies two storage slots:
+    // the first holds everything an ordinary transfer updates, while the second is only
+    // written when an account's fee period rolls over.
+    // The sizes are sufficient since no balance can exceed the total supply (< 2^87),
+    // and so no balance sum can exceed 2^151 without timestamps exceeding 64 bits.
+    struct FeeState {
+        // Sum of balance*duration in the current fee period.
+        // range: decimals; units: havven-seconds
+        uint184 currentBalanceSum;
+
+        // The time the account last made a transfer.
+        // range: naturals
+        uint64 lastTransferTimestamp;
+
+        // Whether the account has already withdrawn its fees for the last completed fee period.
+        bool hasWithdrawnLastPeriodFees;
+
+        // Average account balance in the last completed fee period. This is proportional
+        // to that account's last period fee entitlement.
+        // (i.e. currentBalanceSum for the previous period divided through by duration)
+        // range: decimals; units: havvens
+        uint128 lastAverageBalance;
+
+        // The average account balance in the period before the last completed fee period.
+        // This is used as a person's weight in a confiscation vote, so it implies that
+        // the vote duration must be no longer than the fee period in order to guarantee that 
+        // no portion of a fee period used for determining vote weights falls within the
+        // duration of a vote it contributes to.
+        uint128 penultimateAverageBalance;
+    }
+
+    mapping(address => FeeState) feeStates;
 
-    // Average account balances in the last completed fee period. This is proportional
-    // to that account's last period fee entitlement.
-    // (i.e. currentBalanceSum for the previous period divided through by duration)
-    // range: decimals; units: havvens
-    mapping(address => uint) public lastAverageBalance;
+    // The area under an account's balance graph from the time its balance history began
+    // until the given time, which is packed with it into a single storage slot.
+    // The balance held between two checkpoints is the difference of their sums over
+    // the difference of their times; after the latest checkpoint it is the current balance.
+    struct BalanceCheckpoint {
+        uint64 timestamp;
+        // range: decimals; units: havven-seconds
+        uint192 cumulativeBalanceSum;
+    }
 
-    // The average account balances in the period before the last completed fee period.
-    // This is used as a person's weight in a confiscation vote, so it implies that
-    // the vote duration must be no longer than the fee period in order to guarantee that 
-    // no portion of a fee period used for determining vote weights falls within the
-    // duration of a vote it contributes to.
-    mapping(address => uint) public penultimateAverageBalance;
+    // The checkpoints of each account which has enabled its balance history, in time order.
+    mapping(address => BalanceCheckpoint[]) balanceCheckpoints;
 
-    // The time an account last made a transfer.
-    // range: naturals
-    mapping(address => uint) public lastTransferTimestamp;
+    // The account each account has authorised to withdraw its fees on its behalf.
+    // The fees are still deposited into the account itself.
+    mapping(address => address) public feeWithdrawalDelegate;
 
     // The time the current fee period began.
     uint public feePeriodStartTime = 3;
@@ -156,8 +192,6 @@ contract Havven is ERC20Token, Owned {
     // of the last fee rollover (feePeriodStartTime).
     uint public lastFeesCollected;
 
-    mapping(address => bool) public hasWithdrawnLastPeriodFees;
-
     EtherNomin public nomin;
     HavvenEscrow public escrow;
 
@@ -171,7 +205,7 @@ contract Havven is ERC20Token, Owned {
         Owned(_owner)
         public
     {
-        lastTransferTimestamp[this] = now;
+        feeStates[this].lastTransferTimestamp = uint64(now);
         feePeriodStartTime = now;
         lastFeePeriodStartTime = now - targetFeePeriodDurationSeconds;
         penultimateFeePeriodStartTime = now - 2*targetFeePeriodDurationSeconds;
@@ -212,6 +246,118 @@ contract Havven is ERC20Token, Owned {
     }
 
 
+    /* ========== VIEW FUNCTIONS ========== */
+
+    function currentBalanceSum(address account)
+        public
+        view
+        returns (uint)
+    {
+        return feeStates[account].currentBalanceSum;
+    }
+
+    function lastAverageBalance(address account)
+        public
+        view
+        returns (uint)
+    {
+        return feeStates[account].lastAverageBalance;
+    }
+
+    function penultimateAverageBalance(address account)
+        public
+        view
+        returns (uint)
+    {
+        return feeStates[account].penultimateAverageBalance;
+    }
+
+    function lastTransferTimestamp(address account)
+        public
+        view
+        returns (uint)
+    {
+        return feeStates[account].lastTransferTimestamp;
+    }
+
+    function hasWithdrawnLastPeriodFees(address account)
+        public
+        view
+        returns (bool)
+    {
+        return feeStates[account].hasWithdrawnLastPeriodFees;
+    }
+
+    function balanceCheckpointCount(address account)
+        public
+        view
+        returns (uint)
+    {
+        return balanceCheckpoints[account].length;
+    }
+
+    function balanceCheckpoint(address account, uint index)
+        public
+        view
+        returns (uint timestamp, uint cumulativeBalanceSum)
+    {
+        BalanceCheckpoint storage checkpoint = balanceCheckpoints[account][index];
+        return (checkpoint.timestamp, checkpoint.cumulativeBalanceSum);
+    }
+
+    /* The area under the account's balance graph from the start of its
+     * balance history until the given time, found by binary search.
+     * Exceptional conditions:
+     *     The account has not enabled its balance history.
+     *     The time is before its history began, or in the future. */
+    function cumulativeBalanceSumAt(address account, uint time)
+        public
+        view
+        returns (uint)
+    {
+        BalanceCheckpoint[] storage checkpoints = balanceCheckpoints[account];
+        require(checkpoints.length != 0 &&
+                checkpoints[0].timestamp <= time &&
+                time <= now);
+
+        // Find the latest checkpoint no later than the given time.
+        uint low = 0;
+        uint high = checkpoints.length - 1;
+        while (low < high) {
+            uint mid = (low + high + 1) / 2;
+            if (checkpoints[mid].timestamp <= time) {
+                low = mid;
+            } else {
+                high = mid - 1;
+            }
+        }
+
+        BalanceCheckpoint storage checkpoint = checkpoints[low];
+        if (low == checkpoints.length - 1) {
+            return safeAdd(checkpoint.cumulativeBalanceSum,
+                           safeMul(balanceOf[account], time - checkpoint.timestamp));
+        }
+        // The balance was constant until the next checkpoint, so interpolate.
+        // The division is exact, as the sums differ by that balance times their duration.
+        BalanceCheckpoint storage next = checkpoints[low + 1];
+        return safeAdd(checkpoint.cumulativeBalanceSum,
+                       safeMul(next.cumulativeBalanceSum - checkpoint.cumulativeBalanceSum,
+                               time - checkpoint.timestamp) / (next.timestamp - checkpoint.timestamp));
+    }
+
+    /* The account's average balance between two times within its balance history. */
+    function averageBalanceBetween(address account, uint startTime, uint endTime)
+        public
+        view
+        returns (uint)
+    {
+        require(startTime < endTime);
+        return safeDiv(safeSub(cumulativeBalanceSumAt(account, endTime),
+                               cumulativeBalanceSumAt(account, startTime)),
+                       endTime - startTime);
+    }
+
+
     /* ========== MUTATIVE FUNCTIONS ========== */
 
     /* Allow the owner of this contract to endow any address with havvens
@@ -273,6 +419,43 @@ contract Havven is ERC20Token, Owned {
         return true;
     }
 
+    /* Transfer havvens from the sender to many recipients in a single transaction.
+     * The fee period rollover is checked, and the sender's fee entitlement
+     * recomputed, only once for the whole batch. */
+    function transferBatch(address[] recipients, uint[] values)
+        public
+        preCheckFeePeriodRollover
+        returns (bool)
+    {
+        require(recipients.length == values.length);
+
+        uint total = 0;
+        for (uint i = 0; i < values.length; i++) {
+            total = safeAdd(total, values[i]);
+        }
+
+        // Insufficient balance will be handled by the safe subtraction.
+        uint senderPreBalance = balanceOf[msg.sender];
+        balanceOf[msg.sender] = safeSub(senderPreBalance, total);
+        adjustFeeEntitlement(msg.sender, senderPreBalance);
+
+        for (i = 0; i < recipients.length; i++) {
+            address to = recipients[i];
+            uint value = values[i];
+            uint recipientPreBalance = balanceOf[to];
+
+            // Zero-value transfers must fire the transfer event, and still
+            // update fee entitlement information.
+            Transfer(msg.sender, to, value);
+            if (value != 0) {
+                balanceOf[to] = safeAdd(recipientPreBalance, value);
+            }
+            adjustFeeEntitlement(to, recipientPreBalance);
+        }
+
+        return true;
+    }
+
     /* Compute the last period's fee entitlement for the message sender
      * and then deposit it into their nomin account. */
     function withdrawFeeEntitlement()
@@ -282,21 +465,63 @@ contract Havven is ERC20Token, Owned {
         // Do not deposit fees into frozen accounts.
         require(!nomin.isFrozen(msg.sender));
 
+        // Only allow accounts to withdraw fees once per period.
+        require(settleFeeEntitlement(msg.sender));
+    }
+
+    /* Authorise an account to withdraw the sender's fees on its behalf,
+     * with withdrawFeeEntitlements; the zero address revokes the authority. */
+    function setFeeWithdrawalDelegate(address delegate)
+        public
+    {
+        feeWithdrawalDelegate[msg.sender] = delegate;
+        FeeWithdrawalDelegation(msg.sender, msg.sender, delegate);
+    }
+
+    /* Withdraw the last period's fee entitlement of each of the given accounts
+     * into their own nomin accounts, in a single transaction.
+     * Accounts which are frozen, or which have already withdrawn their fees
+     * this period, are skipped, so that one such account does not fail the batch.
+     * Exceptional conditions:
+     *     The sender is neither an account nor its delegate. */
+    function withdrawFeeEntitlements(address[] accounts)
+        public
+        preCheckFeePeriodRollover
+    {
+        for (uint i = 0; i < accounts.length; i++) {
+            address account = accounts[i];
+            require(account == msg.sender || feeWithdrawalDelegate[account] == msg.sender);
+            if (!nomin.isFrozen(account)) {
+                settleFeeEntitlement(account);
+            }
+        }
+    }
+
+    /* Deposit the account's fee entitlement for the last period into its nomin
+     * account. Returns false, doing nothing, if it was already withdrawn. */
+    function settleFeeEntitlement(address account)
+        internal
+        returns (bool)
+    {
+        FeeState storage state = feeStates[account];
+
         // check the period has rolled over first
-        rolloverFee(msg.sender, lastTransferTimestamp[msg.sender], balanceOf[msg.sender]);
+        rolloverFee(account, state.lastTransferTimestamp, balanceOf[account]);
 
-        // Only allow accounts to withdraw fees once per period.
-        require(!hasWithdrawnLastPeriodFees[msg.sender]);
+        if (state.hasWithdrawnLastPeriodFees) {
+            return false;
+        }
 
-        uint feesOwed = safeDecDiv(safeDecMul(lastAverageBalance[msg.sender],
+        uint feesOwed = safeDecDiv(safeDecMul(state.lastAverageBalance,
                                               lastFeesCollected),
                                    totalSupply);
 
-        hasWithdrawnLastPeriodFees[msg.sender] = true;
+        state.hasWithdrawnLastPeriodFees = true;
         if (feesOwed != 0) {
-            nomin.withdrawFee(msg.sender, feesOwed);
-            FeesWithdrawn(msg.sender, msg.sender, feesOwed);
+            nomin.withdrawFee(account, feesOwed);
+            FeesWithdrawn(account, account, feesOwed);
         }
+        return true;
     }
 
     /* Update the fee entitlement since the last transfer or entitlement
@@ -305,17 +530,45 @@ contract Havven is ERC20Token, Owned {
     function adjustFeeEntitlement(address account, uint preBalance)
         internal
     {
+        FeeState storage state = feeStates[account];
+
         // The time since the last transfer clamps at the last fee rollover time if the last transfer
         // was earlier than that.
-        rolloverFee(account, lastTransferTimestamp[account], preBalance);
+        rolloverFee(account, state.lastTransferTimestamp, preBalance);
 
-        currentBalanceSum[account] = safeAdd(
-            currentBalanceSum[account],
-            safeMul(preBalance, now - lastTransferTimestamp[account])
+        uint balanceSum = safeAdd(
+            state.currentBalanceSum,
+            safeMul(preBalance, now - state.lastTransferTimestamp)
         );
+        require(balanceSum < 2**184);
 
+        state.currentBalanceSum = uint184(balanceSum);
         // Update the last time this user's balance changed.
-        lastTransferTimestamp[account] = now;
+        state.lastTransferTimestamp = uint64(now);
+
+        checkpointBalance(account, preBalance);
+    }
+
+    /* Append a checkpoint to the account's balance history, if it has one,
+     * adding the area under its balance graph since the last checkpoint.
+     * Nothing need be recorded if the last checkpoint was made at this time,
+     * as the area since then is zero. */
+    function checkpointBalance(address account, uint preBalance)
+        internal
+    {
+        BalanceCheckpoint[] storage checkpoints = balanceCheckpoints[account];
+        uint length = checkpoints.length;
+        if (length == 0) {
+            return;
+        }
+        BalanceCheckpoint storage last = checkpoints[length - 1];
+        if (last.timestamp == now) {
+            return;
+        }
+
+        uint sum = safeAdd(last.cumulativeBalanceSum, safeMul(preBalance, now - last.timestamp));
+        require(sum < 2**192);
+        checkpoints.push(BalanceCheckpoint(uint64(now), uint192(sum)));
     }
 
     /* Update the given account's previous period fee entitlement value.
@@ -345,41 +598,50 @@ contract Havven is ERC20Token, Owned {
         internal
     {
         if (lastTransferTime < feePeriodStartTime) {
+            FeeState storage state = feeStates[account];
+            uint lastAverage;
+            uint penultimateAverage;
+
             if (lastTransferTime < lastFeePeriodStartTime) {
                 // The last transfer predated the previous two fee periods.
                 if (lastTransferTime < penultimateFeePeriodStartTime) {
                     // The balance did nothing in the penultimate fee period, so the average balance
                     // in this period is their pre-transfer balance.
-                    penultimateAverageBalance[account] = preBalance;
+                    penultimateAverage = preBalance;
                 // The last transfer occurred within the one-before-the-last fee period.
                 } else {
                     // No overflow risk here: the failed guard implies (penultimateFeePeriodStartTime <= lastTransferTime).
-                    penultimateAverageBalance[account] = safeDiv(
-                        safeAdd(currentBalanceSum[account], safeMul(preBalance, (lastFeePeriodStartTime - lastTransferTime))),
+                    penultimateAverage = safeDiv(
+                        safeAdd(state.currentBalanceSum, safeMul(preBalance, (lastFeePeriodStartTime - lastTransferTime))),
                         (lastFeePeriodStartTime - penultimateFeePeriodStartTime)
                     );
                 }
 
                 // The balance did nothing in the last fee period, so the average balance
                 // in this period is their pre-transfer balance.
-                lastAverageBalance[account] = preBalance;
+                lastAverage = preBalance;
 
             // The last transfer occurred within the last fee period.
             } else {
                 // The previously-last average balance becomes the penultimate balance.
-                penultimateAverageBalance[account] = lastAverageBalance[account];
+                penultimateAverage = state.lastAverageBalance;
 
                 // No overflow risk here: the failed guard implies (lastFeePeriodStartTime <= lastTransferTime).
-                lastAverageBalance[account] = safeDiv(
-                    safeAdd(currentBalanceSum[account], safeMul(preBalance, (feePeriodStartTime - lastTransferTime))),
+                lastAverage = safeDiv(
+                    safeAdd(state.currentBalanceSum, safeMul(preBalance, (feePeriodStartTime - lastTransferTime))),
                     (feePeriodStartTime - lastFeePeriodStartTime)
                 );
             }
 
+            require(lastAverage < 2**128 && penultimateAverage < 2**128);
+
+            state.lastAverageBalance = uint128(lastAverage);
+            state.penultimateAverageBalance = uint128(penultimateAverage);
+
             // Roll over to the next fee period.
-            currentBalanceSum[account] = 0;
-            hasWithdrawnLastPeriodFees[account] = false;
-            lastTransferTimestamp[account] = feePeriodStartTime;
+            state.currentBalanceSum = 0;
+            state.lastTransferTimestamp = uint64(feePeriodStartTime);
+            state.hasWithdrawnLastPeriodFees = false;
         }
     }
 
@@ -392,7 +654,32 @@ contract Havven is ERC20Token, Owned {
         returns (uint)
     {
         adjustFeeEntitlement(msg.sender, balanceOf[msg.sender]);
-        return lastAverageBalance[msg.sender];
+        return feeStates[msg.sender].lastAverageBalance;
+    }
+
+    /* Bring the average balance information of each of the given accounts
+     * up to date, as recomputeLastAverageBalance does for the sender.
+     * A transfer to any of these accounts would update the same information,
+     * so this may be called by anyone, for example to refresh many
+     * holders at once just after the fee period has rolled over. */
+    function recomputeAccountLastAverageBalances(address[] accounts)
+        public
+        preCheckFeePeriodRollover
+    {
+        for (uint i = 0; i < accounts.length; i++) {
+            adjustFeeEntitlement(accounts[i], balanceOf[accounts[i]]);
+        }
+    }
+
+    /* Begin recording the balance history of the sender, from now on.
+     * Each of its subsequent transfers will cost an additional checkpoint,
+     * so only the account itself may do this. */
+    function enableBalanceHistory()
+        public
+    {
+        require(balanceCheckpoints[msg.sender].length == 0);
+        balanceCheckpoints[msg.sender].push(BalanceCheckpoint(uint64(now), 0));
+        BalanceHistoryEnabled(msg.sender);
     }
 
     function rolloverFeePeriod()
@@ -447,4 +734,8 @@ contract Havven is ERC20Token, Owned {
 
     event FeesWithdrawn(address account, address indexed accountIndex, uint fees);
 
+    event BalanceHistoryEnabled(address account);
+
+    event FeeWithdrawalDelegation(address account, address indexed accountIndex, address delegate);
+
 }
@@ -272,6 +272,44 @@ contract HavvenEscrow is Owned, SafeDecimalMath {
         totalVestedBalance = safeAdd(totalVestedBalance, quantity);
     }
 
+    /* Append a list of vesting entries to an account's schedule in a single pass.
+     * The times must be strictly increasing, and must all fall after both the present
+     * and the last entry already in the schedule.
+     * The same funding requirements apply as for appendVestingEntry(). */
+    function appendVestingEntries(address account, uint[] times, uint[] quantities)
+        onlyOwner
+        public
+    {
+        require(times.length == quantities.length);
+        uint total = pushVestingEntries(account, times, quantities, 0, times.length);
+        totalVestedBalance = safeAdd(totalVestedBalance, total);
+    }
+
+    /* Append vesting entries to the schedules of many accounts at once.
+     * The entries are given as flat lists of times and quantities;
+     * the next entryCounts[i] entries of these lists are appended to the schedule
+     * of accounts[i], subject to the same ordering rules as appendVestingEntries(). */
+    function addVestingSchedules(address[] accounts, uint[] entryCounts, uint[] times, uint[] quantities)
+        onlyOwner
+        public
+    {
+        require(accounts.length == entryCounts.length);
+        require(times.length == quantities.length);
+
+        uint total = 0;
+        uint start = 0;
+        for (uint i = 0; i < accounts.length; i++) {
+            uint end = safeAdd(start, entryCounts[i]);
+            require(end <= times.length);
+            total = safeAdd(total, pushVestingEntries(accounts[i], times, quantities, start, end));
+            start = end;
+        }
+        // Every entry must be allocated to some account.
+        require(start == times.length);
+
+        totalVestedBalance = safeAdd(totalVestedBalance, total);
+    }
+
     /* Construct a vesting schedule to release a quantity at regular intervals ending
      * at a given time. */
     function addRegularVestingSchedule(address account, uint conclusion_time, uint quantity, uint vesting_periods)
@@ -285,11 +323,56 @@ contract HavvenEscrow is Owned, SafeDecimalMath {
         uint quant_sum = safeMul(item_quantity, (vesting_periods-1));
         uint period_length = safeDiv(time_period, vesting_periods); // (zero vesting periods doesn't work.)
 
+        uint[] memory times = new uint[](vesting_periods);
+        uint[] memory quantities = new uint[](vesting_periods);
         for (uint i = 1; i < vesting_periods; i++) {
             uint item_time_period = safeMul(i, period_length);
-            appendVestingEntry(account, safeAdd(now, item_time_period), item_quantity);
+            times[i-1] = safeAdd(now, item_time_period);
+            quantities[i-1] = item_quantity;
+        }
+        times[vesting_periods-1] = conclusion_time;
+        quantities[vesting_periods-1] = safeSub(quantity, quant_sum);
+
+        uint total = pushVestingEntries(account, times, quantities, 0, vesting_periods);
+        totalVestedBalance = safeAdd(totalVestedBalance, total);
+    }
+
+    /* Append the entries between indices start (inclusive) and end (exclusive)
+     * of the given lists to an account's schedule, and return their total quantity.
+     * The account's vested balance is updated once, but the caller is responsible
+     * for adding the returned total to totalVestedBalance. */
+    function pushVestingEntries(address account, uint[] times, uint[] quantities, uint start, uint end)
+        internal
+        returns (uint)
+    {
+        // No empty schedule updates allowed.
+        require(start < end);
+
+        uint[2][] storage schedule = vestingSchedules[account];
+
+        // Each new entry must vest after the present and after the previous entry.
+        // Vested entries are zeroed out, so if the last entry has already vested,
+        // only the present time constrains the first new entry.
+        uint lastTime = now;
+        uint len = schedule.length;
+        if (len != 0 && lastTime < schedule[len - 1][0]) {
+            lastTime = schedule[len - 1][0];
+        }
+
+        uint total = 0;
+        for (uint i = start; i < end; i++) {
+            uint time = times[i];
+            uint quantity = quantities[i];
+            require(lastTime < time);
+            require(quantity != 0);
+
+            schedule.push([time, quantity]);
+            total = safeAdd(total, quantity);
+            lastTime = time;
         }
-        appendVestingEntry(account, conclusion_time, safeSub(quantity, quant_sum));
+
+        totalVestedAccountBalance[account] = safeAdd(totalVestedAccountBalance[account], total);
+        return total;
     }
 
     /* Allow a user to withdraw any tokens that have vested. */
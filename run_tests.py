@@ -1,26 +1,167 @@
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
 from unittest import TestSuite, TestLoader, TextTestRunner
 from utils.generalutils import load_test_settings, ganache_error_message
+from utils.gasprofiler import enable_gas_profiling, GasProfilingTestResult, summarise_records, save_baseline, \
+    load_baseline, find_regressions, format_table, format_regressions, DEFAULT_TOLERANCE
+from utils.rpcprofiler import RpcProfiler, enable_rpc_profiling, ProfilingTestResult, format_report
 
-raised_exception = False
-try:
-    from tests import *
-except:
-    # use boolean to hide multiple exceptions printing out from requests library
-    raised_exception = True
 
-if raised_exception:
-    raise Exception(ganache_error_message)
+def import_tests():
+    raised_exception = False
+    try:
+        import tests
+    except:
+        # use boolean to hide multiple exceptions printing out from requests library
+        raised_exception = True
 
+    if raised_exception:
+        raise Exception(ganache_error_message)
+    return tests
+
+
+def parse_args():
+    parser = ArgumentParser(description="Run the Havven test suite.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="run the test modules in this many processes, each starting its own ganache-cli chain")
+    parser.add_argument("--build-fixture", metavar="PATH",
+                        help="deploy the test contracts onto a new ganache-cli chain, and save it as a fixture")
+    parser.add_argument("--fixture", metavar="PATH",
+                        help="start from a copy of a saved fixture rather than deploying the test contracts")
+    parser.add_argument("--rpc-report", action="store_true",
+                        help="print the time spent in each JSON-RPC method, the slowest tests and redundant calls")
+    parser.add_argument("--rpc-report-json", metavar="PATH",
+                        help="write the JSON-RPC report to a file")
+    parser.add_argument("--gas-report", action="store_true",
+                        help="print the gas used by each contract function")
+    parser.add_argument("--save-gas-baseline", metavar="PATH",
+                        help="write the gas used by each contract function to a baseline file")
+    parser.add_argument("--check-gas-baseline", metavar="PATH",
+                        help="warn about contract functions whose gas usage has risen above a baseline file")
+    parser.add_argument("--gas-tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="the fractional increase in median gas allowed over the baseline")
+    parser.add_argument("--fail-on-gas-regression", action="store_true",
+                        help="exit with an error rather than a warning if gas usage has regressed")
+    return parser.parse_args()
 
-if __name__ == '__main__':
-    test_settings = load_test_settings()
+
+def run_serial(module_names, profiling, rpc_profiling):
+    tests = import_tests()
+
+    profiler = enable_gas_profiling() if profiling else None
+    rpc_profiler = enable_rpc_profiling() if rpc_profiling else None
 
     test_suite = TestSuite()
     loader = TestLoader()
-    for item in test_settings:
-        if test_settings[item]:
-            test_suite.addTests(loader.loadTestsFromModule(getattr(tests, item)))
+    for item in module_names:
+        test_suite.addTests(loader.loadTestsFromModule(getattr(tests, item)))
+
+    resultclass = None
+    if rpc_profiling:
+        resultclass = ProfilingTestResult
+    elif profiling:
+        resultclass = GasProfilingTestResult
+    runner = TextTestRunner(verbosity=2, resultclass=resultclass)
+    result = runner.run(test_suite)
+    return (result.wasSuccessful(),
+            profiler.resolved_records() if profiling else [],
+            rpc_profiler.dump() if rpc_profiling else None)
+
+
+def run_serial_from_fixture(module_names, profiling, rpc_profiling, fixture):
+    from utils.fixtures import start_fixture_chain, stop_fixture_chain, use_fixture
+
+    chain, address, directory = start_fixture_chain(fixture)
+    try:
+        os.environ["BLOCKCHAIN_ADDRESS"] = address
+        use_fixture(fixture)
+        return run_serial(module_names, profiling, rpc_profiling)
+    finally:
+        stop_fixture_chain(chain, directory)
+
+
+def run_in_parallel(module_names, workers, profiling, rpc_profiling, fixture):
+    from utils.parallelrunner import run_parallel, print_summary
+
+    start = time.time()
+    results = run_parallel(module_names, workers, profile_gas=profiling, profile_rpc=rpc_profiling,
+                           fixture=fixture)
+    successful = print_summary(results, time.time() - start)
+
+    rpc_dump = None
+    if rpc_profiling:
+        rpc_profiler = RpcProfiler()
+        for result in results:
+            # Modules lost with a worker which exited have no report.
+            if result["rpc"] is not None:
+                rpc_profiler.merge_dump(result["rpc"])
+        rpc_dump = rpc_profiler.dump()
+    return successful, [record for result in results for record in result["gas"]], rpc_dump
+
+
+def report_rpc(args, rpc_dump):
+    rpc_profiler = RpcProfiler()
+    rpc_profiler.merge_dump(rpc_dump)
+    report = rpc_profiler.report()
+    if args.rpc_report:
+        print()
+        print(format_report(report))
+    if args.rpc_report_json:
+        with open(args.rpc_report_json, 'w') as f:
+            json.dump({'report': report, 'raw': rpc_dump}, f, indent=2, sort_keys=True)
+        print(f"\nRPC report written to {args.rpc_report_json}.")
+
+
+def report_gas(args, gas_records):
+    summary = summarise_records(gas_records)
+    if args.gas_report:
+        print("\nGas usage:\n")
+        print(format_table(summary['functions']))
+    if args.save_gas_baseline:
+        save_baseline(summary, args.save_gas_baseline)
+        print(f"\nGas baseline written to {args.save_gas_baseline}.")
+    if args.check_gas_baseline:
+        regressions = find_regressions(summary, load_baseline(args.check_gas_baseline), args.gas_tolerance)
+        if regressions:
+            print("\nGas usage has increased beyond the baseline:\n")
+            print(format_regressions(regressions))
+            return not args.fail_on_gas_regression
+        print("\nNo gas regressions against the baseline.")
+    return True
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.build_fixture:
+        from utils.fixtures import build_fixture
+        print(f"Building chain fixture at {args.build_fixture}...\n")
+        build_fixture(args.build_fixture)
+        print(f"\nChain fixture written to {args.build_fixture}.")
+        sys.exit(0)
+
+    profiling = bool(args.gas_report or args.save_gas_baseline or args.check_gas_baseline)
+    rpc_profiling = bool(args.rpc_report or args.rpc_report_json)
+
+    test_settings = load_test_settings()
+    module_names = [item for item in test_settings if test_settings[item]]
 
     print("Running test suite...\n")
-    TextTestRunner(verbosity=2).run(test_suite)
+    if args.workers > 1:
+        successful, gas_records, rpc_dump = run_in_parallel(module_names, args.workers, profiling, rpc_profiling,
+                                                            args.fixture)
+    elif args.fixture:
+        successful, gas_records, rpc_dump = run_serial_from_fixture(module_names, profiling, rpc_profiling,
+                                                                    args.fixture)
+    else:
+        successful, gas_records, rpc_dump = run_serial(module_names, profiling, rpc_profiling)
     print("\nTesting complete.")
+
+    if rpc_profiling:
+        report_rpc(args, rpc_dump)
+
+    gas_ok = report_gas(args, gas_records) if profiling else True
+    if not (successful and gas_ok):
+        sys.exit(1)
@@ -3,6 +3,8 @@ import tests.test_Deploy
 import tests.test_ERC20Tokens
 import tests.test_EtherNomin
 import tests.test_FeeCollection
+import tests.test_GasUsage
+import tests.test_Harness
 import tests.test_Havven
 import tests.test_HavvenEscrow
 import tests.test_Owned
@@ -78,18 +78,18 @@ contract PublicCourt is Court {
 		view
 		returns (uint)
 	{
-		return voteWeight[account];
+		return voterStates[account].weight;
 	}
 
 	function publicSetVotedYea(address account, address target)
 		public
 	{
-		setVotedYea(account, target);
+		setVotedYea(account, target, voterStates[account].weight);
 	}
 
 	function publicSetVotedNay(address account, address target)
 		public
 	{
-		setVotedNay(account, target);
+		setVotedNay(account, target, voterStates[account].weight);
 	}
 }
\ No newline at end of file
@@ -21,7 +21,7 @@ contract PublicHavven is Havven {
         view
         returns (uint)
     {
-        return currentBalanceSum[account];
+        return currentBalanceSum(account);
     }
 
     function _lastTransferTimestamp(address account)
@@ -29,7 +29,7 @@ contract PublicHavven is Havven {
         view
         returns (uint)
     {
-        return lastTransferTimestamp[account];
+        return lastTransferTimestamp(account);
     }
 
     function _hasWithdrawnLastPeriodFees(address account)
@@ -37,7 +37,7 @@ contract PublicHavven is Havven {
         view
         returns (bool)
     {
-        return hasWithdrawnLastPeriodFees[account];
+        return hasWithdrawnLastPeriodFees(account);
     }
 
     function _lastFeePeriodStartTime()
@@ -0,0 +1,418 @@
+/* UnpackedCourt.sol: the Court contract as it was before its per-voter
+ * state was packed into a struct, kept to compare gas usage against.
+ */
+pragma solidity ^0.4.19;
+
+
+import "contracts/Owned.sol";
+import "contracts/SafeDecimalMath.sol";
+import "contracts/EtherNomin.sol";
+import "contracts/Havven.sol";
+
+
+contract UnpackedCourt is Owned, SafeDecimalMath {
+
+    /* ========== STATE VARIABLES ========== */
+
+    // The addresses of the token contracts this confiscation court interacts with.
+    Havven havven;
+    EtherNomin nomin;
+
+    // The minimum havven balance required to be considered to have standing
+    // to begin confiscation proceedings.
+    uint public minStandingBalance = 100 * UNIT;
+
+    // The voting period lasts for this duration,
+    // and if set, must fall within the given bounds.
+    uint public votingPeriod = 1 weeks;
+    uint constant minVotingPeriod = 3 days;
+    uint constant maxVotingPeriod = 4 weeks;
+
+    // Duration of the period during which the foundation may confirm
+    // or veto a vote that has concluded.
+    // If set, the confirmation duration must fall within the given bounds.
+    uint public confirmationPeriod = 1 weeks;
+    uint constant minConfirmationPeriod = 1 days;
+    uint constant maxConfirmationPeriod = 2 weeks;
+
+    // No fewer than this fraction of havvens must participate in the vote
+    // in order for a quorum to be reached.
+    // The participation fraction required may be set no lower than 10%.
+    uint public requiredParticipation = 3 * UNIT / 10;
+    uint constant minRequiredParticipation = UNIT / 10;
+
+    // At least this fraction of participating votes must be in favour of
+    // confiscation for the proposal to pass.
+    // The required majority may be no lower than 50%.
+    uint public requiredMajority = (2 * UNIT) / 3;
+    uint constant minRequiredMajority = UNIT / 2;
+
+    // The timestamp at which a vote began. This is used to determine
+    // Whether a vote is running, is in the confirmation period,
+    // or has concluded.
+    // A vote runs from its start time t until (t + votingPeriod),
+    // and then the confirmation period terminates no later than
+    // (t + votingPeriod + confirmationPeriod).
+    mapping(address => uint) public voteStartTimes;
+
+    // The tallies for and against confiscation of a given balance.
+    // These are set to zero at the start of a vote, and also on conclusion,
+    // just to keep the blockchain clean.
+    mapping(address => uint) public votesFor;
+    mapping(address => uint) public votesAgainst;
+
+    // The last/penultimate average balance of a user at the time they voted.
+    // If we did not save this information then we would have to
+    // disallow transfers into an account lest it cancel a vote
+    // with greater weight than that with which it originally voted,
+    // and the fee period rolled over in between.
+    mapping(address => uint) voteWeight;
+
+    // The possible vote types.
+    // Absention: not participating in a vote; This is the default value.
+    // Yea: voting in favour of a motion.
+    // Nay: voting against a motion.
+    enum Vote {Abstention, Yea, Nay}
+
+    // A given account's vote in some confiscation motion.
+    // This requires the default value of the Vote enum to correspond to an abstention.
+    mapping(address => Vote) public userVote;
+    // The vote a user last participated in.
+    mapping(address => address) public voteTarget;
+
+    /* ========== CONSTRUCTOR ========== */
+
+    function UnpackedCourt(Havven _havven, EtherNomin _nomin, address _owner)
+        Owned(_owner)
+        public
+    {
+        havven = _havven;
+        nomin = _nomin;
+    }
+
+
+    /* ========== SETTERS ========== */
+
+    function setMinStandingBalance(uint balance)
+        public
+        onlyOwner
+    {
+        // No requirement on the standing threshold here;
+        // the foundation can set this value such that
+        // anyone or no one can actually start a motion.
+        minStandingBalance = balance;
+    }
+
+    function setVotingPeriod(uint duration)
+        public
+        onlyOwner
+    {
+        require(minVotingPeriod <= duration &&
+                duration <= maxVotingPeriod);
+        // Require that the voting period is no longer than a single fee period,
+        // So that a single vote can span at most two fee periods.
+        require(duration <= havven.targetFeePeriodDurationSeconds());
+        votingPeriod = duration;
+    }
+
+    function setConfirmationPeriod(uint duration)
+        public
+        onlyOwner
+    {
+        require(minConfirmationPeriod <= duration &&
+                duration <= maxConfirmationPeriod);
+        confirmationPeriod = duration;
+    }
+
+    function setRequiredParticipation(uint fraction)
+        public
+        onlyOwner
+    {
+        require(minRequiredParticipation <= fraction);
+        requiredParticipation = fraction;
+    }
+
+    function setRequiredMajority(uint fraction)
+        public
+        onlyOwner
+    {
+        require(minRequiredMajority <= fraction);
+        requiredMajority = fraction;
+    }
+
+
+    /* ========== VIEW FUNCTIONS ========== */
+
+
+    function hasVoted(address account)
+        public
+        view
+        returns (bool)
+    {
+        return userVote[account] != Vote.Abstention;
+    }
+
+    /* There is a motion in progress on the specified
+     * account, and votes are being accepted in that motion. */
+    function voting(address target)
+        public
+        view
+        returns (bool)
+    {
+        // No need to check (startTime < now) as there is no way
+        // to set future start times for votes.
+        // These values are timestamps, they will not overflow
+        // as they can only ever be initialised to relatively small values.
+        return now < voteStartTimes[target] + votingPeriod;
+    }
+
+    /* A vote on the target account has concluded, but the motion
+     * has not yet been approved, vetoed, or closed. */
+    function confirming(address target)
+        public
+        view
+        returns (bool)
+    {
+        // These values are timestamps, they will not overflow
+        // as they can only ever be initialised to relatively small values.
+        uint startTime = voteStartTimes[target];
+        return startTime + votingPeriod <= now &&
+               now < startTime + votingPeriod + confirmationPeriod;
+    }
+
+    /* A vote has either not begun, or it has completely terminated. */
+    function waiting(address target)
+        public
+        view
+        returns (bool)
+    {
+        // These values are timestamps, they will not overflow
+        // as they can only ever be initialised to relatively small values.
+        return voteStartTimes[target] + votingPeriod + confirmationPeriod <= now;
+    }
+
+    /* If the vote was to terminate at this instant, it would pass.
+     * That is: there was sufficient participation and a sizeable enough majority. */
+    function votePasses(address target)
+        public
+        view
+        returns (bool)
+    {
+        uint yeas = votesFor[target];
+        uint nays = votesAgainst[target];
+        uint totalVotes = safeAdd(yeas, nays);
+
+        if (totalVotes == 0) {
+            return false;
+        }
+
+        uint participation = safeDecDiv(totalVotes, havven.totalSupply());
+        uint fractionInFavour = safeDecDiv(yeas, totalVotes);
+
+        // We require the result to be strictly greater than the requirement
+        // to enforce a majority being "50% + 1", and so on.
+        return participation > requiredParticipation &&
+               fractionInFavour > requiredMajority;
+    }
+
+
+    /* ========== MUTATIVE FUNCTIONS ========== */
+
+    /* Begin a vote to confiscate the funds in a given nomin account.
+     * Only the foundation, or accounts with sufficient havven balances
+     * may elect to start such a vote. */
+    function beginConfiscationMotion(address target)
+        public
+    {
+        // A confiscation motion must be mooted by someone with standing.
+        require((havven.balanceOf(msg.sender) >= minStandingBalance) ||
+                msg.sender == owner);
+
+        // Require that the voting period is longer than a single fee period,
+        // So that a single vote can span at most two fee periods.
+        require(votingPeriod <= havven.targetFeePeriodDurationSeconds());
+
+        // There must be no confiscation vote already running for this account.
+        require(waiting(target));
+
+        // Disallow votes on accounts that have previously been frozen.
+        require(!nomin.isFrozen(target));
+
+        voteStartTimes[target] = now;
+        votesFor[target] = 0;
+        votesAgainst[target] = 0;
+        ConfiscationVote(msg.sender, msg.sender, target, target);
+    }
+
+    /* Shared vote setup function between voteFor and voteAgainst.
+     * Returns the voter's vote weight. */
+    function voteSetup(address target)
+        internal
+        returns (uint)
+    {
+        // There must be an active vote for this target running.
+        // Vote totals must only change during the voting phase.
+        require(voting(target));
+
+        // This user can't already have voted in anything.
+        require(!hasVoted(msg.sender));
+
+        uint weight;
+        // We use a fee period guaranteed to have terminated before
+        // the start of the vote. Select the right period if
+        // a fee period rolls over in the middle of the vote.
+        if (voteStartTimes[target] < havven.feePeriodStartTime()) {
+            weight = havven.penultimateAverageBalance(msg.sender);
+        } else {
+            weight = havven.lastAverageBalance(msg.sender);
+        }
+
+        // Users must have a nonzero voting weight to vote.
+        require(weight > 0);
+
+        return weight;
+    }
+
+    /* The sender casts a vote in favour of confiscation of the
+     * target account's nomin balance. */
+    function voteFor(address target)
+        public
+    {
+        uint weight = voteSetup(target);
+        setVotedYea(msg.sender, target);
+        voteWeight[msg.sender] = weight;
+        votesFor[target] = safeAdd(votesFor[target], weight);
+        VoteFor(msg.sender, msg.sender, target, target, weight);
+    }
+
+    /* The sender casts a vote against confiscation of the
+     * target account's nomin balance. */
+    function voteAgainst(address target)
+        public
+    {
+        uint weight = voteSetup(target);
+        setVotedNay(msg.sender, target);
+        voteWeight[msg.sender] = weight;
+        votesAgainst[target] = safeAdd(votesAgainst[target], weight);
+        VoteAgainst(msg.sender, msg.sender, target, target, weight);
+    }
+
+    /* Cancel an existing vote by the sender on a motion
+     * to confiscate the target balance. */
+    function cancelVote(address target)
+        public
+    {
+        // An account may cancel its vote either before the confirmation phase
+        // when the vote is still open, or after the confirmation phase,
+        // when the vote has concluded.
+        // But the totals must not change during the confirmation phase itself.
+        require(!confirming(target));
+
+        // If we are not voting, there is no reason to update the vote totals.
+        if (voting(target)) {
+            // This call to getVote() must come before the later call to cancelVote(), obviously.
+            Vote vote = userVote[msg.sender];
+
+            if (vote == Vote.Yea) {
+                votesFor[target] = safeSub(votesFor[target], voteWeight[msg.sender]);
+            }
+            else if (vote == Vote.Nay) {
+                votesAgainst[target] = safeSub(votesAgainst[target], voteWeight[msg.sender]);
+            } else {
+                // The sender has not voted.
+                return;
+            }
+
+            // A cancelled vote is only meaningful if a vote is running
+            voteWeight[msg.sender] = 0;
+            CancelledVote(msg.sender, msg.sender, target, target);
+        }
+
+        // Disallow users from cancelling a vote for a different target
+        // than the one they have previously voted for.
+        require(voteTarget[msg.sender] == target);
+        userVote[msg.sender] = Vote.Abstention;
+        voteTarget[msg.sender] = 0;
+    }
+
+    /* If a vote has concluded, or if it lasted its full duration but not passed,
+     * then anyone may close it. */
+    function closeVote(address target)
+        public
+    {
+        require((confirming(target) && !votePasses(target)) || waiting(target));
+
+        voteStartTimes[target] = 0;
+        votesFor[target] = 0;
+        votesAgainst[target] = 0;
+        VoteClosed(target, target);
+    }
+
+    /* The foundation may only confiscate a balance during the confirmation
+     * period after a vote has passed. */
+    function approve(address target)
+        public
+        onlyOwner
+    {
+        require(confirming(target));
+        require(votePasses(target));
+
+        nomin.confiscateBalance(target);
+        voteStartTimes[target] = 0;
+        votesFor[target] = 0;
+        votesAgainst[target] = 0;
+        VoteClosed(target, target);
+        ConfiscationApproval(target, target);
+    }
+
+    /* The foundation may veto a motion at any time. */
+    function veto(address target)
+        public
+        onlyOwner
+    {
+        require(!waiting(target));
+        voteStartTimes[target] = 0;
+        votesFor[target] = 0;
+        votesAgainst[target] = 0;
+        VoteClosed(target, target);
+        Veto(target, target);
+    }
+
+    /* Indicate that the given account voted yea in a confiscation
+     * motion on the target account.
+     * The account must not have an active vote in any motion. */
+    function setVotedYea(address account, address target)
+        internal
+    {
+        require(userVote[account] == Vote.Abstention);
+        userVote[account] = Vote.Yea;
+        voteTarget[account] = target;
+    }
+
+    /* Indicate that the given account voted nay in a confiscation
+     * motion on the target account.
+     * The account must not have an active vote in any motion. */
+    function setVotedNay(address account, address target)
+        internal
+    {
+        require(userVote[account] == Vote.Abstention);
+        userVote[account] = Vote.Nay;
+        voteTarget[account] = target;
+    }
+
+    /* ========== EVENTS ========== */
+
+    event ConfiscationVote(address initator, address indexed initiatorIndex, address target, address indexed targetIndex);
+
+    event VoteFor(address account, address indexed accountIndex, address target, address indexed targetIndex, uint balance);
+
+    event VoteAgainst(address account, address indexed accountIndex, address target, address indexed targetIndex, uint balance);
+
+    event CancelledVote(address account, address indexed accountIndex, address target, address indexed targetIndex);
+
+    event VoteClosed(address target, address indexed targetIndex);
+
+    event Veto(address target, address indexed targetIndex);
+
+    event ConfiscationApproval(address target, address indexed targetIndex);
+}
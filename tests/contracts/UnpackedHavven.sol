@@ -0,0 +1,352 @@
+/* UnpackedHavven.sol: the Havven contract as it was before its per-account
+ * fee entitlement state was packed into a struct, kept to compare gas usage against.
+ */
+pragma solidity ^0.4.19;
+
+
+import "contracts/ERC20Token.sol";
+import "contracts/Owned.sol";
+import "contracts/EtherNomin.sol";
+import "contracts/Court.sol";
+import "contracts/HavvenEscrow.sol";
+
+
+contract UnpackedHavven is ERC20Token, Owned {
+
+    /* ========== STATE VARIABLES ========== */
+
+    // Sums of balances*duration in the current fee period.
+    // range: decimals; units: havven-seconds
+    mapping(address => uint) public currentBalanceSum;
+
+    // Average account balances in the last completed fee period. This is proportional
+    // to that account's last period fee entitlement.
+    // (i.e. currentBalanceSum for the previous period divided through by duration)
+    // range: decimals; units: havvens
+    mapping(address => uint) public lastAverageBalance;
+
+    // The average account balances in the period before the last completed fee period.
+    // This is used as a person's weight in a confiscation vote, so it implies that
+    // the vote duration must be no longer than the fee period in order to guarantee that 
+    // no portion of a fee period used for determining vote weights falls within the
+    // duration of a vote it contributes to.
+    mapping(address => uint) public penultimateAverageBalance;
+
+    // The time an account last made a transfer.
+    // range: naturals
+    mapping(address => uint) public lastTransferTimestamp;
+
+    // The time the current fee period began.
+    uint public feePeriodStartTime = 3;
+    // The actual start of the last fee period (seconds).
+    // This, and the penultimate fee period can be initially set to any value
+    //   0 < val < now, as everyone's individual lastTransferTime will be 0
+    //   and as such, their lastAvgBal/penultimateAvgBal will be set to that value
+    //   apart from the contract, which will have totalSupply
+    uint public lastFeePeriodStartTime = 2;
+    // The actual start of the penultimate fee period (seconds).
+    uint public penultimateFeePeriodStartTime = 1;
+
+    // Fee periods will roll over in no shorter a time than this.
+    uint public targetFeePeriodDurationSeconds = 4 weeks;
+    // And may not be set to be shorter than a day.
+    uint constant minFeePeriodDurationSeconds = 1 days;
+    // And may not be set to be longer than six months.
+    uint constant maxFeePeriodDurationSeconds = 26 weeks;
+
+    // The quantity of nomins that were in the fee pot at the time
+    // of the last fee rollover (feePeriodStartTime).
+    uint public lastFeesCollected;
+
+    mapping(address => bool) public hasWithdrawnLastPeriodFees;
+
+    EtherNomin public nomin;
+    HavvenEscrow public escrow;
+
+
+    /* ========== CONSTRUCTOR ========== */
+
+    function UnpackedHavven(address _owner)
+        ERC20Token("Havven", "HAV",
+                   1e8 * UNIT, // initial supply is one hundred million tokens
+                   this)
+        Owned(_owner)
+        public
+    {
+        lastTransferTimestamp[this] = now;
+        feePeriodStartTime = now;
+        lastFeePeriodStartTime = now - targetFeePeriodDurationSeconds;
+        penultimateFeePeriodStartTime = now - 2*targetFeePeriodDurationSeconds;
+    }
+
+    /* ========== SETTERS ========== */
+
+    function setNomin(EtherNomin _nomin) 
+        public
+        onlyOwner
+    {
+        nomin = _nomin;
+    }
+
+    function setEscrow(HavvenEscrow _escrow)
+        public
+        onlyOwner
+    {
+        escrow = _escrow;
+    }
+
+    function unsetEscrow()
+        public
+        onlyOwner
+    {
+        delete escrow;
+    }
+
+    function setTargetFeePeriodDuration(uint duration)
+        public
+        postCheckFeePeriodRollover
+        onlyOwner
+    {
+        require(minFeePeriodDurationSeconds <= duration &&
+                duration <= maxFeePeriodDurationSeconds);
+        targetFeePeriodDurationSeconds = duration;
+        FeePeriodDurationUpdated(duration);
+    }
+
+
+    /* ========== MUTATIVE FUNCTIONS ========== */
+
+    /* Allow the owner of this contract to endow any address with havvens
+     * from the initial supply. Since the entire initial supply resides
+     * in the havven contract, this disallows the foundation from withdrawing
+     * fees on undistributed balances. This function can also be used
+     * to retrieve any havvens sent to the Havven contract itself. */
+    function endow(address account, uint value)
+        public
+        onlyOwner
+        returns (bool)
+    {
+        // Use "this" in order that the havven account is the sender.
+        // That this is an explicit transfer also initialises fee entitlement information.
+        return this.transfer(account, value);
+    }
+
+    /* Override ERC20 transfer function in order to perform
+     * fee entitlement recomputation whenever balances are updated. */
+    function transfer(address _to, uint _value)
+        public
+        preCheckFeePeriodRollover
+        returns (bool)
+    {
+        uint senderPreBalance = balanceOf[msg.sender];
+        uint recipientPreBalance = balanceOf[_to];
+
+        // Perform the transfer: if there is a problem,
+        // an exception will be thrown in super.transfer().
+        super.transfer(_to, _value);
+
+        // Zero-value transfers still update fee entitlement information,
+        // and may roll over the fee period.
+        adjustFeeEntitlement(msg.sender, senderPreBalance);
+        adjustFeeEntitlement(_to, recipientPreBalance);
+
+        return true;
+    }
+
+    /* Override ERC20 transferFrom function in order to perform
+     * fee entitlement recomputation whenever balances are updated. */
+    function transferFrom(address _from, address _to, uint _value)
+        public
+        preCheckFeePeriodRollover
+        returns (bool)
+    {
+        uint senderPreBalance = balanceOf[_from];
+        uint recipientPreBalance = balanceOf[_to];
+
+        // Perform the transfer: if there is a problem,
+        // an exception will be thrown in super.transferFrom().
+        super.transferFrom(_from, _to, _value);
+
+        // Zero-value transfers still update fee entitlement information,
+        // and may roll over the fee period.
+        adjustFeeEntitlement(_from, senderPreBalance);
+        adjustFeeEntitlement(_to, recipientPreBalance);
+
+        return true;
+    }
+
+    /* Compute the last period's fee entitlement for the message sender
+     * and then deposit it into their nomin account. */
+    function withdrawFeeEntitlement()
+        public
+        preCheckFeePeriodRollover
+    {
+        // Do not deposit fees into frozen accounts.
+        require(!nomin.isFrozen(msg.sender));
+
+        // check the period has rolled over first
+        rolloverFee(msg.sender, lastTransferTimestamp[msg.sender], balanceOf[msg.sender]);
+
+        // Only allow accounts to withdraw fees once per period.
+        require(!hasWithdrawnLastPeriodFees[msg.sender]);
+
+        uint feesOwed = safeDecDiv(safeDecMul(lastAverageBalance[msg.sender],
+                                              lastFeesCollected),
+                                   totalSupply);
+
+        hasWithdrawnLastPeriodFees[msg.sender] = true;
+        if (feesOwed != 0) {
+            nomin.withdrawFee(msg.sender, feesOwed);
+            FeesWithdrawn(msg.sender, msg.sender, feesOwed);
+        }
+    }
+
+    /* Update the fee entitlement since the last transfer or entitlement
+     * adjustment. Since this updates the last transfer timestamp, if invoked
+     * consecutively, this function will do nothing after the first call. */
+    function adjustFeeEntitlement(address account, uint preBalance)
+        internal
+    {
+        // The time since the last transfer clamps at the last fee rollover time if the last transfer
+        // was earlier than that.
+        rolloverFee(account, lastTransferTimestamp[account], preBalance);
+
+        currentBalanceSum[account] = safeAdd(
+            currentBalanceSum[account],
+            safeMul(preBalance, now - lastTransferTimestamp[account])
+        );
+
+        // Update the last time this user's balance changed.
+        lastTransferTimestamp[account] = now;
+    }
+
+    /* Update the given account's previous period fee entitlement value.
+     * Do nothing if the last transfer occurred since the fee period rolled over.
+     * If the entitlement was updated, also update the last transfer time to be
+     * at the timestamp of the rollover, so if this should do nothing if called more
+     * than once during a given period.
+     *
+     * Consider the case where the entitlement is updated. If the last transfer
+     * occurred at time t in the last period, then the starred region is added to the
+     * entitlement, the last transfer timestamp is moved to r, and the fee period is
+     * rolled over from k-1 to k so that the new fee period start time is at time r.
+     * 
+     *   k-1       |        k
+     *         s __|
+     *  _  _ ___|**|
+     *          |**|
+     *  _  _ ___|**|___ __ _  _
+     *             |
+     *          t  |
+     *             r
+     * 
+     * Similar computations are performed according to the fee period in which the
+     * last transfer occurred.
+     */
+    function rolloverFee(address account, uint lastTransferTime, uint preBalance)
+        internal
+    {
+        if (lastTransferTime < feePeriodStartTime) {
+            if (lastTransferTime < lastFeePeriodStartTime) {
+                // The last transfer predated the previous two fee periods.
+                if (lastTransferTime < penultimateFeePeriodStartTime) {
+                    // The balance did nothing in the penultimate fee period, so the average balance
+                    // in this period is their pre-transfer balance.
+                    penultimateAverageBalance[account] = preBalance;
+                // The last transfer occurred within the one-before-the-last fee period.
+                } else {
+                    // No overflow risk here: the failed guard implies (penultimateFeePeriodStartTime <= lastTransferTime).
+                    penultimateAverageBalance[account] = safeDiv(
+                        safeAdd(currentBalanceSum[account], safeMul(preBalance, (lastFeePeriodStartTime - lastTransferTime))),
+                        (lastFeePeriodStartTime - penultimateFeePeriodStartTime)
+                    );
+                }
+
+                // The balance did nothing in the last fee period, so the average balance
+                // in this period is their pre-transfer balance.
+                lastAverageBalance[account] = preBalance;
+
+            // The last transfer occurred within the last fee period.
+            } else {
+                // The previously-last average balance becomes the penultimate balance.
+                penultimateAverageBalance[account] = lastAverageBalance[account];
+
+                // No overflow risk here: the failed guard implies (lastFeePeriodStartTime <= lastTransferTime).
+                lastAverageBalance[account] = safeDiv(
+                    safeAdd(currentBalanceSum[account], safeMul(preBalance, (feePeriodStartTime - lastTransferTime))),
+                    (feePeriodStartTime - lastFeePeriodStartTime)
+                );
+            }
+
+            // Roll over to the next fee period.
+            currentBalanceSum[account] = 0;
+            hasWithdrawnLastPeriodFees[account] = false;
+            lastTransferTimestamp[account] = feePeriodStartTime;
+        }
+    }
+
+    /* Recompute and return the sender's average balance information.
+     * This also rolls over the fee period if necessary, and brings
+     * the account's current balance sum up to date. */
+    function recomputeLastAverageBalance()
+        public
+        preCheckFeePeriodRollover
+        returns (uint)
+    {
+        adjustFeeEntitlement(msg.sender, balanceOf[msg.sender]);
+        return lastAverageBalance[msg.sender];
+    }
+
+    function rolloverFeePeriod()
+        public
+    {
+        checkFeePeriodRollover();
+    }
+
+    /* ========== MODIFIERS ========== */
+
+    /* If the fee period has rolled over, then
+     * save the start times of the last fee period,
+     * as well as the penultimate fee period.
+     */
+    function checkFeePeriodRollover()
+        internal
+    {
+        // If the fee period has rolled over...
+        if (feePeriodStartTime + targetFeePeriodDurationSeconds <= now) {
+            // Reclaim any fees from the escrow contract, if it exists.
+            if (escrow != HavvenEscrow(0)) {
+                escrow.remitFees();
+            }
+            lastFeesCollected = nomin.feePool();
+
+            // Shift the three period start times back one place
+            penultimateFeePeriodStartTime = lastFeePeriodStartTime;
+            lastFeePeriodStartTime = feePeriodStartTime;
+            feePeriodStartTime = now;
+            
+            FeePeriodRollover(now);
+        }
+    }
+
+    modifier postCheckFeePeriodRollover
+    {
+        _;
+        checkFeePeriodRollover();
+    }
+
+    modifier preCheckFeePeriodRollover
+    {
+        checkFeePeriodRollover();
+        _;
+    }
+    
+    /* ========== EVENTS ========== */
+
+    event FeePeriodRollover(uint timestamp);
+
+    event FeePeriodDurationUpdated(uint duration);
+
+    event FeesWithdrawn(address account, address indexed accountIndex, uint fees);
+
+}
@@ -3,9 +3,14 @@ import unittest
 from utils.deployutils import attempt, compile_contracts, attempt_deploy, W3, mine_txs, mine_tx, UNIT, MASTER, fast_forward, force_mine_block, DUMMY, take_snapshot, restore_snapshot, fresh_account, fresh_accounts
 from utils.testutils import assertReverts
 from utils.testutils import generate_topic_event_map, get_event_data_from_log
+from utils.fixtures import fixture_deployment
+from tools.court_index import CourtIndex
+from tools.court_keeper import CourtKeeper, closable_targets
+from tools.court_simulator import CourtModel
 
 SOLIDITY_SOURCES =  ["tests/contracts/PublicCourt.sol", "contracts/EtherNomin.sol", "tests/contracts/PublicHavven.sol"]
 
+@fixture_deployment("test_Court")
 def deploy_public_court():
 	print("Deployment Initiated. \n")
 
@@ -88,6 +93,7 @@ class TestCourt(unittest.TestCase):
 		cls.confirming = lambda self, target: self.court.functions.confirming(target).call()
 		cls.waiting = lambda self, target: self.court.functions.waiting(target).call()
 		cls.votePasses = lambda self, target: self.court.functions.votePasses(target).call()
+		cls.canCloseVote = lambda self, target: self.court.functions.canCloseVote(target).call()
 
 		# Mutators
 		cls.beginConfiscationMotion = lambda self, sender, target: mine_tx(self.court.functions.beginConfiscationMotion(target).transact({'from' : sender}))
@@ -95,6 +101,7 @@ class TestCourt(unittest.TestCase):
 		cls.voteAgainst = lambda self, sender, target: mine_tx(self.court.functions.voteAgainst(target).transact({'from' : sender}))
 		cls.cancelVote = lambda self, sender, target: mine_tx(self.court.functions.cancelVote(target).transact({'from' : sender}))
 		cls.closeVote = lambda self, sender, target: mine_tx(self.court.functions.closeVote(target).transact({'from' : sender}))
+		cls.closeVotes = lambda self, sender, targets: mine_tx(self.court.functions.closeVotes(targets).transact({'from' : sender}))
 
 		# Owner only
 		cls.approve = lambda self, sender, target: mine_tx(self.court.functions.approve(target).transact({'from' : sender}))
@@ -521,6 +528,126 @@ class TestCourt(unittest.TestCase):
 		self.assertTrue(self.waiting(suspect))
 
 
+
+	def begin_stale_motions(self):
+		"""Begin motions in each state, returning the targets of: a motion which has run its course,
+		a failed motion awaiting confirmation, a passing motion awaiting confirmation, a motion still
+		being voted on, and an account with no motion."""
+		owner = self.owner()
+		voter = fresh_account()
+		expired, failed, passing, running, untouched = fresh_accounts(5)
+		voting_period = self.votingPeriod()
+		fee_period = self.havvenTargetFeePeriodDurationSeconds()
+		self.havvenEndow(owner, voter, self.havvenSupply() // 2)
+		fast_forward(fee_period + 1)
+		self.havvenCheckFeePeriodRollover(DUMMY)
+		fast_forward(fee_period + 1)
+		self.havvenCheckFeePeriodRollover(DUMMY)
+		self.havvenAdjustFeeEntitlement(voter, voter, self.havvenBalance(voter))
+
+		self.beginConfiscationMotion(owner, expired)
+		fast_forward(voting_period + self.confirmationPeriod())
+		self.beginConfiscationMotion(owner, failed)
+		self.beginConfiscationMotion(owner, passing)
+		self.voteFor(voter, passing)
+		fast_forward(voting_period)
+		self.beginConfiscationMotion(owner, running)
+		return expired, failed, passing, running, untouched
+
+	def test_closeVotes(self):
+		expired, failed, passing, running, untouched = self.begin_stale_motions()
+		targets = [expired, failed, passing, running, untouched]
+		self.assertEqual([self.canCloseVote(target) for target in targets], [True, True, False, False, True])
+
+		# Ineligible motions are skipped rather than causing a revert.
+		tx_receipt = self.closeVotes(DUMMY, targets)
+		closed = [get_event_data_from_log(self.court_event_dict, log)['args']['target'] for log in tx_receipt.logs]
+		self.assertEqual(closed, [expired, failed])
+		for target in [expired, failed]:
+			self.assertEqual(self.voteStartTimes(target), 0)
+			self.assertTrue(self.waiting(target))
+		self.assertTrue(self.confirming(passing))
+		self.assertTrue(self.votePasses(passing))
+		self.assertTrue(self.voting(running))
+
+		# Motions already closed are skipped too.
+		self.assertEqual(len(self.closeVotes(DUMMY, targets).logs), 0)
+		self.assertEqual(len(self.closeVotes(DUMMY, []).logs), 0)
+
+	def test_court_keeper(self):
+		index = CourtIndex(self.court, self.havven, W3.eth.blockNumber + 1)
+		expired, failed, passing, running, untouched = self.begin_stale_motions()
+		targets = [untouched, running, passing, failed, expired]
+		self.assertEqual(closable_targets(self.court, self.havven, targets), [failed, expired])
+		index.sync()
+		self.assertEqual(index.closable_motions(), sorted([failed, expired]))
+
+		keeper = CourtKeeper(self.court, self.havven, DUMMY, index=index)
+		self.assertEqual(sorted(keeper.step()), sorted([failed, expired]))
+		self.assertEqual(self.voteStartTimes(expired), 0)
+		self.assertEqual(self.voteStartTimes(failed), 0)
+		self.assertEqual(keeper.step(), [])
+		self.assertEqual(closable_targets(self.court, self.havven, targets), [])
+
+		# Once its confirmation period has elapsed, the passing motion may be closed too,
+		# as may the running motion, which failed.
+		fast_forward(self.confirmationPeriod())
+		keeper = CourtKeeper(self.court, self.havven, DUMMY, targets=targets, gas_budget=100000)
+		self.assertEqual(keeper.step(), [running, passing])
+		self.assertEqual(self.voteStartTimes(passing), 0)
+		self.assertEqual(self.voteStartTimes(running), 0)
+
+
+
+	def test_court_simulator(self):
+		owner = self.owner()
+		suspect = fresh_account()
+		voters = fresh_accounts(6)
+		fee_period = self.havvenTargetFeePeriodDurationSeconds()
+		# Voter i holds (i + 1) * 2.5% of the supply, 52.5% in all.
+		for i, voter in enumerate(voters):
+			self.havvenEndow(owner, voter, (i + 1) * (self.havvenSupply() // 40))
+		fast_forward(fee_period + 1)
+		self.havvenCheckFeePeriodRollover(DUMMY)
+		fast_forward(fee_period + 1)
+		self.havvenCheckFeePeriodRollover(DUMMY)
+		for voter in voters:
+			self.havvenAdjustFeeEntitlement(voter, voter, self.havvenBalance(voter))
+		self.beginConfiscationMotion(owner, suspect)
+
+		model = CourtModel.from_chain(self.court, self.havven, voters, self.voteStartTimes(suspect))
+		for voter, weight in zip(voters, model.weights):
+			self.assertAlmostEqual(weight, self.havvenLastAverageBalance(voter) / UNIT)
+
+		# 1 votes yea, -1 votes nay and 0 abstains.
+		everyone_for = [1, 1, 1, 1, 1, 1]
+		split = [0, 0, -1, -1, 1, 1]
+		too_few = [0, 0, 0, 0, 0, 1]
+		outcomes = model.outcomes([everyone_for, split, too_few])
+		for votes, outcome in zip([everyone_for, split, too_few], outcomes):
+			for voter, vote in zip(voters, votes):
+				if vote == 1:
+					self.voteFor(voter, suspect)
+				elif vote == -1:
+					self.voteAgainst(voter, suspect)
+			self.assertEqual(outcome, self.votePasses(suspect))
+			for voter, vote in zip(voters, votes):
+				if vote != 0:
+					self.cancelVote(voter, suspect)
+		self.assertEqual(list(outcomes), [True, False, False])
+
+		# Either nay voter in the split vote passes the motion by abstaining or voting yea instead.
+		self.assertEqual(model.swing_voters(split), {voters[2]: [1, 0], voters[3]: [1, 0]})
+		self.assertEqual(model.swing_voters(too_few), {})
+		self.assertEqual(model.minimum_passing_coalition(), 3)
+		self.assertEqual(model.minimum_blocking_coalition(), 2)
+
+		surface = model.surface(trials=200)
+		self.assertEqual(surface.shape, (20, 20))
+		self.assertEqual(surface[-1, -1], 1)
+		self.assertEqual(surface[0, 0], 0)
+		self.assertTrue(((surface >= 0) & (surface <= 1)).all())
+
 	def test_approve(self):
 		owner = self.owner()
 		voter, guilty = fresh_accounts(2)
@@ -594,6 +721,73 @@ class TestCourt(unittest.TestCase):
 		self.assertTrue(self.waiting(acquitted))
 
 
+	def test_court_index(self):
+		owner = self.owner()
+		accounts = fresh_accounts(8)
+		suspects = accounts[:2]
+		voters = accounts[2:]
+		voting_period = self.votingPeriod()
+		fee_period = self.havvenTargetFeePeriodDurationSeconds()
+		tokens = self.havvenSupply() // 10
+		for voter in voters:
+			self.havvenEndow(owner, voter, tokens)
+		fast_forward(fee_period + 1)
+		self.havvenCheckFeePeriodRollover(DUMMY)
+		fast_forward(fee_period + 1)
+		self.havvenCheckFeePeriodRollover(DUMMY)
+		for voter in voters:
+			self.havvenAdjustFeeEntitlement(voter, voter, self.havvenBalance(voter))
+
+		index = CourtIndex(self.court, self.havven, W3.eth.blockNumber + 1)
+
+		def check_index():
+			index.sync()
+			now = W3.eth.getBlock('latest')['timestamp']
+			for suspect in suspects:
+				motion = index.motions.get(suspect)
+				if self.waiting(suspect):
+					self.assertEqual(index.phase(suspect, now), 'waiting')
+					continue
+				self.assertEqual(index.phase(suspect, now), 'voting' if self.voting(suspect) else 'confirming')
+				self.assertEqual(motion.votes_for, self.votesFor(suspect))
+				self.assertEqual(motion.votes_against, self.votesAgainst(suspect))
+				self.assertEqual(index.voting_deadline(suspect), self.voteStartTimes(suspect) + voting_period)
+			self.assertEqual(index.passing_motions(now),
+							 sorted(s for s in suspects if not self.waiting(s) and self.votePasses(s)))
+
+		self.beginConfiscationMotion(owner, suspects[0])
+		self.beginConfiscationMotion(owner, suspects[1])
+		check_index()
+		# 40% participation, all in favour of the first motion.
+		for voter in voters[:4]:
+			self.voteFor(voter, suspects[0])
+		self.voteFor(voters[4], suspects[1])
+		self.voteAgainst(voters[5], suspects[1])
+		check_index()
+		self.assertEqual(index.passing_motions(), [suspects[0]])
+		# Cancelling one vote leaves 30% participation, which is not enough.
+		self.cancelVote(voters[0], suspects[0])
+		check_index()
+		self.assertEqual(index.passing_motions(), [])
+		self.assertNotIn(voters[0], index.voters)
+		self.voteAgainst(voters[0], suspects[0])
+		# Until it syncs, the index answers from the events it has already seen.
+		self.assertEqual(index.passing_motions(), [])
+		check_index()
+		self.assertEqual(index.passing_motions(), [suspects[0]])
+		self.assertEqual(index.voters[voters[0]][1], suspects[0])
+
+		self.veto(owner, suspects[1])
+		fast_forward(voting_period)
+		check_index()
+		self.assertEqual(index.motions[suspects[1]].outcome, 'vetoed')
+		self.assertEqual(index.open_motions(), {suspects[0]: 'confirming'})
+		self.approve(owner, suspects[0])
+		check_index()
+		self.assertEqual(index.motions[suspects[0]].outcome, 'approved')
+		self.assertEqual(index.passing_motions(), [])
+
+
 	def test_setVotedYea(self):
 		owner = self.owner()
 		voter, suspect = fresh_accounts(2)
@@ -1,16 +1,38 @@
 import unittest
 
 from utils.deployutils import W3, UNIT, MASTER, DUMMY, fresh_account, fresh_accounts
-from utils.deployutils import compile_contracts, attempt_deploy, mine_tx
-from utils.deployutils import take_snapshot, restore_snapshot
+from utils.deployutils import attempt, compile_contracts, attempt_deploy, mine_tx
+from utils.deployutils import take_snapshot, restore_snapshot, ACCOUNT_POOL
 from utils.testutils import assertReverts
 from utils.testutils import generate_topic_event_map, get_event_data_from_log
+from utils.fixtures import fixture_deployment
 
 
 ERC20Token_SOURCE = "contracts/ERC20Token.sol"
 ERC20FeeToken_SOURCE = "contracts/ERC20FeeToken.sol"
 
 
+@fixture_deployment("test_ERC20Token")
+def deploy_token():
+    compiled = attempt(compile_contracts, [[ERC20Token_SOURCE]], "Compiling contracts... ")
+    token_contract, token_txr = attempt_deploy(compiled, 'ERC20Token', MASTER,
+                                               ["Test Token", "TEST", 1000 * UNIT, MASTER])
+    return token_contract,
+
+
+@fixture_deployment("test_ERC20FeeToken")
+def deploy_fee_token():
+    """Deploy a fee token, returning it with its initial beneficiary, fee authority and owner,
+    which are leased from the pool."""
+    initial_beneficiary, fee_authority, token_owner = fresh_accounts(3)
+    compiled = attempt(compile_contracts, [[ERC20FeeToken_SOURCE]], "Compiling contracts... ")
+    token_contract, token_txr = attempt_deploy(compiled, "ERC20FeeToken", MASTER,
+                                               ["Test Fee Token", "FEE", 1000 * UNIT,
+                                                initial_beneficiary, UNIT // 20,
+                                                fee_authority, token_owner])
+    return token_contract, initial_beneficiary, fee_authority, token_owner
+
+
 def setUpModule():
     print("Testing ERC20Tokens...")
 
@@ -30,12 +52,9 @@ class TestERC20Token(unittest.TestCase):
     def setUpClass(cls):
         cls.assertReverts = assertReverts
 
-        compiled = compile_contracts([ERC20Token_SOURCE])
-        cls.erc20_abi = compiled['ERC20Token']['abi']
+        cls.erc20token, = deploy_token()
+        cls.erc20_abi = cls.erc20token.abi
         cls.erc20_event_dict = generate_topic_event_map(cls.erc20_abi)
-        cls.erc20token, cls.construction_txr = attempt_deploy(compiled, 'ERC20Token', 
-                                                              MASTER, ["Test Token", "TEST", 
-                                                              1000 * UNIT, MASTER])
 
         cls.totalSupply = lambda self: cls.erc20token.functions.totalSupply().call()
         cls.name = lambda self: cls.erc20token.functions.name().call()
@@ -169,19 +188,20 @@ class TestERC20FeeToken(unittest.TestCase):
 
     def tearDown(self):
         restore_snapshot(self.snapshot)
+
+    @classmethod
+    def tearDownClass(cls):
+        ACCOUNT_POOL.release(cls.accounts)
     
     @classmethod
     def setUpClass(cls):
         cls.assertReverts = assertReverts
-        cls.initial_beneficiary, cls.fee_authority, cls.token_owner = fresh_accounts(3)
-
-        compiled = compile_contracts([ERC20FeeToken_SOURCE])
-        cls.erc20fee_abi = compiled['ERC20FeeToken']['abi']
+        cls.erc20feetoken, cls.initial_beneficiary, cls.fee_authority, cls.token_owner = deploy_fee_token()
+        # A restored deployment's accounts were leased in the process which built the fixture.
+        cls.accounts = [cls.initial_beneficiary, cls.fee_authority, cls.token_owner]
+        ACCOUNT_POOL.claim(cls.accounts)
+        cls.erc20fee_abi = cls.erc20feetoken.abi
         cls.erc20fee_event_dict = generate_topic_event_map(cls.erc20fee_abi)
-        cls.erc20feetoken, cls.construction_txr = attempt_deploy(compiled, "ERC20FeeToken", MASTER, 
-                                                                 ["Test Fee Token", "FEE", 1000 * UNIT, 
-                                                                  cls.initial_beneficiary, UNIT // 20,
-                                                                  cls.fee_authority, cls.token_owner])
 
         cls.owner = lambda self: cls.erc20feetoken.functions.owner().call()
         cls.totalSupply = lambda self: cls.erc20feetoken.functions.totalSupply().call()
@@ -203,6 +223,7 @@ class TestERC20FeeToken(unittest.TestCase):
         cls.transfer = lambda self, sender, to, value: mine_tx(cls.erc20feetoken.functions.transfer(to, value).transact({'from': sender}))
         cls.approve = lambda self, sender, spender, value: mine_tx(cls.erc20feetoken.functions.approve(spender, value).transact({'from': sender}))
         cls.transferFrom = lambda self, sender, fromAccount, to, value: mine_tx(cls.erc20feetoken.functions.transferFrom(fromAccount, to, value).transact({'from': sender}))
+        cls.transferBatch = lambda self, sender, recipients, values: mine_tx(cls.erc20feetoken.functions.transferBatch(recipients, values).transact({'from': sender}))
 
         cls.withdrawFee = lambda self, sender, account, value: mine_tx(cls.erc20feetoken.functions.withdrawFee(account, value).transact({'from' : sender}))
         cls.donateToFeePool = lambda self, sender, value: mine_tx(cls.erc20feetoken.functions.donateToFeePool(value).transact({'from': sender}))
@@ -337,6 +358,37 @@ class TestERC20FeeToken(unittest.TestCase):
         self.assertEqual(self.totalSupply(), total_supply)
         self.assertEqual(self.feePool(), fee_pool)
 
+    def test_transferBatch(self):
+        sender = self.initial_beneficiary
+        sender_balance = self.balanceOf(sender)
+        alice, bob, carol = fresh_accounts(3)
+        values = [10 * UNIT, 3 * UNIT, 7 * UNIT, 0]
+        fee = sum(self.transferFeeIncurred(value) for value in values)
+        fee_pool = self.feePool()
+        total_supply = self.totalSupply()
+
+        # Mismatched lists and insufficient balances are disallowed.
+        self.assertReverts(self.transferBatch, sender, [alice, bob], [UNIT])
+        self.assertReverts(self.transferBatch, sender, [alice, bob], [sender_balance // 2, sender_balance // 2])
+        self.assertReverts(self.transferBatch, alice, [bob], [UNIT])
+
+        # Repeated recipients and zero values are allowed, and each is charged the fee of a single transfer.
+        tx_receipt = self.transferBatch(sender, [alice, bob, alice, carol], values)
+        events = [get_event_data_from_log(self.erc20fee_event_dict, log) for log in tx_receipt.logs]
+        self.assertEqual([event['event'] for event in events], ["Transfer"] * 4 + ["TransferFeePaid"])
+        self.assertEqual([event['args']['_value'] for event in events[:4]], values)
+        self.assertEqual(events[4]['args']['value'], fee)
+        self.assertEqual(self.balanceOf(sender), sender_balance - sum(values) - fee)
+        self.assertEqual(self.balanceOf(alice), 17 * UNIT)
+        self.assertEqual(self.balanceOf(bob), 3 * UNIT)
+        self.assertEqual(self.balanceOf(carol), 0)
+        self.assertEqual(self.feePool(), fee_pool + fee)
+        self.assertEqual(self.totalSupply(), total_supply)
+
+        # An empty batch does nothing.
+        self.transferBatch(sender, [], [])
+        self.assertEqual(self.feePool(), fee_pool + fee)
+
     def test_approve(self):
         approver = MASTER
         spender = fresh_account()
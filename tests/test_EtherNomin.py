@@ -1,16 +1,58 @@
+import json
+import threading
 import unittest
+import urllib.request
 
-from utils.deployutils import W3, UNIT, MASTER, DUMMY, ETHER
-from utils.deployutils import compile_contracts, attempt_deploy, mine_tx
+from utils.deployutils import W3, UNIT, MASTER, DUMMY, ETHER, BLOCKCHAIN_BACKEND
+from utils.deployutils import attempt, compile_contracts, attempt_deploy, mine_tx, mine_txs
 from utils.deployutils import take_snapshot, restore_snapshot, fast_forward
 from utils.testutils import assertReverts, block_time, send_value, get_eth_balance
 from utils.testutils import generate_topic_event_map, get_event_data_from_log
+from utils.fixtures import fixture_deployment
+from tools.oracle import OracleDaemon, StubPriceSource
+from tools.monitor import NominMonitor, make_server
+from tools.quote_client import QuoteClient
 
 
 ETHERNOMIN_SOURCE = "tests/contracts/PublicEtherNomin.sol"
 FAKECOURT_SOURCE = "tests/contracts/FakeCourt.sol"
 
 
+class FlakyPriceSource(StubPriceSource):
+    """Fails to read a price the given number of times before yielding its prices."""
+
+    def __init__(self, prices, failures):
+        super().__init__(prices)
+        self.failures = failures
+
+    def price(self):
+        if self.failures:
+            self.failures -= 1
+            raise ValueError("The price could not be read.")
+        return super().price()
+
+
+@fixture_deployment("test_EtherNomin")
+def deploy_public_nomin():
+    print("Deployment initiated.\n")
+
+    compiled = attempt(compile_contracts, [[ETHERNOMIN_SOURCE, FAKECOURT_SOURCE], ['""=contracts']],
+                       "Compiling contracts... ")
+
+    # The havven, oracle and beneficiary addresses, and the owner.
+    nomin_contract, nomin_txr = attempt_deploy(compiled, 'PublicEtherNomin', MASTER,
+                                               [W3.eth.accounts[1], W3.eth.accounts[2], W3.eth.accounts[3],
+                                                1000 * UNIT, W3.eth.accounts[0]])
+    court_contract, court_txr = attempt_deploy(compiled, 'FakeCourt', MASTER, [])
+
+    txs = [court_contract.functions.setNomin(nomin_contract.address).transact({'from': W3.eth.accounts[0]}),
+           nomin_contract.functions.setCourt(court_contract.address).transact({'from': W3.eth.accounts[0]})]
+    attempt(mine_txs, [txs], "Linking contracts... ")
+
+    print("\nDeployment complete.\n")
+    return nomin_contract, court_contract, nomin_txr.blockNumber
+
+
 def setUpModule():
     print("Testing EtherNomin...")
 
@@ -36,29 +78,20 @@ class TestEtherNomin(unittest.TestCase):
     def setUpClass(cls):
         cls.assertReverts = assertReverts
 
-        compiled = compile_contracts([ETHERNOMIN_SOURCE, FAKECOURT_SOURCE],
-                                     remappings=['""=contracts'])
-        cls.nomin_abi = compiled['PublicEtherNomin']['abi']
+        cls.nomin, cls.fake_court, cls.construction_block = deploy_public_nomin()
+        cls.nomin_abi = cls.nomin.abi
         cls.nomin_event_dict = generate_topic_event_map(cls.nomin_abi)
 
         cls.nomin_havven = W3.eth.accounts[1]
         cls.nomin_oracle = W3.eth.accounts[2]
         cls.nomin_beneficiary = W3.eth.accounts[3]
         cls.nomin_owner = W3.eth.accounts[0]
-
-        cls.nomin, cls.construction_txr = attempt_deploy(compiled, 'PublicEtherNomin', MASTER,
-                                                         [cls.nomin_havven, cls.nomin_oracle, cls.nomin_beneficiary,
-                                                          1000 * UNIT, cls.nomin_owner])
         cls.construction_price_time = cls.nomin.functions.lastPriceUpdate().call()
 
-        cls.fake_court, _ = attempt_deploy(compiled, 'FakeCourt', MASTER, [])
-
         cls.fake_court.setNomin = lambda sender, new_nomin: mine_tx(cls.fake_court.functions.setNomin(new_nomin).transact({'from': sender}))
         cls.fake_court.setConfirming = lambda sender, target, status: mine_tx(cls.fake_court.functions.setConfirming(target, status).transact({'from': sender}))
         cls.fake_court.setVotePasses = lambda sender, target, status: mine_tx(cls.fake_court.functions.setVotePasses(target, status).transact({'from': sender}))
         cls.fake_court.confiscateBalance = lambda sender, target: mine_tx(cls.fake_court.functions.confiscateBalance(target).transact({'from': sender}))
-        cls.fake_court.setNomin(W3.eth.accounts[0], cls.nomin.address)
-        mine_tx(cls.nomin.functions.setCourt(cls.fake_court.address).transact({'from': cls.nomin_owner}))
 
         cls.owner = lambda self: cls.nomin.functions.owner().call()
         cls.oracle = lambda self: cls.nomin.functions.oracle().call()
@@ -92,6 +125,7 @@ class TestEtherNomin(unittest.TestCase):
         cls.saleProceedsFiat = lambda self, n: cls.nomin.functions.saleProceedsFiat(n).call()
         cls.saleProceedsEther = lambda self, n: cls.nomin.functions.saleProceedsEther(n).call()
         cls.saleProceedsEtherAllowStale = lambda self, n: cls.nomin.functions.publicSaleProceedsEtherAllowStale(n).call()
+        cls.quotes = lambda self, quantities: cls.nomin.functions.quotes(quantities).call()
         cls.priceIsStale = lambda self: cls.nomin.functions.priceIsStale().call()
         cls.isLiquidating = lambda self: cls.nomin.functions.isLiquidating().call()
         cls.canSelfDestruct = lambda self: cls.nomin.functions.canSelfDestruct().call()
@@ -99,6 +133,7 @@ class TestEtherNomin(unittest.TestCase):
         cls.transferPlusFee = lambda self, value: cls.nomin.functions.transferPlusFee(value).call()
         cls.transfer = lambda self, sender, recipient, value: mine_tx(cls.nomin.functions.transfer(recipient, value).transact({'from': sender}))
         cls.transferFrom = lambda self, sender, fromAccount, to, value: mine_tx(cls.nomin.functions.transferFrom(fromAccount, to, value).transact({'from': sender}))
+        cls.transferBatch = lambda self, sender, recipients, values: mine_tx(cls.nomin.functions.transferBatch(recipients, values).transact({'from': sender}))
         cls.approve = lambda self, sender, spender, value: mine_tx(cls.nomin.functions.approve(spender, value).transact({'from': sender}))
         cls.issue = lambda self, sender, n, value: mine_tx(cls.nomin.functions.issue(n).transact({'from': sender, 'value': value}))
         cls.burn = lambda self, sender, n: mine_tx(cls.nomin.functions.burn(n).transact({'from': sender}))
@@ -137,7 +172,7 @@ class TestEtherNomin(unittest.TestCase):
         self.assertEqual(self.liquidationPeriod(), 90 * 24 * 60 * 60) # default ninety days
         self.assertEqual(self.poolFeeRate(), UNIT / 200) # default fifty basis points
         self.assertEqual(self.nominPool(), 0)
-        construct_time = block_time(self.construction_txr.blockNumber)
+        construct_time = block_time(self.construction_block)
         self.assertEqual(construct_time, self.construction_price_time)
         self.assertTrue(self.isFrozen(self.nomin.address))
 
@@ -480,6 +515,27 @@ class TestEtherNomin(unittest.TestCase):
         # We assert only almost equal because we're ignoring gas costs.
         self.assertAlmostEqual((get_eth_balance(owner) - pre_balance) / UNIT, total_proceeds / UNIT)
 
+    def test_quotes(self):
+        oracle = self.oracle()
+        quantities = [0, 1, UNIT // 3, UNIT, 49 * UNIT, 2500 * UNIT]
+
+        self.updatePrice(oracle, UNIT // 2)
+        costs, proceeds, update_time, stale = self.quotes(quantities)
+        self.assertEqual(costs, [self.purchaseCostEther(n) for n in quantities])
+        self.assertEqual(proceeds, [self.saleProceedsEther(n) for n in quantities])
+        self.assertEqual(update_time, self.lastPriceUpdate())
+        self.assertFalse(stale)
+        self.assertEqual(self.quotes([]), [[], [], update_time, False])
+
+        # Quotes are still given at a stale price, which buy and sell will refuse.
+        fast_forward(self.stalePeriod() + 1)
+        self.assertReverts(self.purchaseCostEther, UNIT)
+        costs, proceeds, update_time, stale = self.quotes(quantities)
+        self.assertEqual(costs, [self.etherValueAllowStale(self.purchaseCostFiat(n)) for n in quantities])
+        self.assertEqual(proceeds, [self.saleProceedsEtherAllowStale(n) for n in quantities])
+        self.assertEqual(update_time, self.lastPriceUpdate())
+        self.assertTrue(stale)
+
     def test_priceIsStale(self):
         oracle = self.oracle()
         owner = self.owner()
@@ -656,6 +712,34 @@ class TestEtherNomin(unittest.TestCase):
         self.assertEqual(self.balanceOf(owner), remainder + qty)
         self.assertEqual(self.balanceOf(target), 0)
 
+    def test_transferBatch(self):
+        owner = self.owner()
+        oracle = self.oracle()
+        alice, bob = W3.eth.accounts[1], W3.eth.accounts[2]
+
+        self.updatePrice(oracle, UNIT)
+        self.issue(owner, 10 * UNIT, 20 * ETHER)
+        self.buy(owner, 10 * UNIT, self.purchaseCostEther(10 * UNIT))
+        fee_pool = self.feePool()
+
+        # Should be impossible to transfer to the nomin contract itself.
+        self.assertReverts(self.transferBatch, owner, [alice, self.nomin.address], [UNIT, UNIT])
+
+        self.transferBatch(owner, [alice, bob], [2 * UNIT, 3 * UNIT])
+        remainder = 10 * UNIT - self.transferPlusFee(2 * UNIT) - self.transferPlusFee(3 * UNIT)
+        self.assertEqual(self.balanceOf(owner), remainder)
+        self.assertEqual(self.balanceOf(alice), 2 * UNIT)
+        self.assertEqual(self.balanceOf(bob), 3 * UNIT)
+        self.assertEqual(self.feePool(), fee_pool + 5 * UNIT - remainder)
+
+        # A frozen sender or any frozen recipient blocks the whole batch.
+        self.debugFreezeAccount(owner, bob)
+        self.assertReverts(self.transferBatch, owner, [alice, bob], [UNIT, UNIT])
+        self.assertReverts(self.transferBatch, bob, [alice], [UNIT])
+        self.transferBatch(owner, [alice], [UNIT])
+        self.assertEqual(self.balanceOf(alice), 3 * UNIT)
+        self.assertEqual(self.balanceOf(bob), 3 * UNIT)
+
     def test_transferFrom(self):
         owner = self.owner()
         oracle = self.oracle()
@@ -900,6 +984,156 @@ class TestEtherNomin(unittest.TestCase):
         self.assertEqual(price_update_log['event'], 'PriceUpdated')
         self.assertTrue(self.isLiquidating())
 
+    def test_oracle_daemon(self):
+        owner = self.owner()
+        oracle = self.oracle()
+        self.updatePrice(oracle, UNIT)
+        self.issue(owner, UNIT, 2 * UNIT)
+
+        prices = [UNIT, UNIT // 2, UNIT // 2 - 1]
+        daemon = OracleDaemon(self.nomin, oracle, StubPriceSource(prices), interval=0)
+        # Every update is sent before any of them is collected.
+        for _ in prices:
+            daemon.submit()
+        self.assertEqual(len(daemon.pending), len(prices))
+
+        updates = []
+        while daemon.pending:
+            updates += daemon.collect()
+
+        self.assertEqual([price for price, _, _, _ in updates], prices)
+        self.assertEqual([liquidated for _, _, _, liquidated in updates], [False, False, True])
+        self.assertEqual(self.etherPrice(), prices[-1])
+        self.assertTrue(self.isLiquidating())
+
+        report = daemon.report()
+        self.assertEqual((report['sent'], report['confirmed'], report['failed'], report['pending']), (3, 3, 0, 0))
+        self.assertEqual(report['liquidations'], [updates[-1][1].blockNumber])
+        self.assertLessEqual(report['min_staleness_margin'], self.stalePeriod())
+        self.assertEqual(daemon.last_update_time, self.lastPriceUpdate())
+
+        # An update is due as soon as the interval has passed, or the price is close to becoming stale.
+        daemon.interval = 10**6
+        self.assertFalse(daemon.update_due())
+        fast_forward(self.stalePeriod() - daemon.staleness_warning + 1)
+        self.assertTrue(daemon.update_due())
+
+    def test_oracle_daemon_failures(self):
+        oracle = self.oracle()
+        daemon = OracleDaemon(self.nomin, oracle, FlakyPriceSource([UNIT, 2 * UNIT], 1), interval=0)
+
+        # The price cannot be read, so nothing is sent, and the update is tried again at the next poll.
+        daemon.poll()
+        self.assertEqual((daemon.report()['sent'], daemon.report()['failed']), (0, 1))
+        self.assertTrue(daemon.update_due())
+        daemon.poll()
+        while daemon.pending:
+            daemon.poll()
+        self.assertEqual(self.etherPrice(), UNIT)
+
+        # Updates the contract rejects are counted, and the daemon carries on with fresh nonces.
+        daemon.oracle = DUMMY
+        daemon.poll()
+        self.assertEqual(daemon.report()['failed'], 2)
+        daemon.oracle = oracle
+        daemon.poll()
+        while daemon.pending:
+            daemon.poll()
+        self.assertEqual(self.etherPrice(), 2 * UNIT)
+        self.assertEqual((daemon.report()['sent'], daemon.report()['confirmed']), (2, 2))
+
+    @unittest.skipIf(BLOCKCHAIN_BACKEND != "http", "batched requests need an HTTP node")
+    def test_monitor(self):
+        owner = self.owner()
+        self.updatePrice(self.oracle(), UNIT)
+        self.issue(owner, UNIT, 2 * UNIT)
+
+        monitor = NominMonitor(self.nomin)
+        self.assertTrue(monitor.refresh())
+        # Nothing is read again until a new block is mined.
+        self.assertFalse(monitor.refresh())
+        self.assertEqual(monitor.refreshes, 1)
+
+        values = monitor.snapshot()['values']
+        self.assertEqual(values['collateralisationRatio'], self.collateralisationRatio() / UNIT)
+        self.assertEqual(values['priceIsStale'], 0)
+        self.assertEqual(values['isLiquidating'], 0)
+        self.assertEqual(values['nominPool'], self.nominPool() / UNIT)
+        self.assertEqual(values['totalSupply'], self.totalSupply() / UNIT)
+        self.assertEqual(values['etherBalance'], get_eth_balance(self.nomin.address) / UNIT)
+
+        # Views which revert read as None, and are left out of the metrics.
+        fast_forward(self.stalePeriod() + 1)
+        self.assertTrue(monitor.refresh())
+        values = monitor.snapshot()['values']
+        self.assertEqual(values['priceIsStale'], 1)
+        self.assertIsNone(values['collateralisationRatio'])
+        self.assertNotIn("havven_nomin_collateralisation_ratio", monitor.metrics())
+
+        server = make_server(monitor, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            base = f"http://localhost:{server.server_port}"
+            with urllib.request.urlopen(base + "/metrics") as response:
+                metrics = response.read().decode()
+            self.assertIn("havven_nomin_price_is_stale 1.0", metrics)
+            self.assertIn(f"havven_monitor_block_number {W3.eth.blockNumber}", metrics)
+            with urllib.request.urlopen(base + "/") as response:
+                self.assertEqual(json.loads(response.read().decode())['values']['priceIsStale'], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_quote_client(self):
+        owner = self.owner()
+        oracle = self.oracle()
+        self.updatePrice(oracle, UNIT)
+
+        client = QuoteClient(self.nomin, refresh_interval=0)
+        quotes = client.quote([UNIT, 2 * UNIT])
+        self.assertEqual(quotes['purchaseCosts'], [self.purchaseCostEther(UNIT), self.purchaseCostEther(2 * UNIT)])
+        self.assertEqual(quotes['saleProceeds'], [self.saleProceedsEther(UNIT), self.saleProceedsEther(2 * UNIT)])
+        self.assertEqual(quotes['priceUpdateTime'], self.lastPriceUpdate())
+        self.assertFalse(quotes['stale'])
+        self.assertFalse(quotes['saleStale'])
+        self.assertEqual(client.reads, 1)
+
+        # Cached quantities are not read again, and new ones are read together.
+        self.assertEqual(client.quote([2 * UNIT, UNIT])['purchaseCosts'],
+                         [self.purchaseCostEther(2 * UNIT), self.purchaseCostEther(UNIT)])
+        self.assertEqual(client.reads, 1)
+        quotes = client.quote([UNIT, 3 * UNIT, 4 * UNIT])
+        self.assertEqual(quotes['purchaseCosts'][1:], [self.purchaseCostEther(3 * UNIT), self.purchaseCostEther(4 * UNIT)])
+        self.assertEqual(client.reads, 2)
+
+        # A price update or a change in the pool fee rate invalidates the cache.
+        self.updatePrice(oracle, UNIT // 2)
+        quotes = client.quote([UNIT])
+        self.assertEqual(quotes['purchaseCosts'], [self.purchaseCostEther(UNIT)])
+        self.assertEqual(quotes['priceUpdateTime'], self.lastPriceUpdate())
+        self.assertEqual(client.reads, 3)
+
+        self.setPoolFeeRate(owner, self.poolFeeRate() * 2)
+        quotes = client.quote([UNIT])
+        self.assertEqual(quotes['saleProceeds'], [self.saleProceedsEther(UNIT)])
+        self.assertEqual(client.reads, 4)
+
+        # Staleness is detected from the block timestamp, without reading the quotes again.
+        fast_forward(self.stalePeriod() + 1)
+        quotes = client.quote([UNIT])
+        self.assertTrue(quotes['stale'])
+        self.assertTrue(quotes['saleStale'])
+        self.assertFalse(quotes['liquidating'])
+        self.assertEqual(client.reads, 4)
+
+        # During liquidation, sell accepts stale quotes.
+        self.forceLiquidation(owner)
+        quotes = client.quote([UNIT])
+        self.assertTrue(quotes['stale'])
+        self.assertFalse(quotes['saleStale'])
+        self.assertTrue(quotes['liquidating'])
+        self.assertEqual(client.reads, 4)
+
     def test_extendLiquidationPeriod(self):
         owner = self.owner()
 
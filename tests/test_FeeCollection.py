@@ -1,12 +1,19 @@
 import unittest
 from utils.deployutils import attempt, compile_contracts, attempt_deploy, W3, mine_txs, mine_tx, \
-    UNIT, MASTER, DUMMY, fast_forward, fresh_accounts, take_snapshot, restore_snapshot, ETHER
+    UNIT, MASTER, DUMMY, fast_forward, fresh_accounts, take_snapshot, restore_snapshot, ETHER, BLOCKCHAIN_BACKEND
 from utils.testutils import assertReverts, block_time, assertClose
+from utils.fixtures import fixture_deployment
+from tools.loadgen import LoadGenerator, OPERATIONS, find_regressions
+from tools.fee_ledger import FeeLedger
+from tools.fee_model import AccumulatorModel, random_schedule, compare
+from tools.fee_withdrawer import FeeWithdrawer, unclaimed_accounts
 
 SOLIDITY_SOURCES = ["tests/contracts/PublicHavven.sol", "tests/contracts/PublicEtherNomin.sol",
                     "tests/contracts/FakeCourt.sol", "contracts/Havven.sol"]
+ACCUMULATOR_SOURCE = "contracts/AccumulatorHavven.sol"
 
 
+@fixture_deployment("test_FeeCollection")
 def deploy_public_contracts():
     print("Deployment initiated.\n")
 
@@ -29,10 +36,25 @@ def deploy_public_contracts():
            nomin_contract.functions.setCourt(court_contract.address).transact({'from': MASTER})]
     attempt(mine_txs, [txs], "Linking contracts... ")
 
+    # Part of the saved chain state, so that a restored deployment is not moved forward a second time.
+    fast_forward(weeks=102)
+
     print("\nDeployment complete.\n")
     return havven_contract, nomin_contract, court_contract
 
 
+@fixture_deployment("test_FeeCollection_accumulator")
+def deploy_accumulator_contracts():
+    """Deploy an AccumulatorHavven and its nomin contract, returning them with the havven
+    contract's construction block."""
+    compiled = attempt(compile_contracts, [[ACCUMULATOR_SOURCE]], "Compiling contracts... ")
+    havven_contract, hvn_txr = attempt_deploy(compiled, 'AccumulatorHavven', MASTER, [MASTER])
+    nomin_contract, nom_txr = attempt_deploy(compiled, 'EtherNomin', MASTER,
+                                             [havven_contract.address, MASTER, MASTER, 1000 * UNIT, MASTER])
+    mine_tx(havven_contract.functions.setNomin(nomin_contract.address).transact({'from': MASTER}))
+    return havven_contract, nomin_contract, hvn_txr.blockNumber
+
+
 def setUpModule():
     print("Testing FeeCollection...")
 
@@ -64,7 +86,6 @@ class TestHavven(unittest.TestCase):
 
         cls.assertClose = assertClose
         cls.assertReverts = assertReverts
-        fast_forward(weeks=102)
 
         # INHERITED
         # OWNED
@@ -135,6 +156,11 @@ class TestHavven(unittest.TestCase):
         # withdrawFeeEntitlement
         cls.h_withdrawFeeEntitlement = lambda self, sender: mine_tx(
             self.havven.functions.withdrawFeeEntitlement().transact({'from': sender}))
+        cls.h_withdrawFeeEntitlements = lambda self, sender, accounts: mine_tx(
+            self.havven.functions.withdrawFeeEntitlements(accounts).transact({'from': sender}))
+        cls.h_setFeeWithdrawalDelegate = lambda self, sender, delegate: mine_tx(
+            self.havven.functions.setFeeWithdrawalDelegate(delegate).transact({'from': sender}))
+        cls.h_feeWithdrawalDelegate = lambda self, account: self.havven.functions.feeWithdrawalDelegate(account).call()
 
         #
         # MODIFIERS
@@ -525,3 +551,202 @@ class TestHavven(unittest.TestCase):
 
     def test_multi_period_0_percent_withdrawal(self):
         self.check_fees_multi_period(0, [10, 20, 30, 40], [100, 200, 200, 300, 300])
+
+    def test_fee_ledger(self):
+        holder, alice, bob = fresh_accounts(3)
+        ledger = FeeLedger(self.nomin, self.havven, from_block=W3.eth.blockNumber + 1, opening_pool=self.n_feePool())
+        self.h_endow(MASTER, holder, self.h_totalSupply() // 2)
+
+        # Fees paid on transfers and donations accrue to the current period.
+        self.give_master_nomins(100)
+        self.n_transfer(MASTER, alice, 20 * UNIT)
+        self.n_transfer(alice, bob, 5 * UNIT)
+        self.n_transfer(alice, bob, 5 * UNIT)
+        mine_tx(self.nomin.functions.donateToFeePool(UNIT).transact({'from': bob}))
+        fees = [self.n_transferPlusFee(value) - value for value in [20 * UNIT, 5 * UNIT, 5 * UNIT]]
+
+        self.assertEqual(ledger.sync(), 4)
+        self.assertEqual(ledger.sync(), 0)
+        report = ledger.report()
+        self.assertEqual(report['transfer_fees'], sum(fees))
+        self.assertEqual(report['fee_payments'], 3)
+        self.assertEqual(report['payers'], 2)
+        self.assertEqual(report['donations'], UNIT)
+        self.assertEqual(report['withdrawals'], 0)
+        self.assertEqual(ledger.fees_paid[alice], fees[1] + fees[2])
+        self.assertEqual(ledger.pool, self.n_feePool())
+
+        # Withdrawals after the rollover are counted in the new period.
+        fast_forward(self.h_targetFeePeriodDurationSeconds() + 1)
+        rollover_time = block_time(self.h_rolloverFeePeriod(DUMMY)['blockNumber'])
+        self.h_withdrawFeeEntitlement(holder)
+        ledger.sync()
+        self.assertEqual(len(ledger.periods), 2)
+        self.assertEqual(ledger.periods[0].end_time, rollover_time)
+        self.assertEqual(ledger.report(0)['donations'], UNIT)
+        report = ledger.report()
+        self.assertEqual(report['start_time'], rollover_time)
+        self.assertEqual(report['opening_pool'], ledger.report(0)['closing_pool'])
+        self.assertEqual(report['transfer_fees'], 0)
+        self.assertEqual(report['withdrawals'], self.n_balanceOf(holder))
+        self.assertEqual(report['holder_withdrawals'], self.n_balanceOf(holder))
+        self.assertEqual(report['holder_withdrawal_count'], 1)
+        self.assertEqual(ledger.fees_withdrawn[holder], self.n_balanceOf(holder))
+        self.assertEqual(ledger.pool, self.n_feePool())
+
+    def test_batched_fee_withdrawal(self):
+        alice, bob, carol, dave, operator = fresh_accounts(5)
+        holders = [alice, bob, carol, dave]
+        for holder in holders:
+            self.h_endow(MASTER, holder, self.h_totalSupply() // 10)
+        self.give_master_nomins(100)
+        self.n_transfer(MASTER, DUMMY, 50 * UNIT)
+        fast_forward(self.h_targetFeePeriodDurationSeconds() + 1)
+        self.h_rolloverFeePeriod(DUMMY)
+        self.assertGreater(self.h_lastFeesCollected(), 0)
+
+        # Nobody may withdraw the fees of an account which has not authorised them.
+        self.assertReverts(self.h_withdrawFeeEntitlements, operator, [alice])
+        for holder in [alice, bob, carol]:
+            self.h_setFeeWithdrawalDelegate(holder, operator)
+        self.assertEqual(self.h_feeWithdrawalDelegate(alice), operator)
+        self.assertReverts(self.h_withdrawFeeEntitlements, operator, [alice, dave])
+
+        # Bob has already withdrawn this period, and Carol is frozen, so both are skipped.
+        # Dave has not authorised the operator, so only he may withdraw his fees.
+        self.h_withdrawFeeEntitlement(bob)
+        bob_fees = self.n_balanceOf(bob)
+        self.n_debugFreezeAccount(MASTER, carol)
+        self.assertEqual(unclaimed_accounts(self.havven, self.nomin, holders, operator), [alice])
+        self.assertEqual(unclaimed_accounts(self.havven, self.nomin, holders, dave), [dave])
+
+        withdrawer = FeeWithdrawer(self.havven, self.nomin, operator, holders)
+        self.assertEqual(withdrawer.find(), [alice])
+        paid = withdrawer.withdraw([alice, bob, carol])
+        self.assertEqual(paid, {alice: self.n_balanceOf(alice)})
+        # The holders' balances are equal, but Alice was endowed first.
+        self.assertClose(paid[alice], bob_fees)
+        alice_fees = paid[alice]
+        self.assertTrue(self.h_hasWithdrawnLastPeriodFees(alice))
+        self.assertEqual(self.n_balanceOf(bob), bob_fees)
+        self.assertEqual(self.n_balanceOf(carol), 0)
+        self.assertFalse(self.h_hasWithdrawnLastPeriodFees(carol))
+        self.assertEqual(withdrawer.step(), {})
+
+        # Nor may anyone withdraw twice in a period in a batch.
+        self.h_withdrawFeeEntitlements(operator, [alice, alice])
+        self.assertEqual(self.n_balanceOf(alice), alice_fees)
+
+        # An account may withdraw its own fees in a batch, and once unfrozen, Carol's fees are found.
+        self.h_withdrawFeeEntitlements(dave, [dave])
+        self.assertClose(self.n_balanceOf(dave), bob_fees)
+        self.n_unfreezeAccount(MASTER, carol)
+        paid = withdrawer.step()
+        self.assertEqual(list(paid), [carol])
+        self.assertClose(paid[carol], bob_fees)
+        self.assertEqual(withdrawer.withdrawn, 2)
+        self.assertEqual(withdrawer.transactions, 2)
+
+        # Authorising another delegate stops the operator, and the withdrawer no longer finds the account.
+        self.h_setFeeWithdrawalDelegate(alice, DUMMY)
+        self.assertReverts(self.h_withdrawFeeEntitlements, operator, [alice])
+        fast_forward(self.h_targetFeePeriodDurationSeconds() + 1)
+        self.h_rolloverFeePeriod(DUMMY)
+        self.assertEqual(unclaimed_accounts(self.havven, self.nomin, holders, DUMMY), [alice])
+        self.assertEqual(withdrawer.find(), [bob, carol])
+
+    def test_accumulator_fees(self):
+        havven, nomin, construction_block = deploy_accumulator_contracts()
+        model = AccumulatorModel(block_time(construction_block), havven.functions.totalSupply().call(),
+                                 havven.functions.targetFeePeriodDurationSeconds().call())
+        self.assertReverts(lambda: mine_tx(havven.functions.setEscrow(DUMMY).transact({'from': MASTER})))
+
+        def act(call, sender):
+            return block_time(mine_tx(call.transact({'from': sender}))['blockNumber'])
+
+        def collect_fees(value):
+            fee_pool = nomin.functions.feePool().call()
+            act(nomin.functions.transfer(DUMMY, value), MASTER)
+            model.add_fees(nomin.functions.feePool().call() - fee_pool)
+
+        def withdraw(account):
+            balance = nomin.functions.balanceOf(account).call()
+            paid = model.withdraw(account, act(havven.functions.withdrawFeeEntitlement(), account))
+            self.assertEqual(nomin.functions.balanceOf(account).call() - balance, paid)
+            return paid
+
+        alice, bob, carol = fresh_accounts(3)
+        for account, value in [(alice, 20 * 10**6 * UNIT), (bob, 10 * 10**6 * UNIT), (carol, 5 * 10**6 * UNIT)]:
+            model.endow(account, value, act(havven.functions.endow(account, value), MASTER))
+
+        mine_tx(nomin.functions.updatePrice(UNIT).transact({'from': MASTER}))
+        mine_tx(nomin.functions.issue(1000 * UNIT).transact({'from': MASTER, 'value': 2000 * ETHER}))
+        cost = nomin.functions.purchaseCostEther(1000 * UNIT).call()
+        mine_tx(nomin.functions.buy(1000 * UNIT).transact({'from': MASTER, 'value': cost}))
+
+        # Bob withdraws every period, while Carol trades, and Alice does nothing.
+        periods = 4
+        for _ in range(periods):
+            collect_fees(50 * UNIT)
+            model.transfer(carol, bob, UNIT, act(havven.functions.transfer(bob, UNIT), carol))
+            fast_forward(model.target_duration + 1)
+            model.check_rollover(act(havven.functions.rolloverFeePeriod(), DUMMY))
+            self.assertGreater(withdraw(bob), 0)
+            self.assertEqual(withdraw(bob), 0)
+
+        self.assertEqual(havven.functions.feePeriodCount().call(), periods)
+        self.assertEqual(havven.functions.feesOwed().call(), model.fees_owed)
+
+        # Alice's fees from every period are still available.
+        available = havven.functions.feesAvailable(alice).call()
+        self.assertEqual(available, model.fees_available(alice))
+        self.assertEqual(withdraw(alice), available)
+        self.assertEqual(havven.functions.feesAvailable(alice).call(), 0)
+        self.assertEqual(havven.functions.feesOwed().call(), model.fees_owed)
+        self.assertEqual(nomin.functions.feePool().call(), model.pool)
+
+    def test_load_generator(self):
+        # The in-process chain is driven from a single thread.
+        concurrency = 2 if BLOCKCHAIN_BACKEND == "http" else 1
+        scenario = {"accounts": 4, "operations": 42, "concurrency": concurrency, "window": 4,
+                    "mix": {operation: 1 for operation in OPERATIONS}, "quantity": "0.01"}
+        accounts = fresh_accounts(scenario["accounts"])
+        generator = LoadGenerator(self.havven, self.nomin, MASTER, accounts, scenario, seed=1)
+        generator.prepare()
+        for account in accounts:
+            self.assertEqual(self.h_balanceOf(account), 84 * UNIT // 100)
+            self.assertEqual(self.n_balanceOf(account), 84 * UNIT // 100)
+
+        report = generator.run()
+        operations = report['operations']
+        self.assertEqual(sum(s['mined'] + s['rejected'] for s in operations.values()), scenario["operations"])
+        self.assertEqual(report['mined'], len(generator.results))
+        self.assertGreater(report['throughput'], 0)
+        for operation in ["havven_transfer", "havven_transfer_from", "nomin_transfer", "nomin_transfer_from",
+                          "nomin_buy", "nomin_sell"]:
+            if operation in operations:
+                self.assertEqual(operations[operation]['failed'] + operations[operation]['rejected'], 0)
+                self.assertGreater(operations[operation]['gas_median'], 21000)
+                self.assertLessEqual(operations[operation]['latency_p50'], operations[operation]['latency_p99'])
+        self.assertEqual(find_regressions(report, report), [])
+
+
+# The fee models alone need no chain, and so no deployment or snapshots.
+class TestFeeModels(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.assertClose = assertClose
+
+    def test_fee_models_agree(self):
+        # When every holder withdraws in every period, both schemes pay the same fees, up to rounding.
+        events, accounts, _ = random_schedule(10, 4, idle_fraction=0, seed=1)
+        for three_period, accumulator in compare(events, accounts).values():
+            self.assertClose(accumulator, three_period, precision=10)
+
+        # Idle holders are paid for only their last period by the existing scheme,
+        # but for every period by the accumulator.
+        events, accounts, idle = random_schedule(10, 4, idle_fraction=0.3, seed=1)
+        results = compare(events, accounts)
+        for account in idle:
+            three_period, accumulator = results[account]
+            self.assertGreater(accumulator, 2 * three_period)
@@ -0,0 +1,285 @@
+import unittest
+from statistics import median
+
+from utils.deployutils import attempt, compile_contracts, attempt_deploy, mine_tx, mine_txs, MASTER, UNIT, \
+    fresh_account, fresh_accounts, fast_forward, take_snapshot, restore_snapshot, RECEIPT_HOOKS
+from utils.testutils import block_time
+from utils.gasprofiler import GasProfiler, find_regressions
+from utils.fixtures import fixture_deployment
+
+SOLIDITY_SOURCES = ["contracts/Havven.sol", "contracts/EtherNomin.sol", "contracts/Court.sol",
+                    "contracts/AccumulatorHavven.sol", "tests/contracts/UnpackedHavven.sol",
+                    "tests/contracts/UnpackedCourt.sol"]
+
+
+@fixture_deployment("test_GasUsage")
+def deploy_benchmarks():
+    print("Deployment initiated.\n")
+
+    # to avoid overflowing in the negative direction (now - targetFeePeriodDuration * 2)
+    fast_forward(weeks=102)
+
+    compiled = attempt(compile_contracts, [SOLIDITY_SOURCES], "Compiling contracts... ")
+    havven_contract, txr = attempt_deploy(compiled, 'Havven', MASTER, [MASTER])
+    unpacked_havven_contract, txr = attempt_deploy(compiled, 'UnpackedHavven', MASTER, [MASTER])
+    nomin_contract, txr = attempt_deploy(compiled, 'EtherNomin', MASTER,
+                                         [havven_contract.address, MASTER, MASTER, 1000 * UNIT, MASTER])
+    court_contract, txr = attempt_deploy(compiled, 'Court', MASTER,
+                                         [havven_contract.address, nomin_contract.address, MASTER])
+    unpacked_court_contract, txr = attempt_deploy(compiled, 'UnpackedCourt', MASTER,
+                                                  [havven_contract.address, nomin_contract.address, MASTER])
+    accumulator_havven_contract, txr = attempt_deploy(compiled, 'AccumulatorHavven', MASTER, [MASTER])
+
+    txs = [contract.functions.setNomin(nomin_contract.address).transact({'from': MASTER})
+           for contract in [havven_contract, unpacked_havven_contract, accumulator_havven_contract]]
+    attempt(mine_txs, [txs], "Linking contracts... ")
+
+    print("\nDeployment complete.\n")
+    return havven_contract, unpacked_havven_contract, nomin_contract, court_contract, unpacked_court_contract, \
+        accumulator_havven_contract
+
+
+def setUpModule():
+    print("Testing gas usage...")
+
+
+def tearDownModule():
+    print()
+
+
+class TestGasUsage(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = take_snapshot()
+
+    def tearDown(self):
+        restore_snapshot(self.snapshot)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.havven, cls.unpacked_havven, cls.nomin, cls.court, cls.unpacked_court, cls.accumulator_havven = \
+            deploy_benchmarks()
+
+        cls.endow = lambda self, contract, account, value: mine_tx(
+            contract.functions.endow(account, value).transact({'from': MASTER}))
+        cls.approve = lambda self, contract, sender, spender, value: mine_tx(
+            contract.functions.approve(spender, value).transact({'from': sender}))
+        cls.transfer = lambda self, contract, sender, to, value: mine_tx(
+            contract.functions.transfer(to, value).transact({'from': sender}))
+        cls.transferFrom = lambda self, contract, sender, frm, to, value: mine_tx(
+            contract.functions.transferFrom(frm, to, value).transact({'from': sender}))
+
+    def start_new_fee_period(self):
+        # Both contracts were constructed at about the same time, and share a target fee period duration.
+        time_remaining = self.havven.functions.targetFeePeriodDurationSeconds().call() + \
+                         max(self.havven.functions.feePeriodStartTime().call(),
+                             self.unpacked_havven.functions.feePeriodStartTime().call()) - block_time()
+        fast_forward(time_remaining + 1)
+        for contract in [self.havven, self.unpacked_havven]:
+            mine_tx(contract.functions.rolloverFeePeriod().transact({'from': MASTER}))
+
+    def compare_transfers(self, make_transfer):
+        """Perform the same transfers against both contracts, returning a dict of gas used
+        by each one, keyed by the case name."""
+        alice, bob, carol = fresh_accounts(3)
+        gas = {}
+        for name, contract in [('packed', self.havven), ('unpacked', self.unpacked_havven)]:
+            self.endow(contract, alice, 100 * UNIT)
+            self.endow(contract, bob, 100 * UNIT)
+        self.start_new_fee_period()
+
+        for name, contract in [('packed', self.havven), ('unpacked', self.unpacked_havven)]:
+            gas[name] = {
+                # Both parties' fee periods roll over.
+                'rollover': make_transfer(contract, alice, bob, UNIT)['gasUsed'],
+                # Both parties are already up to date in this fee period.
+                'steady': make_transfer(contract, alice, bob, UNIT)['gasUsed'],
+                # The recipient has never held havvens.
+                'new recipient': make_transfer(contract, alice, carol, UNIT)['gasUsed']
+            }
+        return gas
+
+    def report(self, function_name, gas):
+        print()
+        for case in gas['packed']:
+            print(f"{function_name} ({case}): {gas['unpacked'][case]} -> {gas['packed'][case]}")
+
+    def test_transfer_gas(self):
+        gas = self.compare_transfers(lambda contract, sender, to, value:
+                                     self.transfer(contract, sender, to, value))
+        self.report("transfer", gas)
+        for case in gas['packed']:
+            self.assertLess(gas['packed'][case], gas['unpacked'][case], msg=case)
+
+    def test_transferFrom_gas(self):
+        spender = fresh_account()
+
+        def make_transfer(contract, sender, to, value):
+            self.approve(contract, sender, spender, value)
+            return self.transferFrom(contract, spender, sender, to, value)
+
+        gas = self.compare_transfers(make_transfer)
+        self.report("transferFrom", gas)
+        for case in gas['packed']:
+            self.assertLess(gas['packed'][case], gas['unpacked'][case], msg=case)
+
+    def test_transferBatch_gas(self):
+        nomins = 100 * UNIT
+        mine_tx(self.nomin.functions.updatePrice(1000 * UNIT).transact({'from': MASTER}))
+        mine_tx(self.nomin.functions.issue(nomins).transact({'from': MASTER, 'value': UNIT}))
+        cost = self.nomin.functions.purchaseCostEther(nomins).call()
+        mine_tx(self.nomin.functions.buy(nomins).transact({'from': MASTER, 'value': cost}))
+
+        print()
+        for n in [1, 5, 20]:
+            # Fresh recipients on both sides, so that every credit initialises a balance.
+            singles = sum(self.transfer(self.nomin, MASTER, recipient, UNIT)['gasUsed']
+                          for recipient in fresh_accounts(n))
+            batch = mine_tx(self.nomin.functions.transferBatch(fresh_accounts(n), [UNIT] * n)
+                            .transact({'from': MASTER}))['gasUsed']
+            print(f"EtherNomin transfers to {n} recipients: {singles} -> {batch}")
+            if n > 1:
+                self.assertLess(batch, singles, msg=n)
+
+    def test_withdrawFeeEntitlements_gas(self):
+        sizes = [1, 5, 20]
+        singles = {n: fresh_accounts(n) for n in sizes}
+        batches = {n: fresh_accounts(n) for n in sizes}
+        for n in sizes:
+            for account in singles[n] + batches[n]:
+                self.endow(self.havven, account, 1000 * UNIT)
+                mine_tx(self.havven.functions.setFeeWithdrawalDelegate(MASTER).transact({'from': account}))
+
+        # Put some fees in the pool, then close the period, so every holder has fees to withdraw.
+        nomins = 100 * UNIT
+        mine_tx(self.nomin.functions.updatePrice(1000 * UNIT).transact({'from': MASTER}))
+        mine_tx(self.nomin.functions.issue(nomins).transact({'from': MASTER, 'value': UNIT}))
+        cost = self.nomin.functions.purchaseCostEther(nomins).call()
+        mine_tx(self.nomin.functions.buy(nomins).transact({'from': MASTER, 'value': cost}))
+        self.transfer(self.nomin, MASTER, fresh_account(), 50 * UNIT)
+        self.start_new_fee_period()
+
+        print()
+        for n in sizes:
+            single = sum(mine_tx(self.havven.functions.withdrawFeeEntitlement()
+                                 .transact({'from': account}))['gasUsed'] for account in singles[n])
+            batch = mine_tx(self.havven.functions.withdrawFeeEntitlements(batches[n])
+                            .transact({'from': MASTER}))['gasUsed']
+            print(f"Havven fee withdrawals for {n} holders: {single} -> {batch}")
+            if n > 1:
+                self.assertLess(batch, single, msg=n)
+
+    def test_balance_history_gas(self):
+        alice = fresh_account()
+        self.endow(self.havven, alice, 1000 * UNIT)
+        plain_transfer = self.transfer(self.havven, alice, MASTER, UNIT)['gasUsed']
+        mine_tx(self.havven.functions.enableBalanceHistory().transact({'from': alice}))
+        start = block_time() + 1
+
+        print()
+        lookup_gas = {}
+        for checkpoints in [4, 16, 64]:
+            while self.havven.functions.balanceCheckpointCount(alice).call() < checkpoints:
+                checkpoint_transfer = self.transfer(self.havven, alice, MASTER, UNIT)['gasUsed']
+            # The start of the window falls between the first two checkpoints, and the end after the last.
+            lookup_gas[checkpoints] = self.havven.functions.averageBalanceBetween(
+                alice, start, block_time()).estimateGas()
+            print(f"Havven.averageBalanceBetween over {checkpoints} checkpoints: {lookup_gas[checkpoints]}")
+        print(f"Havven.transfer with balance history: {plain_transfer} -> {checkpoint_transfer}")
+
+        # Each fourfold increase in the history adds the same two steps to each binary search.
+        self.assertLess(lookup_gas[64] - lookup_gas[16], 2 * (lookup_gas[16] - lookup_gas[4]))
+
+    def test_accumulator_gas(self):
+        contracts = [('three-period', self.havven), ('accumulator', self.accumulator_havven)]
+
+        def roll_over(periods):
+            for _ in range(periods):
+                fast_forward(self.havven.functions.targetFeePeriodDurationSeconds().call() + 1)
+                for _, contract in contracts:
+                    mine_tx(contract.functions.rolloverFeePeriod().transact({'from': MASTER}))
+
+        roll_over(1)
+        accounts = {name: fresh_accounts(2) for name, _ in contracts}
+        for name, contract in contracts:
+            for account in accounts[name]:
+                self.endow(contract, account, 100 * UNIT)
+
+        gas = {name: {} for name, _ in contracts}
+        for name, contract in contracts:
+            gas[name]['steady'] = self.transfer(contract, accounts[name][0], fresh_account(), UNIT)['gasUsed']
+        # Transfers to fresh recipients, after the senders have been idle for one and for five fee periods.
+        roll_over(1)
+        for name, contract in contracts:
+            gas[name]['idle 1 period'] = self.transfer(contract, accounts[name][0], fresh_account(), UNIT)['gasUsed']
+        roll_over(4)
+        for name, contract in contracts:
+            gas[name]['idle 5 periods'] = self.transfer(contract, accounts[name][1], fresh_account(), UNIT)['gasUsed']
+            gas[name]['withdrawal'] = mine_tx(contract.functions.withdrawFeeEntitlement()
+                                              .transact({'from': accounts[name][1]}))['gasUsed']
+
+        print()
+        for case in gas['accumulator']:
+            print(f"Havven fees ({case}): {gas['three-period'][case]} -> {gas['accumulator'][case]}")
+        # Accrual costs the same however long the account was idle.
+        self.assertAlmostEqual(gas['accumulator']['idle 5 periods'], gas['accumulator']['idle 1 period'], delta=1000)
+
+    def test_vote_gas(self):
+        voters = fresh_accounts(40)
+        for voter in voters:
+            self.endow(self.havven, voter, UNIT)
+        # Voters' weights are their average balances over the last complete fee period.
+        self.start_new_fee_period()
+        self.start_new_fee_period()
+        mine_tx(self.havven.functions.recomputeAccountLastAverageBalances(voters).transact({'from': MASTER}))
+
+        gas = {}
+        for name, court in [('packed', self.court), ('unpacked', self.unpacked_court)]:
+            target = fresh_account()
+            mine_tx(court.functions.beginConfiscationMotion(target).transact({'from': MASTER}))
+            votes = [mine_tx((court.functions.voteFor if i % 2 == 0 else court.functions.voteAgainst)(target)
+                             .transact({'from': voter}))['gasUsed']
+                     for i, voter in enumerate(voters)]
+            cancels = [mine_tx(court.functions.cancelVote(target).transact({'from': voter}))['gasUsed']
+                       for voter in voters]
+            # Voting again reuses the slots the cancellations cleared.
+            revotes = [mine_tx(court.functions.voteFor(target).transact({'from': voter}))['gasUsed']
+                       for voter in voters]
+            gas[name] = {'vote': median(votes), 'cancel': median(cancels), 'revote': median(revotes)}
+            self.assertEqual(court.functions.votesFor(target).call(), len(voters) * UNIT)
+
+        self.report("Court", gas)
+        self.assertLess(gas['packed']['vote'], gas['unpacked']['vote'])
+        self.assertLess(gas['packed']['revote'], gas['unpacked']['revote'])
+        # Cancelling clears fewer slots, and so earns a smaller refund; a whole vote and
+        # cancellation still costs less.
+        self.assertLess(gas['packed']['vote'] + gas['packed']['cancel'],
+                        gas['unpacked']['vote'] + gas['unpacked']['cancel'])
+
+    def test_profiler(self):
+        alice = fresh_account()
+        profiler = GasProfiler()
+        profiler.current_test = self.id()
+        RECEIPT_HOOKS.append(profiler.record)
+        try:
+            receipts = [self.endow(self.havven, alice, UNIT),
+                        self.transfer(self.havven, alice, MASTER, UNIT // 2),
+                        self.transfer(self.havven, alice, MASTER, UNIT // 2)]
+        finally:
+            RECEIPT_HOOKS.remove(profiler.record)
+
+        summary = profiler.summary()
+        transfer_gas = sorted(receipt['gasUsed'] for receipt in receipts[1:])
+        self.assertEqual(summary['functions']['Havven.endow']['calls'], 1)
+        self.assertEqual(summary['functions']['Havven.transfer'],
+                         {'calls': 2, 'min': transfer_gas[0], 'median': sum(transfer_gas) / 2, 'max': transfer_gas[1]})
+        self.assertEqual(summary['tests'][self.id()]['Havven.endow']['max'], receipts[0]['gasUsed'])
+
+        # Only increases beyond the tolerance are regressions.
+        baseline = {'functions': {'Havven.transfer': {'median': summary['functions']['Havven.transfer']['median'] / 1.05},
+                                  'Havven.endow': {'median': summary['functions']['Havven.endow']['median'] / 1.01}}}
+        regressions = find_regressions(summary, baseline, tolerance=0.02)
+        self.assertEqual([function for function, _, _ in regressions], ['Havven.transfer'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,509 @@
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from importlib.util import find_spec
+from textwrap import dedent
+from unittest import mock
+
+from utils.deployutils import W3, ETHER, DUMMY, DEPLOYED_CONTRACTS, mine_tx, fast_forward, \
+    take_snapshot, restore_snapshot, fresh_accounts, AccountPool, ACCOUNT_POOL
+from utils.generalutils import to_seconds
+from utils.testutils import block_time, simulated_reverts, revert_simulation_middleware
+from utils.parallelrunner import run_worker, collect_results, print_summary
+from utils.fixtures import fixture_deployment, save_manifest, FIXTURE_DEPLOYMENTS, MANIFEST
+from utils.rpcutils import rpc_request, batch_request
+from utils.rpcprofiler import LatencyHistogram, MethodStats, RpcProfiler, NO_TEST
+
+# A package of small test modules for the parallel runner, which need no chain.
+RUNNER_PACKAGE = "runner_tests"
+RUNNER_MODULES = {
+    "test_passing": """
+        import unittest
+
+        class TestPassing(unittest.TestCase):
+            def test_one(self):
+                pass
+
+            def test_two(self):
+                pass
+    """,
+    "test_failing": """
+        import unittest
+
+        class TestFailing(unittest.TestCase):
+            def test_passes(self):
+                pass
+
+            def test_fails(self):
+                self.fail("failed")
+    """,
+    "test_broken": """
+        raise ImportError("broken")
+    """
+}
+
+
+def setUpModule():
+    print("Testing Harness...")
+
+
+def tearDownModule():
+    print()
+
+
+def lose_module(module_queue):
+    """A worker which takes a module and exits without reporting it, as if it had crashed."""
+    module_queue.get()
+    os._exit(3)
+
+
+class TestAccountPool(unittest.TestCase):
+    def test_concurrent_leases_do_not_overlap(self):
+        pool = AccountPool([f"account{i}" for i in range(400)])
+        threads, leases = 8, 10
+        held = [[] for _ in range(threads)]
+        start = threading.Barrier(threads)
+
+        def lease(i):
+            start.wait()
+            for _ in range(leases):
+                held[i].extend(pool.lease(5))
+
+        workers = [threading.Thread(target=lease, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        accounts = [account for accounts in held for account in accounts]
+        self.assertEqual(len(accounts), threads * leases * 5)
+        self.assertEqual(len(set(accounts)), len(accounts))
+        self.assertEqual(len(pool.free), 0)
+
+    def test_release_order(self):
+        pool = AccountPool(["a", "b", "c", "d", "e"])
+        self.assertEqual(pool.lease(2), ["a", "b"])
+        pool.release(["b"])
+        # Released accounts are only handed out again after those never leased.
+        self.assertEqual(pool.lease(3), ["c", "d", "e"])
+        self.assertEqual(pool.lease(1), ["b"])
+        # Releasing an account not on lease does nothing.
+        pool.release(["b", "b", "z"])
+        self.assertEqual(pool.free, ["b"])
+
+        with pool.leasing(1) as accounts:
+            self.assertEqual(accounts, ["b"])
+            self.assertEqual(pool.free, [])
+        self.assertEqual(pool.free, ["b"])
+        with self.assertRaises(ValueError):
+            with pool.leasing(1):
+                raise ValueError()
+        self.assertEqual(pool.free, ["b"])
+
+    def test_release_since(self):
+        pool = AccountPool(["a", "b", "c", "d"])
+        pool.lease(1)
+        checkpoint = pool.checkpoint()
+        pool.lease(2)
+        pool.release(["b"])
+        pool.release_since(checkpoint)
+        self.assertEqual(pool.free, ["d", "b", "c"])
+        self.assertEqual(pool.leased, {"a"})
+
+    def test_release_since_other_threads(self):
+        pool = AccountPool(["a", "b", "c", "d", "e"])
+        checkpoint = pool.checkpoint()
+        mine = pool.lease(1)
+        # Another thread leases after the checkpoint, and re-leases an account this one released.
+        pool.release(mine)
+        theirs = []
+        thread = threading.Thread(target=lambda: theirs.extend(pool.lease(2) + pool.lease(3)))
+        thread.start()
+        thread.join()
+        self.assertEqual(sorted(theirs), ["a", "b", "c", "d", "e"])
+        pool.release_since(checkpoint)
+        self.assertEqual(pool.leased, set(theirs))
+
+    def test_snapshot_releases_accounts(self):
+        snapshot = take_snapshot()
+        accounts = fresh_accounts(3)
+        self.assertTrue(set(accounts) <= ACCOUNT_POOL.leased)
+        restore_snapshot(snapshot)
+        self.assertFalse(set(accounts) & ACCOUNT_POOL.leased)
+        self.assertEqual(ACCOUNT_POOL.free[-3:], accounts)
+
+    def test_claim(self):
+        pool = AccountPool(["a", "b", "c", "d"])
+        pool.lease(1)
+        pool.claim(["a", "c"])
+        self.assertEqual(pool.free, ["b", "d"])
+        self.assertEqual(pool.leased, {"a", "c"})
+        errors = []
+
+        def claim():
+            try:
+                pool.claim(["b", "c"])
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=claim)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(errors), 1)
+        # A failed claim takes nothing.
+        self.assertEqual(pool.free, ["b", "d"])
+
+    def test_shards(self):
+        accounts = list(range(10))
+        shards = [AccountPool(accounts, shard, 3).free for shard in range(3)]
+        self.assertEqual(shards[1], [1, 4, 7])
+        self.assertEqual(sorted(sum(shards, [])), accounts)
+
+    def test_exhaustion(self):
+        pool = AccountPool(["a", "b", "c"])
+        pool.lease(2)
+        with self.assertRaises(Exception) as context:
+            pool.lease(2)
+        self.assertIn("Only 1 of the 2 accounts requested are free", str(context.exception))
+        # A failed lease takes nothing.
+        self.assertEqual(pool.lease(1), ["c"])
+
+
+class TestRevertSimulation(unittest.TestCase):
+    def test_simulation_is_local_to_its_thread(self):
+        requests = []
+
+        def make_request(method, params):
+            requests.append(method)
+            return {'error': {'message': "VM Exception while processing transaction: revert"}} \
+                if method == "eth_call" else {'result': "0x1"}
+
+        middleware = revert_simulation_middleware(make_request, W3)
+        transaction = [{'from': DUMMY, 'nonce': 1}]
+        stack = list(W3.middleware_stack)
+        outside = []
+        with simulated_reverts():
+            self.assertEqual(list(W3.middleware_stack), stack)
+            self.assertIn('error', middleware("eth_sendTransaction", transaction))
+            self.assertEqual(requests, ["eth_call"])
+            # Another thread's transactions are sent as usual.
+            thread = threading.Thread(target=lambda: outside.append(middleware("eth_sendTransaction", transaction)))
+            thread.start()
+            thread.join()
+        self.assertEqual(outside, [{'result': "0x1"}])
+        self.assertEqual(middleware("eth_sendTransaction", transaction), {'result': "0x1"})
+        self.assertEqual(requests, ["eth_call", "eth_sendTransaction", "eth_sendTransaction"])
+
+
+class TestFixtureDeployment(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.patches = [mock.patch.dict(os.environ), mock.patch.dict(FIXTURE_DEPLOYMENTS),
+                        mock.patch.dict(MANIFEST, clear=True), mock.patch.dict(DEPLOYED_CONTRACTS)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        shutil.rmtree(self.directory)
+
+    def test_build_and_load(self):
+        abi = [{'type': 'function', 'name': 'owner', 'inputs': [], 'constant': True,
+                'outputs': [{'name': '', 'type': 'address'}], 'payable': False, 'stateMutability': 'view'}]
+        deployments = []
+
+        @fixture_deployment("test_fixture")
+        def deploy():
+            deployments.append(len(deployments))
+            DEPLOYED_CONTRACTS[DUMMY] = ("Owned", abi)
+            return W3.eth.contract(address=DUMMY, abi=abi), 17
+
+        self.assertIs(FIXTURE_DEPLOYMENTS["test_fixture"], deploy)
+        os.environ.pop("CHAIN_FIXTURE_MODE", None)
+        deploy()
+        self.assertEqual(MANIFEST, {})
+
+        # Building runs the deployment, recording what it returned.
+        os.environ["CHAIN_FIXTURE_MODE"] = "build"
+        deploy()
+        self.assertEqual(len(deployments), 2)
+        self.assertEqual(MANIFEST['deployments']['test_fixture'],
+                         [{'contract': "Owned", 'address': DUMMY, 'abi': abi}, {'value': 17}])
+        save_manifest(self.directory, MANIFEST)
+
+        # Loading runs none of it, not even its changes to the chain, and returns the recorded deployment.
+        MANIFEST.clear()
+        DEPLOYED_CONTRACTS.pop(DUMMY)
+        os.environ["CHAIN_FIXTURE_MODE"] = "load"
+        os.environ["CHAIN_FIXTURE"] = self.directory
+        contract, value = deploy()
+        self.assertEqual(len(deployments), 2)
+        self.assertEqual((contract.address, contract.abi, value), (DUMMY, abi, 17))
+        self.assertEqual(DEPLOYED_CONTRACTS[DUMMY], ("Owned", abi))
+
+        # Deployments missing from the fixture are deployed as usual.
+        del MANIFEST['deployments']['test_fixture']
+        deploy()
+        self.assertEqual(len(deployments), 3)
+
+
+class TestParallelRunner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        package = os.path.join(cls.directory, RUNNER_PACKAGE)
+        os.mkdir(package)
+        open(os.path.join(package, "__init__.py"), 'w').close()
+        for name, source in RUNNER_MODULES.items():
+            with open(os.path.join(package, f"{name}.py"), 'w') as f:
+                f.write(dedent(source))
+        sys.path.insert(0, cls.directory)
+
+        # Forked workers need not be importable, and share this process' sys.path.
+        cls.context = multiprocessing.get_context("fork")
+
+    @classmethod
+    def tearDownClass(cls):
+        sys.path.remove(cls.directory)
+        shutil.rmtree(cls.directory)
+
+    def run_workers(self, module_names, targets):
+        """Start a process for each (target, args) pair, each taking modules from a shared queue,
+        and collect their results."""
+        module_queue, result_queue = self.context.Queue(), self.context.Queue()
+        for module_name in module_names:
+            module_queue.put(module_name)
+        for _ in targets:
+            module_queue.put(None)
+        processes = [self.context.Process(target=target, args=(module_queue, result_queue) + args)
+                     for target, args in targets]
+        for process in processes:
+            process.start()
+        with redirect_stdout(io.StringIO()):
+            results = collect_results(module_names, processes, result_queue)
+        for process in processes:
+            process.join()
+        return results
+
+    def test_workers_share_modules(self):
+        workers = [(lambda module_queue, result_queue, address:
+                    run_worker(address, module_queue, result_queue, False, False, RUNNER_PACKAGE), (f"worker-{i}",))
+                   for i in range(2)]
+        results = {result["module"]: result for result in self.run_workers(list(RUNNER_MODULES), workers)}
+
+        # Each module is run exactly once, by one worker or the other.
+        self.assertEqual(sorted(results), sorted(RUNNER_MODULES))
+        for result in results.values():
+            self.assertIn(result["address"], ["worker-0", "worker-1"])
+        self.assertEqual(results["test_passing"]["run"], 2)
+        self.assertEqual(results["test_passing"]["failures"] + results["test_passing"]["errors"], [])
+        self.assertEqual(results["test_failing"]["run"], 2)
+        self.assertEqual([test_id for test_id, _ in results["test_failing"]["failures"]],
+                         [f"{RUNNER_PACKAGE}.test_failing.TestFailing.test_fails"])
+        self.assertEqual(results["test_broken"]["run"], 0)
+        self.assertEqual(len(results["test_broken"]["errors"]), 1)
+
+    def test_lost_worker(self):
+        # The worker dies with the first module, leaving the second in the queue.
+        results = self.run_workers(["test_passing", "test_failing"], [(lambda module_queue, _: lose_module(module_queue), ())])
+        self.assertEqual([result["module"] for result in results], ["test_passing", "test_failing"])
+        for result in results:
+            self.assertEqual(result["run"], 0)
+            self.assertIsNone(result["address"])
+            module_name, message = result["errors"][0]
+            self.assertEqual(module_name, result["module"])
+            self.assertIn("[3]", message)
+
+    def test_print_summary(self):
+        def result(address, run, failures=(), errors=()):
+            return {"module": "test", "address": address, "run": run, "failures": list(failures),
+                    "errors": list(errors), "skipped": 0}
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertTrue(print_summary([result("a", 2), result("b", 1)], 1))
+        self.assertIn("Ran 3 tests in 1.000s across 2 chains", output.getvalue())
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertFalse(print_summary([result("a", 2, failures=[("test_x", "trace")]),
+                                            result(None, 0, errors=[("test_lost", "lost")])], 1))
+        self.assertIn("across 1 chains", output.getvalue())
+        self.assertIn("FAIL: test_x", output.getvalue())
+        self.assertIn("ERROR: test_lost", output.getvalue())
+        self.assertIn("failures=1, errors=1", output.getvalue())
+
+
+class ReversingRpcHandler(BaseHTTPRequestHandler):
+    """Answers each request with its method's name, or an error for "fail", replying to a
+    batch in reverse order, as a node is free to."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        reply = lambda request: {"jsonrpc": "2.0", "id": request["id"],
+                                 **({"error": {"code": -32000, "message": "failed"}}
+                                    if request["method"] == "fail" else {"result": request["method"]})}
+        body = json.dumps([reply(r) for r in reversed(payload)] if isinstance(payload, list) else reply(payload))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRpcUtils(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(("127.0.0.1", 0), ReversingRpcHandler)
+        cls.address = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_rpc_request(self):
+        self.assertEqual(rpc_request(self.address, "eth_blockNumber", []), "eth_blockNumber")
+        self.assertIsNone(rpc_request(self.address, "fail", []))
+
+    def test_batch_request(self):
+        self.assertEqual(batch_request(self.address, []), [])
+        results = batch_request(self.address, [("a", []), ("fail", [1]), ("c", [])])
+        self.assertEqual(results, [("a", None), (None, {"code": -32000, "message": "failed"}), ("c", None)])
+
+
+class TestRpcProfiler(unittest.TestCase):
+    def test_histogram_buckets(self):
+        self.assertEqual(LatencyHistogram.bucket(0), 0)
+        self.assertEqual(LatencyHistogram.bucket(7), 7)
+        self.assertEqual(LatencyHistogram.bucket(1234), 1200)
+        self.assertEqual(LatencyHistogram.bucket(1260), 1300)
+        self.assertEqual(LatencyHistogram.bucket(99.6), 100)
+        self.assertEqual(LatencyHistogram.bucket(123456789), 120000000)
+
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(50), 0)
+        for value in range(1, 101):
+            histogram.record(value)
+        self.assertEqual(histogram.count(), 100)
+        self.assertEqual(histogram.percentile(50), 50)
+        self.assertEqual(histogram.percentile(99), 99)
+        self.assertEqual(histogram.percentile(100), 100)
+
+        # Values sharing a bucket are counted together.
+        histogram = LatencyHistogram()
+        for value in [1010, 1040, 1000, 5000]:
+            histogram.record(value)
+        self.assertEqual(histogram.buckets, {1000: 3, 5000: 1})
+        self.assertEqual(histogram.percentile(75), 1000)
+        self.assertEqual(histogram.percentile(76), 5000)
+
+    def test_histogram_merge(self):
+        first, second = LatencyHistogram({10: 1, 20: 2}), LatencyHistogram({20: 1, 30: 4})
+        first.merge(second)
+        self.assertEqual(first.buckets, {10: 1, 20: 3, 30: 4})
+        self.assertEqual(second.buckets, {20: 1, 30: 4})
+
+    def test_method_stats_merge(self):
+        stats = MethodStats()
+        stats.calls, stats.total_time, stats.request_bytes, stats.response_bytes, stats.redundant_calls = 2, 0.5, 10, 20, 1
+        stats.latency.record(100)
+        stats.latency.record(200)
+
+        merged = MethodStats()
+        # Dumps pass through JSON between processes, which turns the bucket keys into strings.
+        merged.merge_dump(json.loads(json.dumps(stats.dump())))
+        merged.merge_dump(stats.dump())
+        self.assertEqual((merged.calls, merged.total_time, merged.request_bytes, merged.response_bytes,
+                          merged.redundant_calls), (4, 1.0, 20, 40, 2))
+        self.assertEqual(merged.latency.buckets, {100: 2, 200: 2})
+
+    def test_redundant_calls(self):
+        profiler = RpcProfiler()
+        profiler.record("eth_blockNumber", [], 5, 0.001)
+        profiler.set_current_test("test_a")
+        profiler.record("eth_call", [{"to": "0x1"}, "latest"], "0x01", 0.002)
+        profiler.record("eth_call", [{"to": "0x1"}, "latest"], "0x01", 0.002)
+        profiler.record("eth_call", [{"to": "0x1"}, "latest"], "0x01", 0.002)
+        # The same request receiving a different response is not redundant.
+        profiler.record("eth_call", [{"to": "0x1"}, "latest"], "0x02", 0.002)
+        profiler.record("eth_call", [{"to": "0x2"}, "latest"], "0x01", 0.002)
+        # Nor is a request repeated in a later test.
+        profiler.set_current_test("test_b")
+        profiler.record("eth_call", [{"to": "0x1"}, "latest"], "0x01", 0.010)
+        profiler.record("eth_blockNumber", [], 5, 0.001)
+        profiler.record("eth_blockNumber", [], 5, 0.001)
+
+        self.assertEqual(profiler.methods["eth_call"].calls, 6)
+        self.assertEqual(profiler.methods["eth_call"].redundant_calls, 2)
+        self.assertEqual(profiler.methods["eth_blockNumber"].redundant_calls, 1)
+        self.assertEqual(profiler.tests[NO_TEST]['calls'], 1)
+        self.assertEqual(profiler.tests["test_a"]['calls'], 5)
+        self.assertAlmostEqual(profiler.tests["test_b"]['time'], 0.012)
+
+        report = profiler.report()
+        self.assertEqual([test['test'] for test in report['slowest_tests']], ["test_b", "test_a", NO_TEST])
+        self.assertEqual(report['redundant_calls'], [{'method': "eth_call", 'calls': 2},
+                                                     {'method': "eth_blockNumber", 'calls': 1}])
+        self.assertEqual(report['methods']["eth_call"]['p50_us'], 2000)
+        self.assertEqual(report['methods']["eth_call"]['max_us'], 10000)
+
+        # Merging dumps from several profilers, as the parallel runner does, reproduces the report.
+        merged = RpcProfiler()
+        merged.merge_dump(json.loads(json.dumps(profiler.dump())))
+        self.assertEqual(merged.report(), report)
+
+
+@unittest.skipUnless(find_spec("eth_tester"), "eth-tester is not installed")
+class TestInProcessProvider(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from utils.testerprovider import InProcessProvider
+
+        # The harness' chain helpers are pointed at a chain of their own, whatever the backend in use.
+        cls.providers = W3.providers
+        W3.providers = [InProcessProvider(2, ETHER)]
+        cls.sender, cls.recipient = W3.eth.accounts
+
+    @classmethod
+    def tearDownClass(cls):
+        W3.providers = cls.providers
+
+    def test_snapshot_fast_forward_restore(self):
+        day = to_seconds(days=1)
+        start_time, start_block = block_time(), W3.eth.blockNumber
+        self.assertEqual(W3.eth.getBalance(self.recipient), ETHER)
+
+        snapshot = take_snapshot()
+        mine_tx(W3.eth.sendTransaction({'from': self.sender, 'to': self.recipient, 'value': 1000}))
+        fast_forward(days=1)
+        self.assertGreaterEqual(block_time(), start_time + day)
+        self.assertGreater(W3.eth.blockNumber, start_block)
+        self.assertEqual(W3.eth.getBalance(self.recipient), ETHER + 1000)
+
+        # Blocks mined after the increase carry on from the new time.
+        time = block_time()
+        fast_forward(0)
+        self.assertGreaterEqual(block_time(), time)
+        self.assertLess(block_time(), time + day)
+
+        restore_snapshot(snapshot)
+        self.assertEqual(W3.eth.getBalance(self.recipient), ETHER)
+        self.assertLess(block_time(), start_time + day)
+        self.assertEqual(W3.eth.getTransactionCount(self.sender), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,22 @@ import unittest
 from utils.deployutils import attempt, compile_contracts, attempt_deploy, W3, mine_txs, mine_tx, \
     UNIT, MASTER, DUMMY, to_seconds, fast_forward, fresh_account, fresh_accounts, take_snapshot, restore_snapshot
 from utils.testutils import assertReverts, block_time, assertClose, generate_topic_event_map, get_event_data_from_log
+from utils.batchutils import distribute_havvens
+from utils.fixtures import fixture_deployment
+from tools.rollover_keeper import RolloverKeeper
+from tools.balance_history import BalanceHistory
 
 SOLIDITY_SOURCES = ["tests/contracts/PublicHavven.sol", "contracts/EtherNomin.sol",
                     "contracts/Court.sol", "contracts/HavvenEscrow.sol"]
 
 
+@fixture_deployment("test_Havven")
 def deploy_public_havven():
     print("Deployment initiated.\n")
 
+    # to avoid overflowing in the negative direction (now - targetFeePeriodDuration * 2)
+    fast_forward(weeks=102)
+
     compiled = attempt(compile_contracts, [SOLIDITY_SOURCES], "Compiling contracts... ")
 
     # Deploy contracts
@@ -33,10 +41,8 @@ def deploy_public_havven():
            nomin_contract.functions.setCourt(court_contract.address).transact({'from': MASTER})]
     attempt(mine_txs, [txs], "Linking contracts... ")
 
-    havven_event_dict = generate_topic_event_map(compiled['PublicHavven']['abi'])
-
     print("\nDeployment complete.\n")
-    return havven_contract, nomin_contract, court_contract, escrow_contract, hvn_block, havven_event_dict
+    return havven_contract, nomin_contract, court_contract, escrow_contract, hvn_block
 
 
 def setUpModule():
@@ -61,10 +67,9 @@ class TestHavven(unittest.TestCase):
     def setUpClass(cls):
         cls.assertClose = assertClose
         cls.assertReverts = assertReverts
-        # to avoid overflowing in the negative direction (now - targetFeePeriodDuration * 2)
-        fast_forward(weeks=102)
 
-        cls.havven, cls.nomin, cls.court, cls.escrow, cls.construction_block, cls.havven_event_dict = deploy_public_havven()
+        cls.havven, cls.nomin, cls.court, cls.escrow, cls.construction_block = deploy_public_havven()
+        cls.havven_event_dict = generate_topic_event_map(cls.havven.abi)
 
         # INHERITED
         # OWNED
@@ -124,10 +129,21 @@ class TestHavven(unittest.TestCase):
             self.havven.functions.transfer(addr, amt).transact({'from': sender}))
         cls.transferFrom = lambda self, sender, frm, to, amt: mine_tx(
             self.havven.functions.transferFrom(frm, to, amt).transact({'from': sender}))
+        cls.transferBatch = lambda self, sender, recipients, values: mine_tx(
+            self.havven.functions.transferBatch(recipients, values).transact({'from': sender}))
         cls.recomputeLastAverageBalance = lambda self, sender: mine_tx(
             self.havven.functions.recomputeLastAverageBalance().transact({'from': sender}))
         cls.rolloverFeePeriod = lambda self, sender: mine_tx(
             self.havven.functions.rolloverFeePeriod().transact({'from': sender}))
+        cls.recomputeAccountLastAverageBalances = lambda self, sender, accounts: mine_tx(
+            self.havven.functions.recomputeAccountLastAverageBalances(accounts).transact({'from': sender}))
+        cls.enableBalanceHistory = lambda self, sender: mine_tx(
+            self.havven.functions.enableBalanceHistory().transact({'from': sender}))
+        cls.balanceCheckpointCount = lambda self, account: self.havven.functions.balanceCheckpointCount(account).call()
+        cls.cumulativeBalanceSumAt = lambda self, account, time: self.havven.functions.cumulativeBalanceSumAt(
+            account, time).call()
+        cls.averageBalanceBetween = lambda self, account, start, end: self.havven.functions.averageBalanceBetween(
+            account, start, end).call()
 
         #
         # INTERNAL
@@ -684,6 +700,167 @@ class TestHavven(unittest.TestCase):
         # This should fail because the approver has no tokens.
         self.assertReverts(self.transferFrom, spender, no_tokens, receiver, value)
 
+    # transferBatch
+    def test_transferBatchRollsOver(self):
+        alice, bob = fresh_accounts(2)
+        self.endow(MASTER, alice, 50 * UNIT)
+        fast_forward(seconds=self.targetFeePeriodDurationSeconds() + 100)
+        tx_receipt = self.transferBatch(alice, [MASTER, bob], [10 * UNIT, 10 * UNIT])
+        event = get_event_data_from_log(self.havven_event_dict, tx_receipt.logs[0])
+        self.assertEqual(event['event'], 'FeePeriodRollover')
+        events = [get_event_data_from_log(self.havven_event_dict, log)['event'] for log in tx_receipt.logs]
+        self.assertEqual(events.count('FeePeriodRollover'), 1)
+        self.assertEqual(events.count('Transfer'), 2)
+
+    def test_transferBatch(self):
+        sender, alice, bob, carol = fresh_accounts(4)
+        self.endow(MASTER, sender, 50 * UNIT)
+        total_supply = self.totalSupply()
+
+        # Mismatched lists and insufficient balances are disallowed.
+        self.assertReverts(self.transferBatch, sender, [alice, bob], [UNIT])
+        self.assertReverts(self.transferBatch, sender, [alice, bob], [25 * UNIT, 25 * UNIT + 1])
+        self.assertReverts(self.transferBatch, alice, [bob], [UNIT])
+
+        # Repeated recipients, the sender itself and zero values are all allowed.
+        self.transferBatch(sender, [alice, bob, alice, sender, carol], [UNIT, 2 * UNIT, 3 * UNIT, 4 * UNIT, 0])
+        self.assertEqual(self.balanceOf(sender), 44 * UNIT)
+        self.assertEqual(self.balanceOf(alice), 4 * UNIT)
+        self.assertEqual(self.balanceOf(bob), 2 * UNIT)
+        self.assertEqual(self.balanceOf(carol), 0)
+        self.assertEqual(self.totalSupply(), total_supply)
+
+        # Every party's fee entitlement is brought up to date.
+        for account in [sender, alice, bob, carol]:
+            self.assertEqual(self.lastTransferTimestamp(account), block_time())
+
+    def test_transferBatchBalanceSums(self):
+        sender, alice, bob = fresh_accounts(3)
+        self.endow(MASTER, sender, 50 * UNIT)
+        self.start_new_fee_period()
+
+        tx_receipt = self.transferBatch(sender, [alice, bob], [10 * UNIT, 10 * UNIT])
+        start_time = block_time(tx_receipt['blockNumber'])
+        fast_forward(1000)
+        tx_receipt = self.transferBatch(sender, [alice, bob], [0, 0])
+        end_time = block_time(tx_receipt['blockNumber'])
+
+        self.assertEqual(self.currentBalanceSum(sender),
+                         50 * UNIT * (start_time - self.feePeriodStartTime()) + 30 * UNIT * (end_time - start_time))
+        self.assertEqual(self.currentBalanceSum(alice), 10 * UNIT * (end_time - start_time))
+        self.assertEqual(self.currentBalanceSum(bob), 10 * UNIT * (end_time - start_time))
+
+    # balance history
+    def test_balanceHistory(self):
+        alice, bob = fresh_accounts(2)
+        self.endow(MASTER, alice, 100 * UNIT)
+
+        # An account may enable its own history only once, without affecting any other.
+        t0 = block_time(self.enableBalanceHistory(alice)['blockNumber'])
+        self.assertReverts(self.enableBalanceHistory, alice)
+        self.assertEqual(self.balanceCheckpointCount(alice), 1)
+        self.assertEqual(self.balanceCheckpointCount(bob), 0)
+        self.enableBalanceHistory(bob)
+
+        fast_forward(100)
+        t1 = block_time(self.transfer(alice, bob, 40 * UNIT)['blockNumber'])
+        fast_forward(50)
+        t2 = block_time(self.endow(MASTER, alice, 10 * UNIT)['blockNumber'])
+        fast_forward(30)
+        t3 = block_time()
+        self.assertEqual(self.balanceCheckpointCount(alice), 3)
+
+        self.assertEqual(self.cumulativeBalanceSumAt(alice, t0), 0)
+        self.assertEqual(self.averageBalanceBetween(alice, t0, t1), 100 * UNIT)
+        self.assertEqual(self.averageBalanceBetween(alice, t1, t2), 60 * UNIT)
+        self.assertEqual(self.averageBalanceBetween(alice, t2, t3), 70 * UNIT)
+        self.assertEqual(self.averageBalanceBetween(alice, t0 + 10, t1 + 10),
+                         (100 * UNIT * (t1 - t0 - 10) + 60 * UNIT * 10) // (t1 - t0))
+        self.assertEqual(self.averageBalanceBetween(alice, t0, t3),
+                         (100 * UNIT * (t1 - t0) + 60 * UNIT * (t2 - t1) + 70 * UNIT * (t3 - t2)) // (t3 - t0))
+        self.assertEqual(self.averageBalanceBetween(bob, t1, t3), 40 * UNIT)
+
+        # Windows must lie within the history, and not be empty.
+        self.assertReverts(self.averageBalanceBetween, alice, t0 - 1, t1)
+        self.assertReverts(self.averageBalanceBetween, alice, t1, t1)
+        self.assertReverts(self.averageBalanceBetween, alice, t1, t3 + 10000)
+        self.assertReverts(self.averageBalanceBetween, DUMMY, t1, t3)
+
+        # The client computes the same averages from its copy of the checkpoints.
+        history = BalanceHistory(self.havven, alice)
+        self.assertEqual(history.sync(), 3)
+        self.assertEqual(history.sync(), 0)
+        for start, end in [(t0, t1), (t0 + 10, t1 + 10), (t1 - 1, t2 + 1), (t0, t3), (t2 + 5, t3)]:
+            self.assertEqual(history.average_balance(start, end), self.averageBalanceBetween(alice, start, end))
+        self.assertEqual([history.balance_at(t) for t in [t0, t1, t2]], [100 * UNIT, 60 * UNIT, 70 * UNIT])
+        with self.assertRaises(ValueError):
+            history.average_balance(t0 - 1, t1)
+
+    def test_distribute_havvens(self):
+        recipients = fresh_accounts(12)
+        allocations = [(recipient, (i + 1) * UNIT) for i, recipient in enumerate(recipients)]
+        self.endow(MASTER, MASTER, 100 * UNIT)
+
+        # A budget this small forces the recipients to be split across many transactions.
+        receipts = distribute_havvens(self.havven, MASTER, allocations, gas_budget=300000)
+        self.assertGreater(len(receipts), 1)
+        for receipt in receipts:
+            self.assertLessEqual(receipt['gasUsed'], 300000)
+        for recipient, value in allocations:
+            self.assertEqual(self.balanceOf(recipient), value)
+        self.assertEqual(self.balanceOf(MASTER), 100 * UNIT - sum(value for _, value in allocations))
+
+    def test_recomputeAccountLastAverageBalances(self):
+        alice, bob, carol = fresh_accounts(3)
+        self.endow(MASTER, alice, 4 * UNIT)
+        self.endow(MASTER, bob, 2 * UNIT)
+        self.start_new_fee_period()
+        fast_forward(self.targetFeePeriodDurationSeconds() + 10)
+
+        # Anyone may refresh other accounts, and the fee period rolls over first.
+        start_time = self.feePeriodStartTime()
+        tx_receipt = self.recomputeAccountLastAverageBalances(carol, [alice, bob])
+        self.assertGreater(self.feePeriodStartTime(), start_time)
+        self.assertEqual(get_event_data_from_log(self.havven_event_dict, tx_receipt.logs[0])['event'],
+                         'FeePeriodRollover')
+        self.assertClose(self.lastAverageBalance(alice), 4 * UNIT)
+        self.assertClose(self.lastAverageBalance(bob), 2 * UNIT)
+        self.assertEqual(self.lastAverageBalance(carol), 0)
+
+        # Refreshing again in the same period changes nothing.
+        self.recomputeAccountLastAverageBalances(carol, [alice, bob])
+        self.assertClose(self.lastAverageBalance(alice), 4 * UNIT)
+
+    def test_rollover_keeper(self):
+        holders = fresh_accounts(6)
+        keeper_account = fresh_account()
+        for i, holder in enumerate(holders):
+            self.endow(MASTER, holder, (i + 1) * UNIT)
+        self.start_new_fee_period()
+
+        # A small gas budget splits the recomputation across several transactions.
+        keeper = RolloverKeeper(self.havven, keeper_account, holders, gas_budget=150000, block_time_refresh=0)
+        keeper.step()
+        self.assertEqual(keeper.report()['rollovers'], 0)
+        self.assertEqual(len(keeper.pending), 0)
+
+        fast_forward(self.targetFeePeriodDurationSeconds() + 10)
+        start_time = self.feePeriodStartTime()
+        self.assertTrue(keeper.rollover_due())
+        tx_hashes = keeper.rollover()
+        self.assertGreater(len(tx_hashes), 2)
+        while keeper.pending:
+            keeper.step()
+
+        self.assertGreater(self.feePeriodStartTime(), start_time)
+        self.assertEqual(keeper.next_rollover, self.feePeriodStartTime() + self.targetFeePeriodDurationSeconds())
+        report = keeper.report()
+        self.assertEqual(report['rollovers'], 1)
+        self.assertGreaterEqual(report['max_lateness'], 0)
+        self.assertEqual(report['accounts_recomputed'], len(holders))
+        for i, holder in enumerate(holders):
+            self.assertClose(self.lastAverageBalance(holder), (i + 1) * UNIT)
+
     def test_double_withdraw_fee(self):
         alice = fresh_account()
         self.withdrawFeeEntitlement(alice)
@@ -1,15 +1,41 @@
+import os
+import shutil
+import tempfile
 import unittest
 
-from utils.deployutils import compile_contracts, attempt_deploy, mine_tx, MASTER, DUMMY, take_snapshot,\
-    restore_snapshot, fresh_account, fresh_accounts, UNIT, fast_forward
+from utils.deployutils import attempt, compile_contracts, attempt_deploy, mine_tx, mine_txs, MASTER, DUMMY, \
+    take_snapshot, restore_snapshot, fresh_account, fresh_accounts, UNIT, fast_forward, W3
 from utils.testutils import assertReverts, assertClose, block_time
 from utils.generalutils import to_seconds
+from utils.batchutils import load_vesting_schedules, transfer_batch_call
+from utils.fixtures import fixture_deployment
+from tools.distribute import Distribution, Journal, read_allocations
 
 ESCROW_SOURCE = "contracts/HavvenEscrow.sol"
 HAVVEN_SOURCE = "contracts/Havven.sol"
 NOMIN_SOURCE = "contracts/EtherNomin.sol"
 
 
+@fixture_deployment("test_HavvenEscrow")
+def deploy_escrow():
+    print("Deployment initiated.\n")
+
+    compiled = attempt(compile_contracts, [[ESCROW_SOURCE, HAVVEN_SOURCE, NOMIN_SOURCE]], "Compiling contracts... ")
+
+    havven_contract, havven_txr = attempt_deploy(compiled, 'Havven', MASTER, [MASTER])
+    nomin_contract, nomin_txr = attempt_deploy(compiled, 'EtherNomin', MASTER,
+                                               [havven_contract.address, MASTER, MASTER, 1000 * 10**18, MASTER])
+    escrow_contract, escrow_txr = attempt_deploy(compiled, 'HavvenEscrow', MASTER,
+                                                 [MASTER, havven_contract.address, nomin_contract.address])
+
+    txs = [havven_contract.functions.setNomin(nomin_contract.address).transact({'from': MASTER}),
+           havven_contract.functions.setEscrow(escrow_contract.address).transact({'from': MASTER})]
+    attempt(mine_txs, [txs], "Linking contracts... ")
+
+    print("\nDeployment complete.\n")
+    return havven_contract, nomin_contract, escrow_contract
+
+
 def setUpModule():
     print("Testing HavvenEscrow...")
 
@@ -30,13 +56,7 @@ class TestHavvenEscrow(unittest.TestCase):
         cls.assertReverts = assertReverts
         cls.assertClose = assertClose
 
-        compiled = compile_contracts([ESCROW_SOURCE, HAVVEN_SOURCE, NOMIN_SOURCE])
-        cls.havven, txr = attempt_deploy(compiled, 'Havven', MASTER, [MASTER])
-        cls.nomin, txr = attempt_deploy(compiled, 'EtherNomin', MASTER, [cls.havven.address, MASTER, MASTER, 1000 * 10**18, MASTER])
-        cls.escrow, txr = attempt_deploy(compiled, 'HavvenEscrow', MASTER,
-                                         [MASTER, cls.havven.address, cls.nomin.address])
-        mine_tx(cls.havven.functions.setNomin(cls.nomin.address).transact({'from': MASTER}))
-        mine_tx(cls.havven.functions.setEscrow(cls.escrow.address).transact({'from': MASTER}))
+        cls.havven, cls.nomin, cls.escrow = deploy_escrow()
 
         cls.h_totalSupply = lambda self: cls.havven.functions.totalSupply().call()
         cls.h_targetFeePeriodDurationSeconds = lambda self: cls.havven.functions.targetFeePeriodDurationSeconds().call()
@@ -84,6 +104,8 @@ class TestHavvenEscrow(unittest.TestCase):
         cls.purgeAccount = lambda self, sender, account: mine_tx(cls.escrow.functions.purgeAccount(account).transact({'from': sender}))
         cls.withdrawHavvens = lambda self, sender, quantity: mine_tx(cls.escrow.functions.withdrawHavvens(quantity).transact({'from': sender}))
         cls.appendVestingEntry = lambda self, sender, account, time, quantity: mine_tx(cls.escrow.functions.appendVestingEntry(account, time, quantity).transact({'from': sender}))
+        cls.appendVestingEntries = lambda self, sender, account, times, quantities: mine_tx(cls.escrow.functions.appendVestingEntries(account, times, quantities).transact({'from': sender}))
+        cls.addVestingSchedules = lambda self, sender, accounts, counts, times, quantities: mine_tx(cls.escrow.functions.addVestingSchedules(accounts, counts, times, quantities).transact({'from': sender}))
         cls.addRegularVestingSchedule = lambda self, sender, account, time, quantity, periods: mine_tx(cls.escrow.functions.addRegularVestingSchedule(account, time, quantity, periods).transact({'from': sender}))
         cls.vest = lambda self, sender: mine_tx(cls.escrow.functions.vest().transact({'from': sender}))
 
@@ -572,5 +594,138 @@ class TestHavvenEscrow(unittest.TestCase):
         self.assertEqual(self.getVestingTime(tim, 0), self.getVestingTime(pim, 0))
         self.assertEqual(self.getVestingQuantity(tim, 0), self.getVestingQuantity(pim, 0))
 
+    def test_appendVestingEntries(self):
+        alice = fresh_account()
+        time = block_time()
+        times = [time + to_seconds(weeks=i) for i in range(1, 6)]
+        quantities = [UNIT * i for i in range(1, 6)]
+
+        # Mismatched, empty, unordered, past and zero entries are disallowed.
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, times, quantities[1:])
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, [], [])
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, [times[1], times[0]], [UNIT, UNIT])
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, [times[0], times[0]], [UNIT, UNIT])
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, [time - 1, times[0]], [UNIT, UNIT])
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, times[:2], [UNIT, 0])
+        self.assertReverts(self.appendVestingEntries, alice, alice, times, quantities)
+
+        self.appendVestingEntries(MASTER, alice, times[:3], quantities[:3])
+        self.assertEqual(self.numVestingEntries(alice), 3)
+        self.assertEqual(self.totalVestedAccountBalance(alice), sum(quantities[:3]))
+        self.assertEqual(self.totalVestedBalance(), sum(quantities[:3]))
+
+        # New entries must come after the existing schedule.
+        self.assertReverts(self.appendVestingEntries, MASTER, alice, times[2:], quantities[2:])
+        self.appendVestingEntries(MASTER, alice, times[3:], quantities[3:])
+
+        self.assertEqual(self.numVestingEntries(alice), 5)
+        for i in range(len(times)):
+            self.assertEqual(self.getVestingScheduleEntry(alice, i), [times[i], quantities[i]])
+        self.assertEqual(self.totalVestedAccountBalance(alice), sum(quantities))
+        self.assertEqual(self.totalVestedBalance(), sum(quantities))
+
+    def test_addVestingSchedules(self):
+        alice, bob, carol = fresh_accounts(3)
+        time = block_time()
+        times = [time + to_seconds(weeks=i) for i in range(1, 4)]
+
+        self.appendVestingEntry(MASTER, carol, times[1], UNIT)
+
+        # Counts must match the accounts, and cover all the entries.
+        self.assertReverts(self.addVestingSchedules, MASTER, [alice, bob], [1], times[:1], [UNIT])
+        self.assertReverts(self.addVestingSchedules, MASTER, [alice, bob], [1, 1], times[:1], [UNIT])
+        self.assertReverts(self.addVestingSchedules, MASTER, [alice], [1], times[:2], [UNIT, UNIT])
+        # Carol's new entries must not predate her existing schedule.
+        self.assertReverts(self.addVestingSchedules, MASTER, [alice, carol], [1, 1], times[:2], [UNIT, UNIT])
+        self.assertReverts(self.addVestingSchedules, alice, [alice], [1], times[:1], [UNIT])
+
+        self.addVestingSchedules(MASTER, [alice, bob, carol], [3, 1, 1],
+                                 times + times[:1] + times[2:],
+                                 [UNIT, 2 * UNIT, 3 * UNIT, 4 * UNIT, 5 * UNIT])
+
+        self.assertEqual(self.numVestingEntries(alice), 3)
+        self.assertEqual(self.numVestingEntries(bob), 1)
+        self.assertEqual(self.numVestingEntries(carol), 2)
+        self.assertEqual(self.getVestingScheduleEntry(alice, 2), [times[2], 3 * UNIT])
+        self.assertEqual(self.getVestingScheduleEntry(bob, 0), [times[0], 4 * UNIT])
+        self.assertEqual(self.getVestingScheduleEntry(carol, 1), [times[2], 5 * UNIT])
+        self.assertEqual(self.totalVestedAccountBalance(alice), 6 * UNIT)
+        self.assertEqual(self.totalVestedAccountBalance(bob), 4 * UNIT)
+        self.assertEqual(self.totalVestedAccountBalance(carol), 6 * UNIT)
+        self.assertEqual(self.totalVestedBalance(), 16 * UNIT)
+
+    def test_load_vesting_schedules(self):
+        accounts = fresh_accounts(10)
+        time = block_time()
+        schedules = {account: [(time + to_seconds(weeks=i), UNIT) for i in range(1, 5)]
+                     for account in accounts}
+
+        # A budget this small forces the cohort to be split across many transactions.
+        receipts = load_vesting_schedules(self.escrow, MASTER, schedules, gas_budget=400000)
+        self.assertGreater(len(receipts), 1)
+        for receipt in receipts:
+            self.assertLessEqual(receipt['gasUsed'], 400000)
+
+        for account in accounts:
+            self.assertEqual(self.numVestingEntries(account), 4)
+            self.assertEqual(self.totalVestedAccountBalance(account), 4 * UNIT)
+            for i in range(4):
+                self.assertEqual(self.getVestingTime(account, i), schedules[account][i][0])
+        self.assertEqual(self.totalVestedBalance(), 40 * UNIT)
+
+    def test_distribute(self):
+        accounts = fresh_accounts(6)
+        time = block_time()
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "allocations.csv")
+            with open(path, 'w') as f:
+                f.write("account,quantity,vesting_time\n")
+                for i, account in enumerate(accounts):
+                    f.write(f"{account},{i + 1},\n")
+                    # Entries are appended in order of time, whatever their order in the file.
+                    f.write(f"{account},0.5,{time + to_seconds(weeks=2)}\n")
+                    f.write(f"{account},0.25,{time + to_seconds(weeks=1)}\n")
+            allocations = read_allocations(path)
+            journal_path = path + ".journal"
+
+            # As if an earlier run had sent a payment of the first allocation, but was interrupted
+            # before recording its hash.
+            first = allocations[0]
+            self.h_endow(MASTER, MASTER, first.quantity)
+            nonce = W3.eth.getTransactionCount(MASTER, 'pending')
+            Journal(journal_path).record_submitting(nonce, W3.eth.blockNumber, 'direct', [first.index])
+            # And had recorded another which it never sent.
+            Journal(journal_path).record_submitting(nonce + 1, W3.eth.blockNumber, 'direct', [allocations[3].index])
+            mine_tx(transfer_batch_call(self.havven, [(first.account, first.quantity)])
+                    .transact({'from': MASTER, 'nonce': nonce}))
+
+            distribution = Distribution(self.havven, self.escrow, MASTER, allocations, Journal(journal_path),
+                                        gas_budget=300000)
+            self.assertEqual(distribution.completed_rows(), {first.index})
+            self.assertEqual(distribution.run(), len(allocations) - 1)
+            self.assertEqual(distribution.failed, [])
+            self.assertGreater(len(distribution.journal.submitted), 2)
+            for i, account in enumerate(accounts):
+                self.assertEqual(self.h_balanceOf(account), (i + 1) * UNIT)
+                self.assertEqual(self.numVestingEntries(account), 2)
+                self.assertEqual(self.getVestingTime(account, 0), time + to_seconds(weeks=1))
+                self.assertEqual(self.getVestingQuantity(account, 1), UNIT // 2)
+                self.assertEqual(self.totalVestedAccountBalance(account), 3 * UNIT // 4)
+            self.assertGreaterEqual(self.h_balanceOf(self.escrow.address), self.totalVestedBalance())
+
+            # Running again from the journal pays nothing more.
+            rerun = Distribution(self.havven, self.escrow, MASTER, allocations, Journal(journal_path))
+            self.assertEqual(rerun.run(), 0)
+            self.assertEqual(self.h_balanceOf(accounts[-1]), len(accounts) * UNIT)
+
+            # Nor may the journal be resumed with allocations other than those it was written for.
+            changed = Distribution(self.havven, self.escrow, MASTER, allocations[:-1], Journal(journal_path))
+            with self.assertRaises(Exception):
+                changed.run()
+            self.assertEqual(changed.journal.digest, rerun.journal.digest)
+        finally:
+            shutil.rmtree(directory)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,12 +1,20 @@
 import unittest
 
-from utils.deployutils import compile_contracts, attempt_deploy, mine_tx, MASTER, DUMMY
+from utils.deployutils import attempt, compile_contracts, attempt_deploy, mine_tx, MASTER, DUMMY, W3
 from utils.testutils import assertReverts
+from utils.fixtures import fixture_deployment
 
 
 OWNED_SOURCE = "contracts/Owned.sol"
 
 
+@fixture_deployment("test_Owned")
+def deploy_owned():
+    compiled = attempt(compile_contracts, [[OWNED_SOURCE]], "Compiling contracts... ")
+    owned_contract, txr = attempt_deploy(compiled, 'Owned', MASTER, [MASTER])
+    return owned_contract,
+
+
 def setUpModule():
     print("Testing Owned...")
 
@@ -20,8 +28,7 @@ class TestOwned(unittest.TestCase):
     def setUpClass(cls):
         cls.assertReverts = assertReverts
 
-        compiled = compile_contracts([OWNED_SOURCE])
-        cls.owned, txr = attempt_deploy(compiled, 'Owned', MASTER, [MASTER])
+        cls.owned, = deploy_owned()
 
         cls.owner = lambda self: cls.owned.functions.owner().call()
         cls.setOwner = lambda self, sender, newOwner: mine_tx(cls.owned.functions.setOwner(newOwner).transact({'from': sender}))
@@ -42,6 +49,16 @@ class TestOwned(unittest.TestCase):
         invalid_account = DUMMY
         self.assertReverts(self.setOwner, invalid_account, invalid_account)
 
+    def test_change_invalid_owner_mined(self):
+        invalid_account = DUMMY
+        self.assertReverts(self.setOwner, invalid_account, invalid_account, mine=True)
+        self.assertEqual(self.owner(), MASTER)
+
+    def test_simulated_revert_is_not_mined(self):
+        block_number = W3.eth.blockNumber
+        self.assertReverts(self.setOwner, DUMMY, DUMMY)
+        self.assertEqual(W3.eth.blockNumber, block_number)
+
 
 if __name__ == '__main__':
     unittest.main()
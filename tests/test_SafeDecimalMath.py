@@ -1,11 +1,19 @@
 import unittest
 
-from utils.deployutils import compile_contracts, attempt_deploy, UNIT, MASTER 
+from utils.deployutils import attempt, compile_contracts, attempt_deploy, UNIT, MASTER
 from utils.testutils import assertReverts
+from utils.fixtures import fixture_deployment
 
 MATH_MODULE_SOURCE = "tests/contracts/PublicMath.sol"
 
 
+@fixture_deployment("test_SafeDecimalMath")
+def deploy_math():
+    compiled = attempt(compile_contracts, [[MATH_MODULE_SOURCE], ['""=contracts']], "Compiling contracts... ")
+    math_contract, tx_receipt = attempt_deploy(compiled, 'PublicMath', MASTER, [])
+    return math_contract,
+
+
 def setUpModule():
     print("Testing SafeDecimalMath...")
 
@@ -19,9 +27,7 @@ class TestSafeDecimalMath(unittest.TestCase):
     def setUpClass(cls):
         cls.assertReverts = assertReverts
 
-        compiled = compile_contracts([MATH_MODULE_SOURCE],
-                                     remappings=['""=contracts'])
-        cls.math, tx_receipt = attempt_deploy(compiled, 'PublicMath', MASTER, [])
+        cls.math, = deploy_math()
 
         cls.addIsSafe = lambda self, x, y: cls.math.functions.pubAddIsSafe(x, y).call()
         cls.safeAdd = lambda self, x, y: cls.math.functions.pubSafeAdd(x, y).call()
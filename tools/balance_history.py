@@ -0,0 +1,102 @@
+# The balance history client: reads an account's average havven balance over any window since
+# it enabled its balance history, either with a single call to Havven.averageBalanceBetween, or
+# from a local copy of its checkpoints, which is brought up to date by reading only new ones.
+# Run with: python3 -m tools.balance_history --havven ADDRESS --account ADDRESS [--days N [N ...]]
+
+from argparse import ArgumentParser
+from bisect import bisect_right
+
+from utils.deployutils import W3, UNIT, compile_contracts
+
+HAVVEN_SOURCE = "contracts/Havven.sol"
+
+# The trailing windows, in days, reported by default.
+DEFAULT_WINDOWS = [7, 28, 91]
+
+
+def average_balance(havven, account, start_time, end_time):
+    """The account's average balance between two times, read from the chain in one call."""
+    return havven.functions.averageBalanceBetween(account, start_time, end_time).call()
+
+
+class BalanceHistory:
+    """A local copy of an account's balance checkpoints, from which the same averages as
+    Havven.averageBalanceBetween are computed without calling the chain. Each sync reads
+    only the checkpoints appended since the last one."""
+
+    def __init__(self, havven, account):
+        self.havven = havven
+        self.account = account
+        self.timestamps = []
+        self.sums = []
+        self.balance = 0
+        self.synced_time = None
+
+    def sync(self):
+        """Read any new checkpoints and the current balance. Returns the number of new checkpoints."""
+        count = self.havven.functions.balanceCheckpointCount(self.account).call()
+        new = count - len(self.timestamps)
+        for index in range(len(self.timestamps), count):
+            timestamp, cumulative_sum = self.havven.functions.balanceCheckpoint(self.account, index).call()
+            self.timestamps.append(timestamp)
+            self.sums.append(cumulative_sum)
+        self.balance = self.havven.functions.balanceOf(self.account).call()
+        self.synced_time = W3.eth.getBlock('latest')['timestamp']
+        return new
+
+    @property
+    def start_time(self):
+        return self.timestamps[0] if self.timestamps else None
+
+    def cumulative_balance_sum_at(self, time):
+        """Havven.cumulativeBalanceSumAt, for times up to the last sync."""
+        if not self.timestamps or not self.timestamps[0] <= time <= self.synced_time:
+            raise ValueError(f"{time} is outside the synced balance history of {self.account}")
+        index = bisect_right(self.timestamps, time) - 1
+        if index == len(self.timestamps) - 1:
+            return self.sums[index] + self.balance * (time - self.timestamps[index])
+        return self.sums[index] + (self.sums[index + 1] - self.sums[index]) * (time - self.timestamps[index]) // \
+            (self.timestamps[index + 1] - self.timestamps[index])
+
+    def average_balance(self, start_time, end_time):
+        """Havven.averageBalanceBetween, for times up to the last sync."""
+        if start_time >= end_time:
+            raise ValueError("The window must end after it starts.")
+        return (self.cumulative_balance_sum_at(end_time) - self.cumulative_balance_sum_at(start_time)) // \
+            (end_time - start_time)
+
+    def balance_at(self, time):
+        """The account's balance just after the given time."""
+        index = bisect_right(self.timestamps, time) - 1
+        if index < 0:
+            raise ValueError(f"{time} predates the balance history of {self.account}")
+        if index == len(self.timestamps) - 1:
+            return self.balance
+        return (self.sums[index + 1] - self.sums[index]) // (self.timestamps[index + 1] - self.timestamps[index])
+
+
+def parse_args():
+    parser = ArgumentParser(description="Report an account's average havven balance over trailing windows.")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--account", required=True, help="an account which has enabled its balance history")
+    parser.add_argument("--days", type=float, nargs="+", default=DEFAULT_WINDOWS,
+                        help="the lengths of the trailing windows, in days")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts([HAVVEN_SOURCE])
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    history = BalanceHistory(havven, args.account)
+    history.sync()
+    if history.start_time is None:
+        raise SystemExit(f"{args.account} has not enabled its balance history; "
+                         f"it must first call Havven.enableBalanceHistory() itself.")
+
+    print(f"{len(history.timestamps)} checkpoints since {history.start_time}; "
+          f"current balance {history.balance / UNIT} havvens.")
+    for days in args.days:
+        start = max(history.synced_time - int(days * 24 * 60 * 60), history.start_time)
+        if start < history.synced_time:
+            print(f"Average over the last {days} days: {history.average_balance(start, history.synced_time) / UNIT} havvens")
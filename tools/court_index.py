@@ -0,0 +1,204 @@
+# The court index: follows the Court's events to keep every motion's tallies, every voter's
+# vote and every phase deadline in memory, so that the state of all confiscation motions can
+# be answered at once, rather than with several calls to the Court per suspected target.
+# Run with: python3 -m tools.court_index --court ADDRESS --havven ADDRESS [--from-block N]
+
+import time
+from argparse import ArgumentParser
+
+from utils.deployutils import W3, UNIT, compile_contracts
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+
+SOLIDITY_SOURCES = ["contracts/Court.sol", "contracts/Havven.sol"]
+
+# Seconds between checks for new events.
+DEFAULT_POLL_INTERVAL = 5
+
+# The values of the Court's Vote enum.
+ABSTENTION, YEA, NAY = 0, 1, 2
+
+
+def vote_passes(votes_for, votes_against, havven_supply, required_participation, required_majority):
+    """Court.votePasses, computed from a motion's tallies and the Court's parameters."""
+    total = votes_for + votes_against
+    if total == 0:
+        return False
+    participation = total * UNIT // havven_supply
+    fraction_in_favour = votes_for * UNIT // total
+    return participation > required_participation and fraction_in_favour > required_majority
+
+
+class Motion:
+    """A confiscation motion against a target, as of the last event which touched it."""
+
+    def __init__(self, target, start_time):
+        self.target = target
+        self.start_time = start_time
+        self.votes_for = 0
+        self.votes_against = 0
+        # The voters currently counted in either tally, with the weight and direction of their vote.
+        self.voters = {}
+        # None while the motion is open; otherwise 'closed', 'vetoed' or 'approved'.
+        self.outcome = None
+
+
+class CourtIndex:
+    """An in-memory index of the Court's motions, built from its ConfiscationVote, VoteFor,
+    VoteAgainst, CancelledVote, VoteClosed, Veto and ConfiscationApproval events.
+    Each sync fetches the new logs in a single request, plus the timestamps of any blocks
+    in which motions began; the Court's parameters are read once per sync, whatever the
+    number of targets. Queries are answered from memory."""
+
+    def __init__(self, court, havven, from_block=0):
+        self.court = court
+        self.havven = havven
+        self.event_dict = generate_topic_event_map(court.abi)
+        self.next_block = from_block
+
+        # {target: Motion} for every motion begun, replaced when a new motion on the target begins.
+        self.motions = {}
+        # {voter: (vote, target, weight)} for the last vote cast by each account.
+        # The Court emits no event when a vote is cancelled after its motion concludes, so the
+        # entries of voters in concluded motions may linger after the Court has cleared them.
+        self.voters = {}
+        self.block_timestamps = {}
+        self.events_processed = 0
+        self.refresh_parameters()
+
+    def refresh_parameters(self):
+        """Read the Court's settings, which change without emitting events."""
+        self.voting_period = self.court.functions.votingPeriod().call()
+        self.confirmation_period = self.court.functions.confirmationPeriod().call()
+        self.required_participation = self.court.functions.requiredParticipation().call()
+        self.required_majority = self.court.functions.requiredMajority().call()
+        self.havven_supply = self.havven.functions.totalSupply().call()
+
+    def block_timestamp(self, block_number):
+        if block_number not in self.block_timestamps:
+            self.block_timestamps[block_number] = W3.eth.getBlock(block_number)['timestamp']
+        return self.block_timestamps[block_number]
+
+    def sync(self, to_block='latest'):
+        """Apply every Court event mined since the last sync. Returns the number of events applied."""
+        latest = W3.eth.blockNumber if to_block == 'latest' else to_block
+        if latest < self.next_block:
+            return 0
+        logs = W3.eth.getLogs({'address': self.court.address, 'fromBlock': self.next_block, 'toBlock': latest})
+        applied = 0
+        for log in sorted(logs, key=lambda log: (log.blockNumber, log.logIndex)):
+            event = get_event_data_from_log(self.event_dict, log)
+            if event is not None:
+                self.apply(event, log.blockNumber)
+                applied += 1
+        self.next_block = latest + 1
+        self.events_processed += applied
+        self.refresh_parameters()
+        return applied
+
+    def apply(self, event, block_number):
+        name, args = event['event'], event['args']
+        if name == 'ConfiscationVote':
+            self.motions[args['target']] = Motion(args['target'], self.block_timestamp(block_number))
+        elif name in ('VoteFor', 'VoteAgainst'):
+            motion = self.motions[args['target']]
+            vote = YEA if name == 'VoteFor' else NAY
+            if vote == YEA:
+                motion.votes_for += args['balance']
+            else:
+                motion.votes_against += args['balance']
+            motion.voters[args['account']] = (vote, args['balance'])
+            self.voters[args['account']] = (vote, args['target'], args['balance'])
+        elif name == 'CancelledVote':
+            # As on chain, the voter's last vote is deducted, even if it was cast in an
+            # earlier motion against the same target.
+            motion = self.motions[args['target']]
+            vote, _, weight = self.voters.pop(args['account'])
+            if vote == YEA:
+                motion.votes_for -= weight
+            else:
+                motion.votes_against -= weight
+            motion.voters.pop(args['account'], None)
+        elif name == 'VoteClosed':
+            # Closing resets the tallies on chain; they are kept here as the motion's result.
+            self.motions[args['target']].outcome = 'closed'
+        elif name == 'Veto':
+            self.motions[args['target']].outcome = 'vetoed'
+        elif name == 'ConfiscationApproval':
+            self.motions[args['target']].outcome = 'approved'
+
+    def voting_deadline(self, target):
+        return self.motions[target].start_time + self.voting_period
+
+    def confirmation_deadline(self, target):
+        return self.voting_deadline(target) + self.confirmation_period
+
+    def phase(self, target, now):
+        """'voting', 'confirming' or 'waiting', as the Court's views of the same names would report."""
+        motion = self.motions.get(target)
+        if motion is None or motion.outcome is not None:
+            return 'waiting'
+        if now < self.voting_deadline(target):
+            return 'voting'
+        if now < self.confirmation_deadline(target):
+            return 'confirming'
+        return 'waiting'
+
+    def passes(self, motion):
+        """Court.votePasses, computed from the indexed tallies."""
+        return motion.outcome is None and vote_passes(motion.votes_for, motion.votes_against, self.havven_supply,
+                                                      self.required_participation, self.required_majority)
+
+    def open_motions(self, now=None):
+        """{target: phase} for every motion still voting or awaiting confirmation."""
+        if now is None:
+            now = W3.eth.getBlock('latest')['timestamp']
+        phases = {target: self.phase(target, now) for target in self.motions}
+        return {target: phase for target, phase in phases.items() if phase != 'waiting'}
+
+    def passing_motions(self, now=None):
+        """The targets of every open motion which would pass if it ended now."""
+        return sorted(target for target in self.open_motions(now) if self.passes(self.motions[target]))
+
+    def closable_motions(self, now=None):
+        """The targets of every motion which Court.closeVote would accept and which has not been
+        closed: those which have run their course, and those awaiting confirmation which failed."""
+        if now is None:
+            now = W3.eth.getBlock('latest')['timestamp']
+        return sorted(target for target, motion in self.motions.items()
+                      if motion.outcome is None and (self.phase(target, now) == 'waiting' or
+                                                     (self.phase(target, now) == 'confirming' and
+                                                      not self.passes(motion))))
+
+    def poll(self, interval=DEFAULT_POLL_INTERVAL):
+        while True:
+            if self.sync():
+                now = W3.eth.getBlock('latest')['timestamp']
+                for target, phase in sorted(self.open_motions(now).items()):
+                    motion = self.motions[target]
+                    status = "passing" if self.passes(motion) else "failing"
+                    deadline = self.voting_deadline(target) if phase == 'voting' else self.confirmation_deadline(target)
+                    print(f"{target}: {phase} until {deadline}, {status} "
+                          f"({motion.votes_for / UNIT} for, {motion.votes_against / UNIT} against)")
+            time.sleep(interval)
+
+
+def parse_args():
+    parser = ArgumentParser(description="Follow the Court's confiscation motions from its events.")
+    parser.add_argument("--court", required=True, help="the address of the Court contract")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--from-block", type=int, default=0, help="the block the Court was deployed in")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between checks for new events")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    court = W3.eth.contract(address=args.court, abi=compiled['Court']['abi'])
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    index = CourtIndex(court, havven, args.from_block)
+    try:
+        index.poll(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
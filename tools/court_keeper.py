@@ -0,0 +1,125 @@
+# The court keeper: closes Court motions which have run their course, or which failed and await
+# confirmation, many to a transaction with Court.closeVotes. Stale motions are found from the
+# Court's events, or from bulk reads of a list of suspected targets.
+# Run with: python3 -m tools.court_keeper --court ADDRESS --havven ADDRESS --keeper ACCOUNT
+#           [--targets FILE | --from-block N]
+
+import time
+from argparse import ArgumentParser
+
+from utils.deployutils import W3, compile_contracts
+from utils.batchutils import gas_bounded_chunks, submit_chunks, read_uints
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+from tools.court_index import CourtIndex, vote_passes, SOLIDITY_SOURCES
+
+# Seconds between searches for motions to close.
+DEFAULT_INTERVAL = 60 * 60
+
+
+def closable_targets(court, havven, targets, now=None):
+    """Those of the given targets whose motions closeVote would accept and which have not been
+    closed, read with a few batched requests rather than several calls per target."""
+    if now is None:
+        now = W3.eth.getBlock('latest')['timestamp']
+    targets = list(targets)
+    voting_period, confirmation_period, required_participation, required_majority, havven_supply = read_uints(
+        [(court, 'votingPeriod', []), (court, 'confirmationPeriod', []), (court, 'requiredParticipation', []),
+         (court, 'requiredMajority', []), (havven, 'totalSupply', [])])
+    values = read_uints([(court, name, [target]) for target in targets
+                         for name in ['voteStartTimes', 'votesFor', 'votesAgainst']])
+
+    closable = []
+    for i, target in enumerate(targets):
+        start_time, votes_for, votes_against = values[3 * i:3 * i + 3]
+        if start_time == 0:
+            continue
+        voting_deadline = start_time + voting_period
+        if now >= voting_deadline + confirmation_period:
+            closable.append(target)
+        elif now >= voting_deadline and not vote_passes(votes_for, votes_against, havven_supply,
+                                                        required_participation, required_majority):
+            closable.append(target)
+    return closable
+
+
+class CourtKeeper:
+    """Closes stale motions in gas-bounded batches, finding them either with a CourtIndex,
+    or, if given a list of targets instead, by reading their state in bulk."""
+
+    def __init__(self, court, havven, keeper, index=None, targets=None, gas_budget=None):
+        if (index is None) == (targets is None):
+            raise Exception("The keeper needs either a Court index or a list of targets, but not both.")
+        self.court = court
+        self.havven = havven
+        self.keeper = keeper
+        self.index = index
+        self.targets = targets
+        self.gas_budget = gas_budget
+        self.event_dict = generate_topic_event_map(court.abi)
+        self.closed = 0
+        self.transactions = 0
+
+    def find(self):
+        if self.index is not None:
+            self.index.sync()
+            return self.index.closable_motions()
+        return closable_targets(self.court, self.havven, self.targets)
+
+    def close(self, targets):
+        """Close the given motions, returning the targets whose motions were closed."""
+        make_call = lambda chunk: self.court.functions.closeVotes(chunk)
+        receipts = submit_chunks(gas_bounded_chunks(targets, make_call, self.keeper, self.gas_budget),
+                                 make_call, self.keeper)
+        closed = []
+        for receipt in receipts:
+            for log in receipt.logs:
+                event = get_event_data_from_log(self.event_dict, log)
+                if event is not None and event['event'] == 'VoteClosed':
+                    closed.append(event['args']['target'])
+        self.closed += len(closed)
+        self.transactions += len(receipts)
+        return closed
+
+    def step(self):
+        targets = self.find()
+        return self.close(targets) if targets else []
+
+    def run(self, interval=DEFAULT_INTERVAL):
+        while True:
+            closed = self.step()
+            if closed:
+                print(f"Closed {len(closed)} motions: {', '.join(closed)}")
+            time.sleep(interval)
+
+
+def read_targets(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Close Court motions which have run their course.")
+    parser.add_argument("--court", required=True, help="the address of the Court contract")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--keeper", required=True, help="the account sending the transactions, which must be unlocked")
+    parser.add_argument("--targets", help="a file of suspected targets to check, one per line, "
+                                          "rather than following the Court's events")
+    parser.add_argument("--from-block", type=int, default=0, help="the block the Court was deployed in")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL,
+                        help="seconds between searches for motions to close")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    court = W3.eth.contract(address=args.court, abi=compiled['Court']['abi'])
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    if args.targets:
+        keeper = CourtKeeper(court, havven, args.keeper, targets=read_targets(args.targets))
+    else:
+        keeper = CourtKeeper(court, havven, args.keeper, index=CourtIndex(court, havven, args.from_block))
+    try:
+        keeper.run(args.interval)
+    except KeyboardInterrupt:
+        print(f"\nClosed {keeper.closed} motions in {keeper.transactions} transactions.")
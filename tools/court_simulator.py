@@ -0,0 +1,150 @@
+# The court simulator: loads the vote weight of every holder once, then evaluates how Court.votePasses
+# would decide thousands of hypothetical votes, without sending a transaction for any of them.
+# Run with: python3 -m tools.court_simulator --court ADDRESS --havven ADDRESS --holders FILE
+#
+# Weights are held as floating point numbers of havvens, so outcomes within a few parts in 10^15 of
+# a threshold may differ from the contract's fixed point arithmetic.
+
+from argparse import ArgumentParser
+
+import numpy as np
+
+from utils.deployutils import W3, UNIT, compile_contracts
+from utils.batchutils import read_uints
+from tools.court_index import SOLIDITY_SOURCES
+
+DEFAULT_TRIALS = 1000
+
+# The turnouts and shares of votes in favour simulated by default.
+DEFAULT_TURNOUTS = np.linspace(0.05, 1, 20)
+DEFAULT_YEA_SHARES = np.linspace(0.05, 1, 20)
+
+
+class CourtModel:
+    """The weights of a set of holders in a motion, with the Court's thresholds, from which
+    the outcome of any combination of their votes can be computed in bulk."""
+
+    def __init__(self, holders, weights, havven_supply, required_participation, required_majority):
+        self.holders = list(holders)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.havven_supply = float(havven_supply)
+        self.required_participation = float(required_participation)
+        self.required_majority = float(required_majority)
+
+    @classmethod
+    def from_chain(cls, court, havven, holders, vote_start_time=None):
+        """Read every holder's weight for a motion beginning at the given time (by default, now),
+        choosing between the last and penultimate average balances as Court.voteSetup does."""
+        if vote_start_time is None:
+            vote_start_time = W3.eth.getBlock('latest')['timestamp']
+        holders = list(holders)
+        fee_period_start, supply, participation, majority = read_uints(
+            [(havven, 'feePeriodStartTime', []), (havven, 'totalSupply', []),
+             (court, 'requiredParticipation', []), (court, 'requiredMajority', [])])
+        balance = 'penultimateAverageBalance' if vote_start_time < fee_period_start else 'lastAverageBalance'
+        weights = read_uints([(havven, balance, [holder]) for holder in holders])
+        return cls(holders, [weight / UNIT for weight in weights], supply / UNIT,
+                   participation / UNIT, majority / UNIT)
+
+    def passes(self, yeas, nays):
+        """Court.votePasses for arrays of yea and nay tallies, in havvens."""
+        yeas, nays = np.asarray(yeas, dtype=np.float64), np.asarray(nays, dtype=np.float64)
+        total = yeas + nays
+        with np.errstate(divide='ignore', invalid='ignore'):
+            in_favour = np.where(total > 0, yeas / total, 0)
+        return (total > 0) & (total / self.havven_supply > self.required_participation) & \
+            (in_favour > self.required_majority)
+
+    def tally(self, votes):
+        """The yea and nay tallies of each row of votes, one column per holder: 1 for yea,
+        -1 for nay and 0 for an abstention."""
+        votes = np.asarray(votes)
+        return (votes == 1) @ self.weights, (votes == -1) @ self.weights
+
+    def outcomes(self, votes):
+        """Whether the motion passes for each row of votes."""
+        return self.passes(*self.tally(votes))
+
+    def simulate(self, turnout, yea_share, trials=DEFAULT_TRIALS, rng=None):
+        """The fraction of trials in which the motion passes when each holder votes independently
+        with the given probability, and votes yea with the given probability if it votes."""
+        rng = np.random.default_rng() if rng is None else rng
+        shape = (trials, len(self.weights))
+        votes = np.where(rng.random(shape) < turnout, np.where(rng.random(shape) < yea_share, 1, -1), 0)
+        return self.outcomes(votes).mean()
+
+    def surface(self, turnouts=DEFAULT_TURNOUTS, yea_shares=DEFAULT_YEA_SHARES, trials=DEFAULT_TRIALS, seed=0):
+        """The probability of passing for each turnout (rows) and share of voters in favour (columns)."""
+        rng = np.random.default_rng(seed)
+        return np.array([[self.simulate(turnout, yea_share, trials, rng) for yea_share in yea_shares]
+                         for turnout in turnouts])
+
+    def swing_voters(self, votes):
+        """The holders who, by changing their vote alone, would change the outcome of the given votes.
+        Returns {holder: the votes (1, -1 or 0) which would change it}."""
+        votes = np.asarray(votes)
+        yeas, nays = self.tally(votes[np.newaxis, :])
+        outcome = self.passes(yeas, nays)[0]
+        # Remove each holder's current vote, then try each alternative for every holder at once.
+        base_yeas = yeas[0] - np.where(votes == 1, self.weights, 0)
+        base_nays = nays[0] - np.where(votes == -1, self.weights, 0)
+        swings = {}
+        for vote, add_yeas, add_nays in [(1, self.weights, 0), (-1, 0, self.weights), (0, 0, 0)]:
+            changed = (self.passes(base_yeas + add_yeas, base_nays + add_nays) != outcome) & (votes != vote)
+            for i in np.flatnonzero(changed):
+                swings.setdefault(self.holders[i], []).append(vote)
+        return swings
+
+    def minimum_passing_coalition(self):
+        """The fewest holders whose votes in favour, with every other holder abstaining, pass a motion;
+        None if not even every holder together can."""
+        cumulative = np.cumsum(np.sort(self.weights)[::-1])
+        passing = np.flatnonzero(self.passes(cumulative, np.zeros_like(cumulative)))
+        return int(passing[0]) + 1 if len(passing) else None
+
+    def minimum_blocking_coalition(self):
+        """The fewest holders whose votes against defeat a motion every other holder votes for;
+        0 if it fails even then, and None if no coalition can defeat it."""
+        total = self.weights.sum()
+        if not self.passes(total, 0):
+            return 0
+        cumulative = np.cumsum(np.sort(self.weights)[::-1])
+        blocking = np.flatnonzero(~self.passes(total - cumulative, cumulative))
+        return int(blocking[0]) + 1 if len(blocking) else None
+
+
+def format_surface(surface, turnouts=DEFAULT_TURNOUTS, yea_shares=DEFAULT_YEA_SHARES):
+    lines = ["turnout \\ yea  " + " ".join(f"{share:4.2f}" for share in yea_shares)]
+    for turnout, row in zip(turnouts, surface):
+        lines.append(f"{turnout:13.2f}  " + " ".join(f"{p:4.2f}" for p in row))
+    return "\n".join(lines)
+
+
+def read_holders(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Simulate the outcomes of Court votes over the current holders.")
+    parser.add_argument("--court", required=True, help="the address of the Court contract")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--holders", required=True, help="a file listing the holders, one per line")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS, help="trials per turnout and majority")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for the simulated votes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    court = W3.eth.contract(address=args.court, abi=compiled['Court']['abi'])
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    model = CourtModel.from_chain(court, havven, read_holders(args.holders))
+
+    print(f"{len(model.holders)} holders with {model.weights.sum():.2f} of {model.havven_supply:.2f} havvens "
+          f"of voting weight.\n")
+    print("Probability of passing, by the chance each holder votes (rows) and votes in favour (columns):")
+    print(format_surface(model.surface(trials=args.trials, seed=args.seed)))
+    print(f"\nThe fewest holders who can pass a motion alone: {model.minimum_passing_coalition()}")
+    print(f"The fewest holders who can defeat a motion all others support: {model.minimum_blocking_coalition()}")
@@ -0,0 +1,234 @@
+# The distribution tool: pays out token sale allocations from a CSV file, either directly in havvens
+# or as vesting entries in the escrow contract, in as few transactions as the block gas limit allows.
+# Progress is kept in a journal, so an interrupted distribution can simply be run again; the journal
+# and the receipts of the transactions it records are the only record of which rows have been paid.
+# Run with: python3 -m tools.distribute allocations.csv --havven ADDRESS --escrow ADDRESS --owner ACCOUNT
+#
+# The CSV file has a header row naming its columns: account, quantity (in havvens) and, optionally,
+# vesting_time (a unix timestamp). Rows with a vesting time become vesting entries for that account;
+# the others are transferred to it directly.
+
+import csv
+import hashlib
+import json
+import os
+import time
+from argparse import ArgumentParser
+from collections import namedtuple
+from decimal import Decimal
+
+from utils.deployutils import W3, UNIT, POLLING_INTERVAL, BLOCKCHAIN_ADDRESS, compile_contracts, mine_txs
+from utils.batchutils import gas_bounded_chunks, transfer_batch_call, vesting_schedules_call, read_uints
+from utils.txutils import NonceManager, PendingTransactions, send_transaction, GAS_MARGIN
+
+SOLIDITY_SOURCES = ["contracts/Havven.sol", "contracts/HavvenEscrow.sol"]
+
+Allocation = namedtuple("Allocation", ["index", "account", "quantity", "vesting_time"])
+
+
+def read_allocations(path):
+    with open(path, newline='') as f:
+        return [Allocation(index, row['account'].strip(), int(Decimal(row['quantity']) * UNIT),
+                           int(row['vesting_time']) if row.get('vesting_time') else None)
+                for index, row in enumerate(csv.DictReader(f))]
+
+
+def allocations_digest(allocations):
+    """A hash of the allocations, so that a journal is only ever resumed with the file it was written for."""
+    return hashlib.sha256(json.dumps([list(allocation) for allocation in allocations]).encode()).hexdigest()
+
+
+class Journal:
+    """An append-only record of a distribution's progress, one JSON object per line,
+    flushed to disk as each is written, so that it survives an interruption at any point.
+    Each transaction is recorded with its nonce before it is sent, and with its hash once sent."""
+
+    def __init__(self, path):
+        self.path = path
+        self.digest = None
+        # {nonce: {'kind': ..., 'rows': [...], 'block': ..., 'tx': hash, once known}}, for the latest
+        # transaction recorded with each nonce; one which was never sent may be replaced by a later one.
+        self.submitted = {}
+        self.confirmed = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self.apply(json.loads(line))
+
+    def apply(self, entry):
+        if entry['type'] == 'allocations':
+            self.digest = entry['digest']
+        elif entry['type'] == 'submitting':
+            self.submitted[entry['nonce']] = {'kind': entry['kind'], 'rows': entry['rows'],
+                                              'block': entry['block'], 'tx': None}
+        elif entry['type'] == 'submitted':
+            self.submitted[entry['nonce']]['tx'] = entry['tx']
+        elif entry['type'] == 'confirmed':
+            self.confirmed.add(entry['tx'])
+
+    def write(self, entry):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.apply(entry)
+
+    def record_allocations(self, digest):
+        self.write({'type': 'allocations', 'digest': digest})
+
+    def record_submitting(self, nonce, block, kind, rows):
+        self.write({'type': 'submitting', 'nonce': nonce, 'block': block, 'kind': kind, 'rows': rows})
+
+    def record_submitted(self, nonce, tx_hash):
+        self.write({'type': 'submitted', 'nonce': nonce, 'tx': tx_hash})
+
+    def record_confirmed(self, tx_hash):
+        self.write({'type': 'confirmed', 'tx': tx_hash})
+
+
+class Distribution:
+    """Pays out a list of allocations, recording its progress in a journal.
+    Direct allocations are paid with Havven.transferBatch from the owner, and vesting allocations
+    are added with HavvenEscrow.addVestingSchedules; the owner and the escrow contract are first
+    endowed with whatever havvens they lack to cover them. The owner should send no other
+    transactions until the distribution is complete, as the journal identifies its transactions by nonce."""
+
+    def __init__(self, havven, escrow, owner, allocations, journal, gas_budget=None, address=BLOCKCHAIN_ADDRESS):
+        self.havven = havven
+        self.escrow = escrow
+        self.owner = owner
+        self.allocations = list(allocations)
+        self.journal = journal
+        self.gas_budget = gas_budget
+        self.address = address
+        self.nonces = NonceManager(owner)
+        self.failed = []
+
+    def find_transaction(self, nonce, from_block):
+        """The hash of the owner's transaction with the given nonce, mined at or after from_block,
+        or None if no transaction with that nonce was ever sent."""
+        if W3.eth.getTransactionCount(self.owner, 'pending') <= nonce:
+            return None
+        # Wait for a transaction still in the pool to be mined.
+        while W3.eth.getTransactionCount(self.owner) <= nonce:
+            time.sleep(POLLING_INTERVAL)
+        for number in range(from_block, W3.eth.blockNumber + 1):
+            for transaction in W3.eth.getBlock(number, True).transactions:
+                if transaction['from'] == self.owner and transaction['nonce'] == nonce:
+                    return W3.toHex(transaction['hash'])
+        raise Exception(f"No transaction from {self.owner} with nonce {nonce} was found after block {from_block}")
+
+    def completed_rows(self):
+        """Determine which allocations have already been paid, from the journal and the receipts of the
+        transactions it records. A transaction journalled before it was sent, but whose hash was never
+        recorded, is found on chain by its nonce."""
+        done = set()
+        for nonce, submission in self.journal.submitted.items():
+            tx_hash = submission['tx']
+            if tx_hash is None:
+                tx_hash = self.find_transaction(nonce, submission['block'])
+                if tx_hash is None:
+                    continue
+                self.journal.record_submitted(nonce, tx_hash)
+            if tx_hash not in self.journal.confirmed:
+                if W3.eth.getTransactionReceipt(tx_hash) is None and W3.eth.getTransaction(tx_hash) is not None:
+                    # Still waiting to be mined.
+                    mine_txs([tx_hash])
+                receipt = W3.eth.getTransactionReceipt(tx_hash)
+                if receipt is None or receipt.get('status', 1) == 0:
+                    continue
+                self.journal.record_confirmed(tx_hash)
+            done.update(submission['rows'])
+        return done
+
+    def fund(self, direct, vesting):
+        """Endow the owner and the escrow contract with any havvens they lack to cover the
+        outstanding allocations, and wait for the endowments to be mined."""
+        owner_balance, escrow_balance, committed = read_uints([
+            (self.havven, 'balanceOf', [self.owner]),
+            (self.havven, 'balanceOf', [self.escrow.address]),
+            (self.escrow, 'totalVestedBalance', [])], self.address)
+        shortfalls = [(self.owner, sum(a.quantity for a in direct) - owner_balance),
+                      (self.escrow.address, committed + sum(a.quantity for a in vesting) - escrow_balance)]
+        mine_txs([self.send('endow', self.havven.functions.endow(account, shortfall), [])
+                  for account, shortfall in shortfalls if shortfall > 0])
+
+    def send(self, kind, call, rows, gas=None):
+        """Send a transaction paying the given rows, journalling it under its nonce before it is sent.
+        Every transaction the owner sends is journalled, so that no other takes the nonce of one
+        which was journalled but never sent."""
+        nonce = self.nonces.allocate()
+        self.journal.record_submitting(nonce, W3.eth.blockNumber, kind, rows)
+        tx_hash = send_transaction(call, self.owner, self.nonces, gas=gas, nonce=nonce)
+        self.journal.record_submitted(nonce, W3.toHex(tx_hash))
+        return tx_hash
+
+    def submit(self, kind, allocations, make_call, pending):
+        """Send every gas-sized chunk of the allocations without waiting for any to be mined."""
+        for chunk, gas in gas_bounded_chunks(allocations, make_call, self.owner, self.gas_budget):
+            rows = [allocation.index for allocation in chunk]
+            pending.add(self.send(kind, make_call(chunk), rows, gas=int(gas * GAS_MARGIN)), rows)
+
+    def run(self):
+        """Pay every allocation not yet paid. Returns the number of allocations paid by this run."""
+        digest = allocations_digest(self.allocations)
+        if self.journal.digest is None:
+            self.journal.record_allocations(digest)
+        elif self.journal.digest != digest:
+            raise Exception(f"The journal {self.journal.path} was written for different allocations; "
+                            f"resume it with the file it was written for, or start a new journal.")
+
+        done = self.completed_rows()
+        outstanding = [a for a in self.allocations if a.index not in done]
+        direct = [a for a in outstanding if a.vesting_time is None]
+        # Each account's entries must be appended in increasing order of time.
+        vesting = sorted((a for a in outstanding if a.vesting_time is not None),
+                         key=lambda a: (a.account, a.vesting_time))
+        if not outstanding:
+            return 0
+        self.fund(direct, vesting)
+
+        pending = PendingTransactions()
+        self.submit('direct', direct, lambda chunk: transfer_batch_call(
+            self.havven, [(a.account, a.quantity) for a in chunk]), pending)
+        self.submit('vesting', vesting, lambda chunk: vesting_schedules_call(
+            self.escrow, [(a.account, a.vesting_time, a.quantity) for a in chunk]), pending)
+
+        paid = 0
+        while pending:
+            for tx_hash, receipt, latency, rows in pending.poll():
+                if receipt.get('status', 1) == 0:
+                    self.failed += rows
+                    continue
+                self.journal.record_confirmed(W3.toHex(tx_hash))
+                paid += len(rows)
+            if pending:
+                time.sleep(POLLING_INTERVAL)
+        return paid
+
+
+def parse_args():
+    parser = ArgumentParser(description="Distribute havvens and vesting entries from a CSV file of allocations.")
+    parser.add_argument("allocations", help="the CSV file of allocations")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--escrow", required=True, help="the address of the HavvenEscrow contract")
+    parser.add_argument("--owner", required=True, help="the owner of both contracts, which must be unlocked")
+    parser.add_argument("--journal", help="the journal file (by default, the CSV file's name with .journal appended)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    escrow = W3.eth.contract(address=args.escrow, abi=compiled['HavvenEscrow']['abi'])
+    allocations = read_allocations(args.allocations)
+    journal = Journal(args.journal or args.allocations + ".journal")
+
+    distribution = Distribution(havven, escrow, args.owner, allocations, journal)
+    start = time.time()
+    paid = distribution.run()
+    print(f"Paid {paid} of {len(allocations)} allocations in {time.time() - start:.1f}s.")
+    if distribution.failed:
+        print(f"Transactions paying rows {sorted(distribution.failed)} failed; run again to retry them.")
@@ -0,0 +1,203 @@
+# The fee ledger: follows the events which move nomins into and out of the fee pool, and keeps
+# running totals of them for each Havven fee period, so that the sources and destinations of
+# a period's fees can be reported without inspecting any transaction receipts.
+# Run with: python3 -m tools.fee_ledger --nomin ADDRESS --havven ADDRESS [--escrow ADDRESS] [--from-block N]
+
+import time
+from argparse import ArgumentParser
+
+from utils.deployutils import W3, UNIT, compile_contracts
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+
+SOLIDITY_SOURCES = ["contracts/EtherNomin.sol", "contracts/Havven.sol", "contracts/HavvenEscrow.sol"]
+
+# Seconds between checks for new events.
+DEFAULT_POLL_INTERVAL = 5
+
+
+class FeePeriod:
+    """The running totals of one fee period's movements into and out of the fee pool."""
+
+    def __init__(self, index, start_time, start_block, opening_pool):
+        self.index = index
+        # None for the period already under way when the ledger began.
+        self.start_time = start_time
+        self.start_block = start_block
+        self.end_time = None
+        self.opening_pool = opening_pool
+
+        # Into the pool.
+        self.transfer_fees = 0
+        self.fee_payments = 0
+        self.donations = 0
+        # Out of the pool, to havven holders and the escrow contract.
+        self.withdrawals = 0
+        # Of the withdrawals, those made through Havven.withdrawFeeEntitlement.
+        self.holder_withdrawals = 0
+        self.holder_withdrawal_count = 0
+        # Fees the escrow contract drew for its beneficiaries, and paid out to them.
+        self.escrow_contract_withdrawals = 0
+        self.escrow_withdrawals = 0
+
+        self.fees_by_payer = {}
+        self.withdrawals_by_account = {}
+
+    @property
+    def closing_pool(self):
+        return self.opening_pool + self.transfer_fees + self.donations - self.withdrawals
+
+    def report(self):
+        return {
+            'index': self.index,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'opening_pool': self.opening_pool,
+            'transfer_fees': self.transfer_fees,
+            'fee_payments': self.fee_payments,
+            'donations': self.donations,
+            'withdrawals': self.withdrawals,
+            'holder_withdrawals': self.holder_withdrawals,
+            'holder_withdrawal_count': self.holder_withdrawal_count,
+            'escrow_contract_withdrawals': self.escrow_contract_withdrawals,
+            'escrow_withdrawals': self.escrow_withdrawals,
+            'closing_pool': self.closing_pool,
+            'payers': len(self.fees_by_payer),
+            'withdrawers': len(self.withdrawals_by_account)
+        }
+
+
+class FeeLedger:
+    """A ledger of the nomin fee pool, built from EtherNomin's TransferFeePaid, FeeWithdrawal and
+    FeeDonation events, Havven's FeesWithdrawn and FeePeriodRollover events, and the escrow
+    contract's ContractFeesWithdrawn and FeesWithdrawn events. Each sync fetches only the logs
+    mined since the last one; every total is updated as its event is applied, so reports
+    take constant time, whatever the number of events behind them."""
+
+    def __init__(self, nomin, havven, escrow=None, from_block=0, opening_pool=0):
+        self.contracts = {'nomin': nomin, 'havven': havven}
+        if escrow is not None:
+            self.contracts['escrow'] = escrow
+        # Havven and the escrow contract both emit a FeesWithdrawn event, so logs are decoded
+        # with the events of the contract which emitted them.
+        self.event_dicts = {contract.address: (name, generate_topic_event_map(contract.abi))
+                            for name, contract in self.contracts.items()}
+        self.next_block = from_block
+
+        self.periods = [FeePeriod(0, None, from_block, opening_pool)]
+        self.fees_paid = {}
+        self.fees_withdrawn = {}
+        self.events_processed = 0
+        self.last_contract_withdrawal_tx = None
+
+    @property
+    def current(self):
+        return self.periods[-1]
+
+    @property
+    def pool(self):
+        """The fee pool's balance, as reconstructed from its events."""
+        return self.current.closing_pool
+
+    def sync(self, to_block='latest'):
+        """Apply every event mined since the last sync, in the order they were emitted.
+        Returns the number of events applied."""
+        latest = W3.eth.blockNumber if to_block == 'latest' else to_block
+        if latest < self.next_block:
+            return 0
+        logs = []
+        for contract in self.contracts.values():
+            logs += W3.eth.getLogs({'address': contract.address, 'fromBlock': self.next_block, 'toBlock': latest})
+        applied = 0
+        for log in sorted(logs, key=lambda log: (log.blockNumber, log.logIndex)):
+            name, event_dict = self.event_dicts[log.address]
+            event = get_event_data_from_log(event_dict, log)
+            if event is not None and self.apply(name, event, log):
+                applied += 1
+        self.next_block = latest + 1
+        self.events_processed += applied
+        return applied
+
+    def apply(self, contract, event, log):
+        """Add an event to the current period's totals. Returns whether the event was relevant."""
+        name, args = event['event'], event['args']
+        period = self.current
+        if contract == 'nomin' and name == 'TransferFeePaid':
+            account, value = args['account'], args['value']
+            period.transfer_fees += value
+            period.fee_payments += 1
+            period.fees_by_payer[account] = period.fees_by_payer.get(account, 0) + value
+            self.fees_paid[account] = self.fees_paid.get(account, 0) + value
+        elif contract == 'nomin' and name == 'FeeDonation':
+            period.donations += args['value']
+        elif contract == 'nomin' and name == 'FeeWithdrawal':
+            account, value = args['account'], args['value']
+            period.withdrawals += value
+            period.withdrawals_by_account[account] = period.withdrawals_by_account.get(account, 0) + value
+            self.fees_withdrawn[account] = self.fees_withdrawn.get(account, 0) + value
+        elif contract == 'havven' and name == 'FeesWithdrawn':
+            period.holder_withdrawals += args['fees']
+            period.holder_withdrawal_count += 1
+        elif contract == 'havven' and name == 'FeePeriodRollover':
+            period.end_time = args['timestamp']
+            self.periods.append(FeePeriod(period.index + 1, args['timestamp'], log.blockNumber, period.closing_pool))
+        elif contract == 'escrow' and name == 'ContractFeesWithdrawn':
+            # HavvenEscrow.withdrawFees emits this event twice for a single withdrawal.
+            if log.transactionHash == self.last_contract_withdrawal_tx:
+                return False
+            self.last_contract_withdrawal_tx = log.transactionHash
+            period.escrow_contract_withdrawals += args['value']
+        elif contract == 'escrow' and name == 'FeesWithdrawn':
+            period.escrow_withdrawals += args['value']
+        else:
+            return False
+        return True
+
+    def report(self, index=-1):
+        """The totals of a fee period: by default, the current one."""
+        return self.periods[index].report()
+
+    def poll(self, interval=DEFAULT_POLL_INTERVAL):
+        while True:
+            if self.sync():
+                print(format_report(self.report()))
+            time.sleep(interval)
+
+
+def format_report(report):
+    start = "before the ledger began" if report['start_time'] is None else f"at {report['start_time']}"
+    lines = [f"Fee period {report['index']}, starting {start}:",
+             f"  opening pool          {report['opening_pool'] / UNIT:.6f}",
+             f"  transfer fees         {report['transfer_fees'] / UNIT:.6f} "
+             f"({report['fee_payments']} payments by {report['payers']} accounts)",
+             f"  donations             {report['donations'] / UNIT:.6f}",
+             f"  withdrawals           {report['withdrawals'] / UNIT:.6f} (to {report['withdrawers']} accounts)",
+             f"    by havven holders   {report['holder_withdrawals'] / UNIT:.6f} "
+             f"({report['holder_withdrawal_count']} withdrawals)",
+             f"    by escrow contract  {report['escrow_contract_withdrawals'] / UNIT:.6f}",
+             f"  paid out of escrow    {report['escrow_withdrawals'] / UNIT:.6f}",
+             f"  closing pool          {report['closing_pool'] / UNIT:.6f}"]
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = ArgumentParser(description="Follow the nomin fee pool's movements by fee period.")
+    parser.add_argument("--nomin", required=True, help="the address of the EtherNomin contract")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--escrow", help="the address of the HavvenEscrow contract")
+    parser.add_argument("--from-block", type=int, default=0, help="the block the nomin contract was deployed in")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between checks for new events")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    nomin = W3.eth.contract(address=args.nomin, abi=compiled['EtherNomin']['abi'])
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    escrow = W3.eth.contract(address=args.escrow, abi=compiled['HavvenEscrow']['abi']) if args.escrow else None
+    ledger = FeeLedger(nomin, havven, escrow, args.from_block)
+    try:
+        ledger.poll(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
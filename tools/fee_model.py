@@ -0,0 +1,277 @@
+# The fee model: reference implementations, in integer arithmetic, of Havven's three-period fee
+# bookkeeping and of the fee accumulator in AccumulatorHavven, which can be run side by side over
+# the same schedule of transfers, fees, rollovers and withdrawals to compare what each pays out.
+# Run with: python3 -m tools.fee_model [--holders N] [--periods N] [--idle FRACTION] [--seed N]
+
+import random
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+
+UNIT = 10**18
+
+# The holder of the havvens not yet endowed, standing for the Havven contract itself.
+HAVVEN = "havven"
+
+SUPPLY = 10**8 * UNIT
+TARGET_FEE_PERIOD_DURATION = 4 * 7 * 24 * 60 * 60
+
+
+def dec_mul(x, y):
+    return x * y // UNIT
+
+
+def dec_div(x, y):
+    return x * UNIT // y
+
+
+class FeeModel(ABC):
+    """The balances and fee periods shared by both fee distribution schemes. Each scheme
+    brings an account's fee information up to date in adjust, as the contracts do in
+    adjustFeeEntitlement, and pays out in withdraw."""
+
+    def __init__(self, now, supply=SUPPLY, target_duration=TARGET_FEE_PERIOD_DURATION):
+        self.supply = supply
+        self.target_duration = target_duration
+        self.balances = {HAVVEN: supply}
+        # The nomin fee pool.
+        self.pool = 0
+        self.fee_period_start = now
+        self.last_fee_period_start = now - target_duration
+        self.penultimate_fee_period_start = now - 2 * target_duration
+        self.last_fees_collected = 0
+        self.balance_sums = {}
+        self.last_transfer = {HAVVEN: now}
+        self.paid = {}
+
+    def balance(self, account):
+        return self.balances.get(account, 0)
+
+    def check_rollover(self, now):
+        """Havven.checkFeePeriodRollover. Returns whether the fee period rolled over."""
+        if self.fee_period_start + self.target_duration > now:
+            return False
+        self.last_fees_collected = self.pool
+        self.penultimate_fee_period_start = self.last_fee_period_start
+        self.last_fee_period_start = self.fee_period_start
+        self.fee_period_start = now
+        return True
+
+    def transfer(self, sender, recipient, value, now):
+        self.check_rollover(now)
+        sender_pre_balance, recipient_pre_balance = self.balance(sender), self.balance(recipient)
+        if value > sender_pre_balance:
+            raise ValueError(f"{sender} has only {sender_pre_balance} havvens")
+        self.balances[sender] = sender_pre_balance - value
+        self.balances[recipient] = self.balance(recipient) + value
+        self.adjust(sender, sender_pre_balance, now)
+        self.adjust(recipient, recipient_pre_balance, now)
+
+    def endow(self, account, value, now):
+        self.transfer(HAVVEN, account, value, now)
+
+    def add_fees(self, value):
+        self.pool += value
+
+    def pay(self, account, fees):
+        self.pool -= fees
+        self.paid[account] = self.paid.get(account, 0) + fees
+        return fees
+
+    def accumulate(self, account, pre_balance, now):
+        self.balance_sums[account] = self.balance_sums.get(account, 0) + \
+            pre_balance * (now - self.last_transfer.get(account, 0))
+        self.last_transfer[account] = now
+
+    @abstractmethod
+    def adjust(self, account, pre_balance, now):
+        pass
+
+    @abstractmethod
+    def withdraw(self, account, now):
+        pass
+
+
+class ThreePeriodModel(FeeModel):
+    """Havven's fee bookkeeping: an account is paid its average balance over the last fee period
+    times the fees in the pool when that period closed, once per period. Whatever is not
+    withdrawn in a period stays in the pool for the next."""
+
+    def __init__(self, now, supply=SUPPLY, target_duration=TARGET_FEE_PERIOD_DURATION):
+        super().__init__(now, supply, target_duration)
+        self.last_average_balances = {}
+        self.penultimate_average_balances = {}
+        self.has_withdrawn = set()
+
+    def rollover_fee(self, account, last_transfer, pre_balance):
+        """Havven.rolloverFee."""
+        if last_transfer >= self.fee_period_start:
+            return
+        balance_sum = self.balance_sums.get(account, 0)
+        if last_transfer < self.last_fee_period_start:
+            if last_transfer < self.penultimate_fee_period_start:
+                penultimate_average = pre_balance
+            else:
+                penultimate_average = (balance_sum + pre_balance * (self.last_fee_period_start - last_transfer)) // \
+                    (self.last_fee_period_start - self.penultimate_fee_period_start)
+            last_average = pre_balance
+        else:
+            penultimate_average = self.last_average_balances.get(account, 0)
+            last_average = (balance_sum + pre_balance * (self.fee_period_start - last_transfer)) // \
+                (self.fee_period_start - self.last_fee_period_start)
+        self.last_average_balances[account] = last_average
+        self.penultimate_average_balances[account] = penultimate_average
+        self.balance_sums[account] = 0
+        self.last_transfer[account] = self.fee_period_start
+        self.has_withdrawn.discard(account)
+
+    def adjust(self, account, pre_balance, now):
+        self.rollover_fee(account, self.last_transfer.get(account, 0), pre_balance)
+        self.accumulate(account, pre_balance, now)
+
+    def withdraw(self, account, now):
+        """Havven.withdrawFeeEntitlement, except that a second withdrawal in a period pays nothing
+        rather than reverting."""
+        self.check_rollover(now)
+        self.rollover_fee(account, self.last_transfer.get(account, 0), self.balance(account))
+        if account in self.has_withdrawn:
+            return 0
+        self.has_withdrawn.add(account)
+        fees = dec_div(dec_mul(self.last_average_balances.get(account, 0), self.last_fees_collected), self.supply)
+        return self.pay(account, fees)
+
+
+class AccumulatorModel(FeeModel):
+    """AccumulatorHavven's fee engine: the fees not already owed are shared out at the end of each
+    period, and an account accrues its share of every closed period, however long it was idle."""
+
+    def __init__(self, now, supply=SUPPLY, target_duration=TARGET_FEE_PERIOD_DURATION):
+        super().__init__(now, supply, target_duration)
+        # (fees, start time, end time) of each closed period.
+        self.fee_periods = []
+        self.cumulative_fees_per_havven = [0]
+        self.fees_owed = 0
+        self.accrued = {}
+        self.accrual_periods = {}
+
+    def check_rollover(self, now):
+        closed_period_start = self.fee_period_start
+        if not super().check_rollover(now):
+            return False
+        fees = self.last_fees_collected - self.fees_owed
+        self.fee_periods.append((fees, closed_period_start, self.fee_period_start))
+        self.cumulative_fees_per_havven.append(self.cumulative_fees_per_havven[-1] + dec_div(fees, self.supply))
+        self.fees_owed += fees
+        # The share of the havvens not yet endowed returns to the pool.
+        self.accrue(HAVVEN, self.balance(HAVVEN), now)
+        self.fees_owed -= self.accrued.pop(HAVVEN, 0)
+        return True
+
+    def pending_fees(self, account, pre_balance):
+        """AccumulatorHavven.pendingFees."""
+        period = self.accrual_periods.get(account, 0)
+        current = len(self.fee_periods)
+        if period == current:
+            return 0
+        fees, start, end = self.fee_periods[period]
+        balance_sum = self.balance_sums.get(account, 0) + pre_balance * (end - self.last_transfer.get(account, 0))
+        return balance_sum * fees // (self.supply * (end - start)) + \
+            dec_mul(pre_balance, self.cumulative_fees_per_havven[current] -
+                    self.cumulative_fees_per_havven[period + 1])
+
+    def fees_available(self, account):
+        return self.accrued.get(account, 0) + self.pending_fees(account, self.balance(account))
+
+    def accrue(self, account, pre_balance, now):
+        current = len(self.fee_periods)
+        if self.accrual_periods.get(account, 0) != current:
+            self.accrued[account] = self.accrued.get(account, 0) + self.pending_fees(account, pre_balance)
+            self.accrual_periods[account] = current
+            self.balance_sums[account] = 0
+            self.last_transfer[account] = self.fee_period_start
+        self.accumulate(account, pre_balance, now)
+
+    def adjust(self, account, pre_balance, now):
+        self.accrue(account, pre_balance, now)
+
+    def withdraw(self, account, now):
+        self.check_rollover(now)
+        self.accrue(account, self.balance(account), now)
+        fees = self.accrued.pop(account, 0)
+        self.fees_owed -= fees
+        return self.pay(account, fees)
+
+
+def random_schedule(holders, periods, idle_fraction=0.25, seed=0, start=0,
+                    period_duration=TARGET_FEE_PERIOD_DURATION):
+    """A schedule of (time, action, args) events over some fee periods: the holders are endowed,
+    then in each period fees are collected and some havvens change hands, and every holder
+    withdraws after the period closes, except the idle ones, who only withdraw at the end."""
+    rng = random.Random(seed)
+    accounts = [f"holder{i}" for i in range(holders)]
+    idle = set(rng.sample(accounts, int(holders * idle_fraction)))
+    now = start + 1
+    events = []
+    for account in accounts:
+        events.append((now, 'endow', (account, rng.randint(1, 10**6) * UNIT)))
+        now += 1
+    for _ in range(periods):
+        period_end = now + period_duration
+        while now < period_end - period_duration // 10:
+            now += rng.randint(1, period_duration // 10)
+            sender, recipient = rng.sample([a for a in accounts if a not in idle], 2)
+            events.append((now, 'transfer', (sender, recipient, rng.randint(0, 1000) * UNIT)))
+            events.append((now, 'fees', (rng.randint(1, 100) * UNIT,)))
+        now = period_end + 1
+        for account in accounts:
+            if account not in idle:
+                events.append((now, 'withdraw', (account,)))
+                now += 1
+    for account in sorted(idle):
+        events.append((now, 'withdraw', (account,)))
+        now += 1
+    return events, accounts, idle
+
+
+def run_schedule(model, events):
+    """Apply a schedule to a model, clamping transfers to the sender's balance."""
+    for now, action, args in events:
+        if action == 'endow':
+            model.endow(*args, now)
+        elif action == 'transfer':
+            sender, recipient, value = args
+            model.transfer(sender, recipient, min(value, model.balance(sender)), now)
+        elif action == 'fees':
+            model.add_fees(*args)
+        elif action == 'withdraw':
+            model.withdraw(*args, now)
+    return model
+
+
+def compare(events, accounts, start=0):
+    """Run a schedule under both schemes, returning {account: (three-period total, accumulator total)}."""
+    three_period = run_schedule(ThreePeriodModel(start), events)
+    accumulator = run_schedule(AccumulatorModel(start), events)
+    return {account: (three_period.paid.get(account, 0), accumulator.paid.get(account, 0)) for account in accounts}
+
+
+def parse_args():
+    parser = ArgumentParser(description="Compare the fees paid out by the three-period and accumulator schemes.")
+    parser.add_argument("--holders", type=int, default=20, help="the number of havven holders")
+    parser.add_argument("--periods", type=int, default=6, help="the number of fee periods")
+    parser.add_argument("--idle", type=float, default=0.25,
+                        help="the fraction of holders who neither transfer nor withdraw until the end")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for the schedule")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    events, accounts, idle = random_schedule(args.holders, args.periods, args.idle, args.seed)
+    results = compare(events, accounts)
+    print(f"{'holder':>10} {'three-period':>16} {'accumulator':>16}")
+    for account in accounts:
+        three_period, accumulator = results[account]
+        marker = " (idle)" if account in idle else ""
+        print(f"{account:>10} {three_period / UNIT:16.6f} {accumulator / UNIT:16.6f}{marker}")
+    print(f"{'total':>10} {sum(r[0] for r in results.values()) / UNIT:16.6f} "
+          f"{sum(r[1] for r in results.values()) / UNIT:16.6f}")
@@ -0,0 +1,139 @@
+# The fee withdrawer: withdraws the last fee period's fees on behalf of many havven holders, many
+# to a transaction with Havven.withdrawFeeEntitlements. Each holder must first have authorised the
+# operator with Havven.setFeeWithdrawalDelegate; the fees are still deposited in their own accounts.
+# The holders with fees to withdraw, who have authorised the operator, are found by reading their
+# fee state and delegates in bulk.
+# Run with: python3 -m tools.fee_withdrawer --havven ADDRESS --nomin ADDRESS --operator ACCOUNT --accounts FILE
+
+import time
+from argparse import ArgumentParser
+
+from utils.deployutils import W3, UNIT, compile_contracts
+from utils.batchutils import gas_bounded_chunks, submit_chunks, read_uints
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+
+SOLIDITY_SOURCES = ["contracts/Havven.sol", "contracts/EtherNomin.sol"]
+
+# Seconds between searches for fees to withdraw.
+DEFAULT_INTERVAL = 60 * 60
+
+# The per-account reads made by unclaimed_accounts, in order.
+ACCOUNT_READS = ['hasWithdrawnLastPeriodFees', 'lastTransferTimestamp', 'lastAverageBalance',
+                 'currentBalanceSum', 'balanceOf', 'feeWithdrawalDelegate']
+
+
+def address_value(address):
+    """An address as an integer, whether read in a batch, which yields integers, or by a call."""
+    return int(address, 16) if isinstance(address, str) else address
+
+
+def unclaimed_accounts(havven, nomin, accounts, operator):
+    """Those of the given accounts which have fees from the last period they have not withdrawn,
+    and which the operator may withdraw for, read with a few batched requests rather than several
+    calls per account. Frozen accounts, which withdrawFeeEntitlements would skip, are left out, as
+    are accounts which have not authorised the operator, which would make it revert."""
+    accounts = list(accounts)
+    operator = address_value(operator)
+    fee_period_start, last_fee_period_start, last_fees_collected = read_uints(
+        [(havven, 'feePeriodStartTime', []), (havven, 'lastFeePeriodStartTime', []),
+         (havven, 'lastFeesCollected', [])])
+    if not last_fees_collected:
+        return []
+    values = read_uints([(havven, name, [account]) for account in accounts for name in ACCOUNT_READS])
+    frozen = read_uints([(nomin, 'isFrozen', [account]) for account in accounts])
+
+    n = len(ACCOUNT_READS)
+    unclaimed = []
+    for i, account in enumerate(accounts):
+        has_withdrawn, last_transfer, last_average, balance_sum, balance, delegate = values[n * i:n * i + n]
+        if frozen[i] or operator not in (address_value(account), address_value(delegate)):
+            continue
+        if last_transfer < fee_period_start:
+            # The fee period has rolled over since the account last transferred, so withdrawing
+            # first works out its average balance over the last period, from its balance sum if
+            # it transferred during that period, and from its constant balance otherwise.
+            owed = balance or (last_transfer >= last_fee_period_start and balance_sum)
+        else:
+            owed = not has_withdrawn and last_average
+        if owed:
+            unclaimed.append(account)
+    return unclaimed
+
+
+class FeeWithdrawer:
+    """Withdraws the fees of a list of holders who have authorised the operator,
+    in gas-bounded batches."""
+
+    def __init__(self, havven, nomin, operator, accounts, gas_budget=None):
+        self.havven = havven
+        self.nomin = nomin
+        self.operator = operator
+        self.accounts = accounts
+        self.gas_budget = gas_budget
+        self.event_dict = generate_topic_event_map(havven.abi)
+        self.withdrawn = 0
+        self.fees = 0
+        self.transactions = 0
+
+    def find(self):
+        return unclaimed_accounts(self.havven, self.nomin, self.accounts, self.operator)
+
+    def withdraw(self, accounts):
+        """Withdraw the given accounts' fees, returning {account: fees} for each fee paid out."""
+        make_call = lambda chunk: self.havven.functions.withdrawFeeEntitlements(chunk)
+        receipts = submit_chunks(gas_bounded_chunks(accounts, make_call, self.operator, self.gas_budget),
+                                 make_call, self.operator)
+        paid = {}
+        for receipt in receipts:
+            for log in receipt.logs:
+                if log.address != self.havven.address:
+                    continue
+                event = get_event_data_from_log(self.event_dict, log)
+                if event is not None and event['event'] == 'FeesWithdrawn':
+                    paid[event['args']['account']] = event['args']['fees']
+        self.withdrawn += len(paid)
+        self.fees += sum(paid.values())
+        self.transactions += len(receipts)
+        return paid
+
+    def step(self):
+        accounts = self.find()
+        return self.withdraw(accounts) if accounts else {}
+
+    def run(self, interval=DEFAULT_INTERVAL):
+        while True:
+            paid = self.step()
+            if paid:
+                print(f"Withdrew {sum(paid.values()) / UNIT} nomins in fees for {len(paid)} accounts.")
+            time.sleep(interval)
+
+
+def read_accounts(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Withdraw havven holders' fees on their behalf, in batches.")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--nomin", required=True, help="the address of the EtherNomin contract")
+    parser.add_argument("--operator", required=True,
+                        help="the account sending the transactions, which must be unlocked")
+    parser.add_argument("--accounts", required=True,
+                        help="a file of the accounts which have authorised the operator, one per line")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL,
+                        help="seconds between searches for fees to withdraw")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    nomin = W3.eth.contract(address=args.nomin, abi=compiled['EtherNomin']['abi'])
+    withdrawer = FeeWithdrawer(havven, nomin, args.operator, read_accounts(args.accounts))
+    try:
+        withdrawer.run(args.interval)
+    except KeyboardInterrupt:
+        print(f"\nWithdrew {withdrawer.fees / UNIT} nomins for {withdrawer.withdrawn} accounts "
+              f"in {withdrawer.transactions} transactions.")
@@ -0,0 +1,319 @@
+# The load generator: drives a mix of Havven and EtherNomin operations from many accounts at once,
+# and reports the throughput the chain sustained, the latency of each operation and the gas it used.
+# Run with: python3 -m tools.loadgen --havven ADDRESS --nomin ADDRESS --owner ACCOUNT [--scenario NAME]
+#
+# A scenario fixes the number of accounts, the number of operations, how many worker threads send
+# them, and the relative frequency of each operation, so that a run can be repeated and compared
+# against an earlier one with --save-baseline and --check-baseline.
+
+import json
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+from statistics import median
+
+from utils.deployutils import W3, UNIT, ETHER, POLLING_INTERVAL, ACCOUNT_POOL, compile_contracts, \
+    fund_accounts, mine_txs
+from utils.gasprofiler import save_baseline, load_baseline
+from utils.generalutils import TERMCOLORS
+from utils.txutils import NonceManager, PendingTransactions, send_transaction
+
+SOLIDITY_SOURCES = ["contracts/Havven.sol", "contracts/EtherNomin.sol"]
+
+# Operations are sent with this gas limit rather than estimated, so that estimation does not
+# add to the load, and so that operations which would revert are still mined and measured.
+OPERATION_GAS = 500000
+
+# The ether each account is topped up to before a run.
+ACCOUNT_ETHER = 10 * ETHER
+
+# By default, the throughput of a run may fall this fraction below its baseline,
+# and the median gas of an operation may rise this fraction above it.
+DEFAULT_THROUGHPUT_TOLERANCE = 0.2
+DEFAULT_GAS_TOLERANCE = 0.02
+
+# accounts: the number of accounts leased to send from.
+# operations: the total number of operations sent.
+# concurrency: the number of worker threads, among which the accounts are divided.
+# window: the most operations each worker may have sent but not yet seen mined.
+# mix: the relative frequency of each operation, named as in OPERATIONS.
+# quantity: the havvens or nomins moved by each operation.
+SCENARIOS = {
+    "havven_transfers": {
+        "accounts": 20, "operations": 500, "concurrency": 4, "window": 8,
+        "mix": {"havven_transfer": 1}, "quantity": "0.01"
+    },
+    "nomin_transfers": {
+        "accounts": 20, "operations": 500, "concurrency": 4, "window": 8,
+        "mix": {"nomin_transfer": 1}, "quantity": "0.01"
+    },
+    "mixed": {
+        "accounts": 40, "operations": 1000, "concurrency": 8, "window": 8,
+        "mix": {"havven_transfer": 30, "havven_transfer_from": 10, "nomin_transfer": 30,
+                "nomin_transfer_from": 10, "nomin_buy": 8, "nomin_sell": 8, "withdraw_fees": 4},
+        "quantity": "0.01"
+    }
+}
+
+# Each operation is sent by an account, and moves tokens either to another account,
+# or (for transferFrom) from the account which approved the sender.
+OPERATIONS = ["havven_transfer", "havven_transfer_from", "nomin_transfer", "nomin_transfer_from",
+              "nomin_buy", "nomin_sell", "withdraw_fees"]
+
+
+def load_scenarios(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def percentile(values, fraction):
+    """The nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class LoadGenerator:
+    """Runs a scenario against a Havven and EtherNomin pair, owned by the given account.
+    Each worker thread sends from its own share of the accounts, with nonces allocated locally,
+    keeping up to a window of operations in flight and timing each one until its receipt arrives."""
+
+    def __init__(self, havven, nomin, owner, accounts, scenario, seed=0):
+        unknown = set(scenario["mix"]) - set(OPERATIONS)
+        if unknown:
+            raise Exception(f"Unknown operations in the scenario: {', '.join(sorted(unknown))}")
+        self.havven = havven
+        self.nomin = nomin
+        self.owner = owner
+        self.accounts = list(accounts)
+        self.scenario = scenario
+        self.seed = seed
+        self.quantity = int(Decimal(scenario["quantity"]) * UNIT)
+        self.nonces = {account: NonceManager(account) for account in self.accounts + [owner]}
+        self.buy_cost = None
+
+        self.lock = threading.Lock()
+        # (operation, seconds to confirm, gas used, succeeded) for each operation sent.
+        self.results = []
+        self.rejected = {}
+        self.elapsed = None
+
+    def approver(self, index):
+        """Each account may spend the tokens of the account before it."""
+        return self.accounts[index - 1]
+
+    def prepare(self):
+        """Give every account ether, havvens and nomins to spend, and an allowance over the
+        previous account's tokens, waiting until all of it has been mined."""
+        mix = self.scenario["mix"]
+        # Enough for every operation to be sent from the same account.
+        stake = 2 * self.scenario["operations"] * self.quantity
+        uses_nomins = any(operation.startswith("nomin") or operation == "withdraw_fees" for operation in mix)
+
+        stake_cost = 0
+        if uses_nomins:
+            stake_cost = self.nomin.functions.purchaseCostEther(stake).call()
+            self.buy_cost = self.nomin.functions.purchaseCostEther(self.quantity).call()
+        # Sent before the owner's nonces are managed locally, since the node allocates these.
+        fund_accounts(self.accounts, ACCOUNT_ETHER + stake_cost, self.owner)
+
+        txs = []
+        if uses_nomins:
+            nomins = stake * len(self.accounts)
+            # Issuance requires collateral worth twice the nomins issued; a third more leaves room for fees.
+            collateral = self.nomin.functions.etherValue(3 * nomins).call()
+            txs.append(send_transaction(self.nomin.functions.issue(nomins), self.owner, self.nonces[self.owner],
+                                        value=collateral))
+        txs += [send_transaction(self.havven.functions.endow(account, stake), self.owner, self.nonces[self.owner])
+                for account in self.accounts]
+        mine_txs(txs)
+
+        txs = []
+        for index, account in enumerate(self.accounts):
+            if uses_nomins:
+                txs.append(send_transaction(self.nomin.functions.buy(stake), account, self.nonces[account],
+                                            value=stake_cost))
+            spender = self.accounts[(index + 1) % len(self.accounts)]
+            for token in [self.havven, self.nomin]:
+                txs.append(send_transaction(token.functions.approve(spender, stake), account, self.nonces[account]))
+        mine_txs(txs)
+
+    def operation_call(self, operation, index, rng):
+        """The contract function and ether value for an operation sent by the account at the given index."""
+        other = self.accounts[(index + rng.randrange(1, len(self.accounts))) % len(self.accounts)]
+        if operation == "havven_transfer":
+            return self.havven.functions.transfer(other, self.quantity), 0
+        if operation == "havven_transfer_from":
+            return self.havven.functions.transferFrom(self.approver(index), other, self.quantity), 0
+        if operation == "nomin_transfer":
+            return self.nomin.functions.transfer(other, self.quantity), 0
+        if operation == "nomin_transfer_from":
+            return self.nomin.functions.transferFrom(self.approver(index), other, self.quantity), 0
+        if operation == "nomin_buy":
+            return self.nomin.functions.buy(self.quantity), self.buy_cost
+        if operation == "nomin_sell":
+            return self.nomin.functions.sell(self.quantity), 0
+        # Each account may withdraw its fees only once per fee period, so later withdrawals revert.
+        return self.havven.functions.withdrawFeeEntitlement(), 0
+
+    def record(self, results, rejected):
+        with self.lock:
+            self.results += results
+            for operation, count in rejected.items():
+                self.rejected[operation] = self.rejected.get(operation, 0) + count
+
+    def work(self, indices, operations, seed):
+        rng = random.Random(seed)
+        names = sorted(self.scenario["mix"])
+        weights = [self.scenario["mix"][name] for name in names]
+        window = self.scenario["window"]
+        pending = PendingTransactions()
+        results, rejected = [], {}
+        sent = 0
+        while sent < operations or pending:
+            if sent < operations and len(pending) < window:
+                operation = rng.choices(names, weights)[0]
+                index = indices[sent % len(indices)]
+                sender = self.accounts[index]
+                call, value = self.operation_call(operation, index, rng)
+                sent += 1
+                try:
+                    tx_hash = send_transaction(call, sender, self.nonces[sender], gas=OPERATION_GAS, value=value)
+                except ValueError:
+                    rejected[operation] = rejected.get(operation, 0) + 1
+                    continue
+                pending.add(tx_hash, operation)
+                continue
+            mined = pending.poll()
+            for tx_hash, receipt, latency, operation in mined:
+                # Receipts from the ganache-cli 6.1.0 beta have no status field.
+                results.append((operation, latency, receipt.gasUsed, receipt.get('status', 1) != 0))
+            if not mined:
+                time.sleep(POLLING_INTERVAL)
+        self.record(results, rejected)
+
+    def run(self):
+        """Send every operation in the scenario, returning the report."""
+        concurrency = min(self.scenario["concurrency"], len(self.accounts))
+        total = self.scenario["operations"]
+        workers = []
+        for worker in range(concurrency):
+            indices = list(range(worker, len(self.accounts), concurrency))
+            operations = total // concurrency + (1 if worker < total % concurrency else 0)
+            workers.append(threading.Thread(target=self.work, args=(indices, operations, self.seed + worker)))
+
+        start = time.time()
+        if len(workers) == 1:
+            workers[0].run()
+        else:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.elapsed = time.time() - start
+        return self.report()
+
+    def report(self):
+        operations = {}
+        for operation, latency, gas, succeeded in self.results:
+            operations.setdefault(operation, []).append((latency, gas, succeeded))
+        summary = {}
+        for operation, results in sorted(operations.items()):
+            latencies = [latency for latency, _, _ in results]
+            gas = [gas for _, gas, succeeded in results if succeeded]
+            summary[operation] = {
+                'mined': len(results),
+                'failed': sum(1 for _, _, succeeded in results if not succeeded),
+                'rejected': self.rejected.get(operation, 0),
+                'latency_p50': percentile(latencies, 0.5),
+                'latency_p90': percentile(latencies, 0.9),
+                'latency_p99': percentile(latencies, 0.99),
+                'gas_median': median(gas) if gas else None,
+                'gas_max': max(gas) if gas else None
+            }
+        for operation, count in self.rejected.items():
+            if operation not in summary:
+                summary[operation] = {'mined': 0, 'failed': 0, 'rejected': count}
+        latencies = [latency for _, latency, _, _ in self.results]
+        return {
+            'operations': summary,
+            'mined': len(self.results),
+            'seconds': self.elapsed,
+            'throughput': len(self.results) / self.elapsed if self.elapsed else None,
+            'latency_p50': percentile(latencies, 0.5) if latencies else None,
+            'latency_p99': percentile(latencies, 0.99) if latencies else None
+        }
+
+
+def find_regressions(report, baseline, throughput_tolerance=DEFAULT_THROUGHPUT_TOLERANCE,
+                     gas_tolerance=DEFAULT_GAS_TOLERANCE):
+    """Return a description of each way a report falls short of a baseline report of the same scenario."""
+    regressions = []
+    if report['throughput'] < baseline['throughput'] * (1 - throughput_tolerance):
+        regressions.append(f"throughput {baseline['throughput']:.1f} -> {report['throughput']:.1f} ops/s")
+    for operation, current in sorted(report['operations'].items()):
+        previous = baseline['operations'].get(operation, {}).get('gas_median')
+        if previous and current.get('gas_median') and current['gas_median'] > previous * (1 + gas_tolerance):
+            regressions.append(f"{operation}: median gas {int(previous)} -> {int(current['gas_median'])}")
+    return regressions
+
+
+def format_report(report):
+    header = ("Operation", "Mined", "Failed", "Rejected", "p50 s", "p90 s", "p99 s", "Median gas", "Max gas")
+    rows = []
+    for operation, s in sorted(report['operations'].items()):
+        rows.append((operation, str(s['mined']), str(s['failed']), str(s['rejected'])) +
+                    tuple(f"{s[key]:.3f}" if s.get(key) is not None else "-"
+                          for key in ['latency_p50', 'latency_p90', 'latency_p99']) +
+                    tuple(str(int(s[key])) if s.get(key) is not None else "-" for key in ['gas_median', 'gas_max']))
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i]) for i, cell in enumerate(row))
+             for row in [header] + rows]
+    lines.append(f"\n{report['mined']} operations mined in {report['seconds']:.1f}s: "
+                 f"{report['throughput']:.1f} per second.")
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = ArgumentParser(description="Measure the rate of Havven and EtherNomin operations a chain sustains.")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--nomin", required=True, help="the address of the EtherNomin contract")
+    parser.add_argument("--owner", required=True, help="the owner of both contracts, which must be unlocked")
+    parser.add_argument("--scenario", default="mixed", help="the name of the scenario to run")
+    parser.add_argument("--scenarios", metavar="PATH", help="a JSON file of scenarios, in place of the built-in ones")
+    parser.add_argument("--seed", type=int, default=0, help="the seed for choosing operations")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the report to a baseline file")
+    parser.add_argument("--check-baseline", metavar="PATH", help="compare the report with a baseline file")
+    parser.add_argument("--throughput-tolerance", type=float, default=DEFAULT_THROUGHPUT_TOLERANCE,
+                        help="the fractional fall in throughput allowed below the baseline")
+    parser.add_argument("--gas-tolerance", type=float, default=DEFAULT_GAS_TOLERANCE,
+                        help="the fractional rise in an operation's median gas allowed above the baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    scenarios = load_scenarios(args.scenarios) if args.scenarios else SCENARIOS
+    scenario = scenarios[args.scenario]
+    compiled = compile_contracts(SOLIDITY_SOURCES)
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    nomin = W3.eth.contract(address=args.nomin, abi=compiled['EtherNomin']['abi'])
+
+    with ACCOUNT_POOL.leasing(scenario["accounts"]) as accounts:
+        generator = LoadGenerator(havven, nomin, args.owner, accounts, scenario, args.seed)
+        print(f"Preparing {len(accounts)} accounts...")
+        generator.prepare()
+        print(f"Running scenario {args.scenario}...\n")
+        report = generator.run()
+    print(format_report(report))
+
+    if args.save_baseline:
+        save_baseline(report, args.save_baseline)
+    if args.check_baseline:
+        regressions = find_regressions(report, load_baseline(args.check_baseline),
+                                       args.throughput_tolerance, args.gas_tolerance)
+        if regressions:
+            print(f"\n{TERMCOLORS.YELLOW}Regressions against {args.check_baseline}:{TERMCOLORS.RESET}")
+            print("\n".join(regressions))
+            raise SystemExit(1)
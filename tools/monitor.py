@@ -0,0 +1,155 @@
+# The nomin monitor: on each new block, reads EtherNomin's collateralisation and staleness state
+# in a single batched JSON-RPC request, and serves the latest values from memory, so that the load
+# on the node is the same however many dashboards are watching.
+# Run with: python3 -m tools.monitor --nomin ADDRESS [--port 9100]
+# The values are served as JSON at / and in the Prometheus text format at /metrics.
+
+import json
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from utils.deployutils import W3, UNIT, BLOCKCHAIN_ADDRESS, compile_contracts
+from utils.rpcutils import rpc_request, batch_request
+
+NOMIN_SOURCE = "contracts/EtherNomin.sol"
+
+DEFAULT_PORT = 9100
+
+# Seconds between checks for a new block.
+DEFAULT_POLL_INTERVAL = 1
+
+# The EtherNomin view functions read on each block; all of them return a uint or a bool.
+NOMIN_VIEWS = ["collateralisationRatio", "priceIsStale", "isLiquidating", "nominPool", "totalSupply"]
+
+# Values which are fixed point numbers, and are reported divided by UNIT.
+DECIMAL_VALUES = {"collateralisationRatio", "nominPool", "totalSupply", "etherBalance"}
+
+
+class NominMonitor:
+    """Keeps the latest EtherNomin state in memory, refreshing it whenever a new block is mined."""
+
+    def __init__(self, nomin, address=BLOCKCHAIN_ADDRESS):
+        self.nomin = nomin
+        self.address = address
+        self.call_data = [(name, nomin.encodeABI(fn_name=name)) for name in NOMIN_VIEWS]
+        self.lock = threading.Lock()
+        self.block_number = None
+        self.values = {}
+        self.updated = None
+        self.refreshes = 0
+
+    def latest_block_number(self):
+        return int(rpc_request(self.address, "eth_blockNumber", []), 16)
+
+    def read(self, block_number):
+        """Read every value as of the given block, in one batched request.
+        A view which reverts, as collateralisationRatio does while the price is stale, reads as None."""
+        block = hex(block_number)
+        calls = [("eth_call", [{"to": self.nomin.address, "data": data}, block]) for _, data in self.call_data]
+        calls.append(("eth_getBalance", [self.nomin.address, block]))
+        names = [name for name, _ in self.call_data] + ["etherBalance"]
+
+        values = {}
+        for name, (result, error) in zip(names, batch_request(self.address, calls)):
+            values[name] = None if error is not None or result in (None, "0x") else int(result, 16)
+        return values
+
+    def refresh(self):
+        """Read the state again if a block has been mined since the last read. Returns True if it was read."""
+        block_number = self.latest_block_number()
+        if block_number == self.block_number:
+            return False
+        values = self.read(block_number)
+        with self.lock:
+            self.block_number = block_number
+            self.values = values
+            self.updated = time.time()
+            self.refreshes += 1
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            values = {name: (value / UNIT if name in DECIMAL_VALUES and value is not None else value)
+                      for name, value in self.values.items()}
+            return {"blockNumber": self.block_number, "updated": self.updated, "values": values}
+
+    def metrics(self):
+        """The latest values in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["values"].items()):
+            if value is None:
+                continue
+            metric = "havven_nomin_" + "".join("_" + c.lower() if c.isupper() else c for c in name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {float(value)}")
+        if snapshot["blockNumber"] is not None:
+            lines.append("# TYPE havven_monitor_block_number gauge")
+            lines.append(f"havven_monitor_block_number {snapshot['blockNumber']}")
+            lines.append("# TYPE havven_monitor_updated_timestamp_seconds gauge")
+            lines.append(f"havven_monitor_updated_timestamp_seconds {snapshot['updated']}")
+        return "\n".join(lines) + "\n"
+
+    def poll(self, interval=DEFAULT_POLL_INTERVAL):
+        while True:
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"Could not read the chain: {e}")
+            time.sleep(interval)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_server(monitor, port=DEFAULT_PORT, host="localhost"):
+    """An HTTP server answering every request from the monitor's memory, without touching the node."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = monitor.metrics(), "text/plain; version=0.0.4"
+            elif self.path == "/":
+                body, content_type = json.dumps(monitor.snapshot()), "application/json"
+            else:
+                self.send_error(404)
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def parse_args():
+    parser = ArgumentParser(description="Serve EtherNomin's collateralisation and staleness state.")
+    parser.add_argument("--nomin", required=True, help="the address of the EtherNomin contract")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the port to serve on")
+    parser.add_argument("--host", default="localhost", help="the interface to serve on")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between checks for a new block")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts([NOMIN_SOURCE])
+    nomin = W3.eth.contract(address=args.nomin, abi=compiled['EtherNomin']['abi'])
+    monitor = NominMonitor(nomin)
+    monitor.refresh()
+    server = make_server(monitor, args.port, args.host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving on http://{args.host}:{server.server_port}/metrics")
+    try:
+        monitor.poll(args.poll_interval)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,196 @@
+# The oracle daemon: keeps the ether price in EtherNomin fresh.
+# Run with: python3 -m tools.oracle --nomin ADDRESS --oracle ACCOUNT --price-file PATH
+
+import time
+from argparse import ArgumentParser
+from decimal import Decimal, InvalidOperation
+from statistics import median
+
+from utils.deployutils import W3, UNIT, POLLING_INTERVAL, compile_contracts
+from utils.generalutils import TERMCOLORS
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+from utils.txutils import NonceManager, PendingTransactions, send_transaction
+
+NOMIN_SOURCE = "contracts/EtherNomin.sol"
+
+# Seconds between price updates.
+DEFAULT_INTERVAL = 60 * 60
+
+# An update is sent early if the price on chain would otherwise become stale within this many seconds.
+DEFAULT_STALENESS_WARNING = 6 * 60 * 60
+
+
+class FilePriceSource:
+    """Reads the ether price, in fiat per ether, as a decimal number from a file,
+    which another process may rewrite at any time."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def price(self):
+        with open(self.path) as f:
+            text = f.read().strip()
+        try:
+            return int(Decimal(text) * UNIT)
+        except InvalidOperation:
+            raise ValueError(f"{self.path} does not hold a price: {text!r}")
+
+
+class StubPriceSource:
+    """Yields the given prices in turn, repeating the last one once they run out."""
+
+    def __init__(self, prices):
+        self.prices = list(prices)
+        self.index = 0
+
+    def price(self):
+        price = self.prices[min(self.index, len(self.prices) - 1)]
+        self.index += 1
+        return price
+
+
+class OracleDaemon:
+    """Sends the price from a source to EtherNomin.updatePrice every interval seconds.
+    Nonces are allocated locally and receipts are collected as they arrive, so an update
+    which is slow to confirm never holds up the next one."""
+
+    def __init__(self, nomin, oracle, source, interval=DEFAULT_INTERVAL, gas_price=None,
+                 staleness_warning=DEFAULT_STALENESS_WARNING):
+        self.nomin = nomin
+        self.oracle = oracle
+        self.source = source
+        self.interval = interval
+        self.gas_price = gas_price
+        self.staleness_warning = staleness_warning
+
+        self.nonces = NonceManager(oracle)
+        self.pending = PendingTransactions()
+        self.event_dict = generate_topic_event_map(nomin.abi)
+        self.stale_period = nomin.functions.stalePeriod().call()
+        self.last_update_time = nomin.functions.lastPriceUpdate().call()
+        self.last_sent = None
+
+        self.sent = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.latencies = []
+        # The least time remaining before the price would have become stale, when each update was mined.
+        self.margins = []
+        # The blocks in which an update began liquidation.
+        self.liquidations = []
+
+    def staleness_margin(self, timestamp=None):
+        """Seconds from the given time (by default, the latest block's) until the last confirmed price becomes stale."""
+        if timestamp is None:
+            timestamp = W3.eth.getBlock('latest')['timestamp']
+        return self.last_update_time + self.stale_period - timestamp
+
+    def update_due(self):
+        return self.last_sent is None or time.time() - self.last_sent >= self.interval or \
+            (not self.pending and self.staleness_margin() < self.staleness_warning)
+
+    def submit(self):
+        price = self.source.price()
+        tx_hash = send_transaction(self.nomin.functions.updatePrice(price), self.oracle, self.nonces,
+                                   gas_price=self.gas_price)
+        self.pending.add(tx_hash, price)
+        self.sent += 1
+        self.last_sent = time.time()
+        return tx_hash
+
+    def began_liquidation(self, receipt):
+        """updatePrice begins liquidation itself if the new price leaves the contract undercollateralised."""
+        for log in receipt.logs:
+            event = get_event_data_from_log(self.event_dict, log)
+            if event is not None and event['event'] == 'Liquidation':
+                return True
+        return False
+
+    def collect(self):
+        """Process the updates mined since the last call,
+        returning a (price, receipt, seconds to confirm, began liquidation) tuple for each."""
+        updates = []
+        mined = sorted(self.pending.poll(), key=lambda item: (item[1].blockNumber, item[1].transactionIndex))
+        for tx_hash, receipt, latency, price in mined:
+            # Receipts from the ganache-cli 6.1.0 beta have no status field.
+            if receipt.get('status', 1) == 0:
+                self.failed += 1
+                continue
+            block_timestamp = W3.eth.getBlock(receipt.blockNumber)['timestamp']
+            self.margins.append(self.staleness_margin(block_timestamp))
+            self.last_update_time = block_timestamp
+            self.confirmed += 1
+            self.latencies.append(latency)
+
+            liquidated = self.began_liquidation(receipt)
+            if liquidated:
+                self.liquidations.append(receipt.blockNumber)
+            updates.append((price, receipt, latency, liquidated))
+        return updates
+
+    def step(self):
+        """Send an update if one is due, and collect any which have been mined."""
+        if self.update_due():
+            self.submit()
+        return self.collect()
+
+    def report(self):
+        return {
+            'sent': self.sent,
+            'confirmed': self.confirmed,
+            'failed': self.failed,
+            'pending': len(self.pending),
+            'median_latency': median(self.latencies) if self.latencies else None,
+            'max_latency': max(self.latencies) if self.latencies else None,
+            'min_staleness_margin': min(self.margins) if self.margins else None,
+            'liquidations': list(self.liquidations)
+        }
+
+    def poll(self):
+        """Step once, printing what happened. A price which cannot be read, a rejected update, or a node
+        which cannot be reached is reported and counted as a failure, and the next poll tries again,
+        so that no single error stops the daemon and lets the price go stale."""
+        try:
+            for price, receipt, latency, liquidated in self.step():
+                print(f"Price {price / UNIT} confirmed in block {receipt.blockNumber} after {latency:.2f}s; "
+                      f"{self.margins[-1]}s from staleness.")
+                if liquidated:
+                    print(f"{TERMCOLORS.RED}Liquidation began in block {receipt.blockNumber}.{TERMCOLORS.RESET}")
+            margin = self.staleness_margin()
+        except (ValueError, OSError) as error:
+            self.failed += 1
+            # The nonce allocated to a rejected update may not have been used.
+            self.nonces.resync()
+            print(f"{TERMCOLORS.RED}Update failed: {error}{TERMCOLORS.RESET}")
+            return
+        if margin < self.staleness_warning:
+            print(f"{TERMCOLORS.YELLOW}The price will be stale in {margin:.0f}s.{TERMCOLORS.RESET}")
+
+    def run(self, poll_interval=POLLING_INTERVAL):
+        while True:
+            self.poll()
+            time.sleep(poll_interval)
+
+
+def parse_args():
+    parser = ArgumentParser(description="Keep the ether price in an EtherNomin contract up to date.")
+    parser.add_argument("--nomin", required=True, help="the address of the EtherNomin contract")
+    parser.add_argument("--oracle", required=True, help="the oracle account, which must be unlocked")
+    parser.add_argument("--price-file", required=True, help="a file containing the current price in fiat per ether")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="seconds between updates")
+    parser.add_argument("--gas-price", type=int, help="the gas price of updates, in wei")
+    parser.add_argument("--staleness-warning", type=int, default=DEFAULT_STALENESS_WARNING,
+                        help="send an update early if the price would become stale within this many seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts([NOMIN_SOURCE])
+    nomin = W3.eth.contract(address=args.nomin, abi=compiled['EtherNomin']['abi'])
+    daemon = OracleDaemon(nomin, args.oracle, FilePriceSource(args.price_file), args.interval,
+                          args.gas_price, args.staleness_warning)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print(f"\n{daemon.report()}")
@@ -0,0 +1,127 @@
+# The quote client: answers requests for EtherNomin purchase and sale quotes from a cache, which is
+# only cleared when the price, pool fee rate or stale period changes on chain. Quotes for sizes not
+# yet cached are read together with EtherNomin.quotes, so the load on the node depends on how often
+# the price changes rather than on how many quotes are requested.
+# Run with: python3 -m tools.quote_client --nomin ADDRESS QUANTITY [QUANTITY ...]
+
+import time
+from argparse import ArgumentParser
+from decimal import Decimal
+
+from utils.deployutils import W3, UNIT, compile_contracts
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+
+NOMIN_SOURCE = "contracts/EtherNomin.sol"
+
+# Seconds between checks for events which invalidate the cached quotes.
+DEFAULT_REFRESH_INTERVAL = 1
+
+# The events after which cached quotes must be read again.
+INVALIDATING_EVENTS = {"PriceUpdated", "PoolFeeRateUpdated", "StalePeriodUpdated"}
+
+# The events which begin and end liquidation, during which sell accepts quotes at a stale price.
+LIQUIDATION_EVENTS = {"Liquidation": True, "LiquidationTerminated": False}
+
+
+class QuoteClient:
+    """Caches EtherNomin quotes by quantity, checking for events which change them at most once per
+    refresh interval. Whether the price is stale is worked out from the latest block's timestamp,
+    fetched at the same time, so it needs no further requests as the price ages."""
+
+    def __init__(self, nomin, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.nomin = nomin
+        self.refresh_interval = refresh_interval
+        self.event_dict = generate_topic_event_map(nomin.abi)
+
+        # {quantity: (ether cost of purchase, ether proceeds of sale)}
+        self.cache = {}
+        self.price_update_time = None
+        self.stale_period = nomin.functions.stalePeriod().call()
+        self.liquidating = nomin.functions.isLiquidating().call()
+
+        latest = W3.eth.getBlock('latest')
+        self.next_block = latest['number'] + 1
+        self.block_timestamp = latest['timestamp']
+        self.block_time_fetched = time.time()
+
+        # The number of event checks and quote reads made, for monitoring the load on the node.
+        self.checks = 0
+        self.reads = 0
+
+    def invalidate(self):
+        self.cache = {}
+        self.price_update_time = None
+
+    def check_events(self):
+        """Clear the cache if the quotes have changed since the last check."""
+        latest = W3.eth.getBlock('latest')
+        self.block_timestamp = latest['timestamp']
+        self.block_time_fetched = time.time()
+        self.checks += 1
+        if latest['number'] < self.next_block:
+            return
+        logs = W3.eth.getLogs({'address': self.nomin.address, 'fromBlock': self.next_block,
+                               'toBlock': latest['number']})
+        self.next_block = latest['number'] + 1
+        for log in logs:
+            event = get_event_data_from_log(self.event_dict, log)
+            if event is not None and event['event'] in LIQUIDATION_EVENTS:
+                self.liquidating = LIQUIDATION_EVENTS[event['event']]
+            if event is None or event['event'] not in INVALIDATING_EVENTS:
+                continue
+            if event['event'] == 'StalePeriodUpdated':
+                self.stale_period = event['args']['newPeriod']
+            self.invalidate()
+
+    def chain_time(self):
+        """An estimate of the chain's current time, from the latest block timestamp fetched."""
+        return self.block_timestamp + int(time.time() - self.block_time_fetched)
+
+    def read(self, quantities):
+        purchase_costs, sale_proceeds, price_update_time, _ = self.nomin.functions.quotes(quantities).call()
+        self.reads += 1
+        self.price_update_time = price_update_time
+        for quantity, cost, proceeds in zip(quantities, purchase_costs, sale_proceeds):
+            self.cache[quantity] = (cost, proceeds)
+
+    def quote(self, quantities):
+        """The purchase costs and sale proceeds, in ether, of each quantity of nomins, with the time
+        of the price they were computed at, whether that price is stale, and whether the contract is
+        liquidating. buy does not accept stale quotes, nor any quote during liquidation; sell accepts
+        stale quotes only during liquidation, so saleStale is set only if sell would refuse them."""
+        if time.time() - self.block_time_fetched >= self.refresh_interval:
+            self.check_events()
+        missing = sorted({quantity for quantity in quantities if quantity not in self.cache})
+        if missing or self.price_update_time is None:
+            self.read(missing)
+        stale = self.price_update_time + self.stale_period < self.chain_time()
+        return {
+            'purchaseCosts': [self.cache[quantity][0] for quantity in quantities],
+            'saleProceeds': [self.cache[quantity][1] for quantity in quantities],
+            'priceUpdateTime': self.price_update_time,
+            'stale': stale,
+            'saleStale': stale and not self.liquidating,
+            'liquidating': self.liquidating
+        }
+
+
+def parse_args():
+    parser = ArgumentParser(description="Print EtherNomin purchase and sale quotes for some quantities of nomins.")
+    parser.add_argument("--nomin", required=True, help="the address of the EtherNomin contract")
+    parser.add_argument("quantities", nargs="+", help="quantities of nomins to quote for")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts([NOMIN_SOURCE])
+    nomin = W3.eth.contract(address=args.nomin, abi=compiled['EtherNomin']['abi'])
+    quantities = [int(Decimal(quantity) * UNIT) for quantity in args.quantities]
+    quotes = QuoteClient(nomin).quote(quantities)
+    for quantity, cost, proceeds in zip(args.quantities, quotes['purchaseCosts'], quotes['saleProceeds']):
+        print(f"{quantity} nomins: buy for {cost / UNIT} ether, sell for {proceeds / UNIT} ether")
+    if quotes['liquidating']:
+        print("The contract is liquidating, so nomins can only be sold.")
+    if quotes['stale']:
+        print(f"The price, last updated at {quotes['priceUpdateTime']}, is stale"
+              f"{'; sales are still accepted during liquidation' if not quotes['saleStale'] else ''}.")
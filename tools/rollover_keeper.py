@@ -0,0 +1,151 @@
+# The fee period rollover keeper: rolls the Havven fee period over as soon as it is due,
+# rather than waiting for the next transfer or withdrawal to do so, then refreshes the
+# average balances of a list of accounts, such as the escrow contract and large holders.
+# Run with: python3 -m tools.rollover_keeper --havven ADDRESS --keeper ACCOUNT [--accounts FILE]
+
+import time
+from argparse import ArgumentParser
+
+from utils.deployutils import W3, POLLING_INTERVAL, compile_contracts
+from utils.batchutils import gas_bounded_chunks
+from utils.testutils import generate_topic_event_map, get_event_data_from_log
+from utils.txutils import NonceManager, PendingTransactions, send_transaction, GAS_MARGIN
+
+HAVVEN_SOURCE = "contracts/Havven.sol"
+
+# Seconds between fetches of the latest block's timestamp; in between, the chain's time is
+# estimated by adding the time elapsed locally to the last timestamp fetched.
+DEFAULT_BLOCK_TIME_REFRESH = 60
+
+
+def recompute_call(havven, accounts):
+    return havven.functions.recomputeAccountLastAverageBalances(accounts)
+
+
+class RolloverKeeper:
+    """Watches for the end of the fee period using a cached block time, and when it arrives sends
+    rolloverFeePeriod followed by batched recomputeAccountLastAverageBalances calls, one after
+    another without waiting for any of them to be mined."""
+
+    def __init__(self, havven, keeper, accounts, gas_budget=None,
+                 block_time_refresh=DEFAULT_BLOCK_TIME_REFRESH):
+        self.havven = havven
+        self.keeper = keeper
+        self.accounts = list(accounts)
+        self.gas_budget = gas_budget
+        self.block_time_refresh = block_time_refresh
+
+        self.nonces = NonceManager(keeper)
+        self.pending = PendingTransactions()
+        self.event_dict = generate_topic_event_map(havven.abi)
+
+        self.block_timestamp = None
+        self.block_time_fetched = None
+        self.load_schedule()
+
+        # (time the rollover was due, timestamp of the block that performed it) for each rollover.
+        self.rollovers = []
+        self.accounts_recomputed = 0
+
+    def load_schedule(self):
+        self.next_rollover = self.havven.functions.feePeriodStartTime().call() + \
+                             self.havven.functions.targetFeePeriodDurationSeconds().call()
+
+    def fetch_block_time(self):
+        self.block_timestamp = W3.eth.getBlock('latest')['timestamp']
+        self.block_time_fetched = time.time()
+        return self.block_timestamp
+
+    def chain_time(self):
+        """An estimate of the chain's current time, fetching the latest block's timestamp only
+        if the cached one is older than the refresh interval."""
+        if self.block_time_fetched is None or time.time() - self.block_time_fetched >= self.block_time_refresh:
+            return self.fetch_block_time()
+        return self.block_timestamp + int(time.time() - self.block_time_fetched)
+
+    def rollover_due(self):
+        return self.chain_time() >= self.next_rollover
+
+    def rollover(self):
+        """Send the rollover and then the recomputations, returning their transaction hashes."""
+        tx_hashes = [send_transaction(self.havven.functions.rolloverFeePeriod(), self.keeper, self.nonces)]
+        self.pending.add(tx_hashes[0], ('rollover', self.next_rollover))
+
+        make_call = lambda chunk: recompute_call(self.havven, chunk)
+        for chunk, gas in gas_bounded_chunks(self.accounts, make_call, self.keeper, self.gas_budget):
+            tx_hash = send_transaction(make_call(chunk), self.keeper, self.nonces, gas=int(gas * GAS_MARGIN))
+            self.pending.add(tx_hash, ('recompute', len(chunk)))
+            tx_hashes.append(tx_hash)
+        return tx_hashes
+
+    def rolled_over(self, receipt):
+        for log in receipt.logs:
+            event = get_event_data_from_log(self.event_dict, log)
+            if event is not None and event['event'] == 'FeePeriodRollover':
+                return True
+        return False
+
+    def collect(self):
+        """Process the keeper's transactions mined since the last call."""
+        if not self.pending:
+            return
+        for tx_hash, receipt, latency, (kind, detail) in self.pending.poll():
+            if kind == 'recompute':
+                self.accounts_recomputed += detail
+            elif self.rolled_over(receipt):
+                self.rollovers.append((detail, W3.eth.getBlock(receipt.blockNumber)['timestamp']))
+        if not self.pending:
+            # Whether or not this keeper's rollover took effect (someone else may have rolled
+            # the period over first), the next one is due a period after the current start time.
+            self.load_schedule()
+
+    def step(self):
+        """Roll the fee period over if it is due and nothing is in flight, and collect mined transactions."""
+        if not self.pending and self.rollover_due():
+            self.rollover()
+        self.collect()
+
+    def report(self):
+        lateness = [performed - due for due, performed in self.rollovers]
+        return {
+            'rollovers': len(self.rollovers),
+            'max_lateness': max(lateness) if lateness else None,
+            'accounts_recomputed': self.accounts_recomputed,
+            'pending': len(self.pending),
+            'next_rollover': self.next_rollover
+        }
+
+    def run(self, poll_interval=POLLING_INTERVAL):
+        while True:
+            rollovers = len(self.rollovers)
+            self.step()
+            for due, performed in self.rollovers[rollovers:]:
+                print(f"Fee period rolled over at {performed}, {performed - due}s after it was due.")
+            time.sleep(poll_interval)
+
+
+def read_accounts(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Roll the Havven fee period over promptly, and refresh average balances.")
+    parser.add_argument("--havven", required=True, help="the address of the Havven contract")
+    parser.add_argument("--keeper", required=True, help="the account sending the transactions, which must be unlocked")
+    parser.add_argument("--accounts", help="a file listing accounts whose average balances to refresh, one per line")
+    parser.add_argument("--block-time-refresh", type=int, default=DEFAULT_BLOCK_TIME_REFRESH,
+                        help="seconds between fetches of the latest block time")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = compile_contracts([HAVVEN_SOURCE])
+    havven = W3.eth.contract(address=args.havven, abi=compiled['Havven']['abi'])
+    accounts = read_accounts(args.accounts) if args.accounts else []
+    keeper = RolloverKeeper(havven, args.keeper, accounts, block_time_refresh=args.block_time_refresh)
+    try:
+        keeper.run()
+    except KeyboardInterrupt:
+        print(f"\n{keeper.report()}")
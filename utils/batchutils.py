@@ -0,0 +1,106 @@
+from itertools import groupby
+
+from utils.deployutils import W3, BLOCKCHAIN_ADDRESS, BLOCKCHAIN_BACKEND, mine_txs
+from utils.rpcutils import batch_call_uints
+
+# The fraction of the block gas limit a single batch transaction may consume.
+BLOCK_GAS_FRACTION = 0.9
+
+# The most calls made in a single batched request by read_uints.
+READ_BATCH_SIZE = 500
+
+
+def block_gas_budget(fraction=BLOCK_GAS_FRACTION):
+    """Return the gas a batch transaction may use, as a fraction of the latest block's gas limit."""
+    return int(W3.eth.getBlock('latest')['gasLimit'] * fraction)
+
+
+def estimate_gas(contract_function, sender):
+    """Return the estimated gas of a transaction, or None if it could not be estimated,
+    for example because it would exceed the block gas limit."""
+    try:
+        return contract_function.estimateGas({'from': sender})
+    except ValueError:
+        return None
+
+
+def gas_bounded_chunks(items, make_call, sender, gas_budget=None):
+    """Split items into consecutive chunks, each of whose batch calls fits within the gas budget.
+    make_call takes a list of items and returns the contract function that processes them.
+    Chunks are halved until their estimated gas fits; returns a list of (chunk, gas) pairs."""
+    if gas_budget is None:
+        gas_budget = block_gas_budget()
+
+    items = list(items)
+    pending = [items] if items else []
+    chunks = []
+    while pending:
+        chunk = pending.pop(0)
+        gas = estimate_gas(make_call(chunk), sender)
+        if gas is not None and gas <= gas_budget:
+            chunks.append((chunk, gas))
+            continue
+        if len(chunk) == 1:
+            raise Exception(f"A single batch item cannot be processed within {gas_budget} gas: {chunk[0]}")
+        mid = len(chunk) // 2
+        pending[0:0] = [chunk[:mid], chunk[mid:]]
+    return chunks
+
+
+def read_uints(calls, address=BLOCKCHAIN_ADDRESS):
+    """Perform (contract, function name, args) view calls returning a uint or bool, in batched
+    requests where the node is reached over HTTP, and one by one otherwise."""
+    if BLOCKCHAIN_BACKEND != "http":
+        return [getattr(contract.functions, name)(*args).call() for contract, name, args in calls]
+    results = []
+    for i in range(0, len(calls), READ_BATCH_SIZE):
+        results += batch_call_uints(address, calls[i:i + READ_BATCH_SIZE])
+    return results
+
+
+def submit_chunks(chunks, make_call, sender):
+    """Send one transaction per chunk without waiting between them, then wait for them all to be mined.
+    Returns the receipts in chunk order."""
+    tx_hashes = [make_call(chunk).transact({'from': sender, 'gas': gas}) for chunk, gas in chunks]
+    receipts = mine_txs(tx_hashes)
+    return [receipts[tx_hash] for tx_hash in tx_hashes]
+
+
+def vesting_schedules_call(escrow, entries):
+    """Build an addVestingSchedules call from a list of (account, time, quantity) triples,
+    grouping consecutive entries for the same account."""
+    accounts, counts, times, quantities = [], [], [], []
+    for account, group in groupby(entries, key=lambda entry: entry[0]):
+        group = list(group)
+        accounts.append(account)
+        counts.append(len(group))
+        times.extend(entry[1] for entry in group)
+        quantities.extend(entry[2] for entry in group)
+    return escrow.functions.addVestingSchedules(accounts, counts, times, quantities)
+
+
+def load_vesting_schedules(escrow, owner, schedules, gas_budget=None):
+    """Append vesting schedules for a cohort of accounts to the escrow contract,
+    in as few transactions as the gas budget permits.
+    schedules maps each account to its list of (time, quantity) pairs in ascending time order.
+    Returns the transaction receipts."""
+    entries = [(account, time, quantity)
+               for account in schedules
+               for time, quantity in schedules[account]]
+    make_call = lambda chunk: vesting_schedules_call(escrow, chunk)
+    chunks = gas_bounded_chunks(entries, make_call, owner, gas_budget)
+    return submit_chunks(chunks, make_call, owner)
+
+
+def transfer_batch_call(havven, allocations):
+    """Build a transferBatch call from a list of (recipient, value) pairs."""
+    return havven.functions.transferBatch([recipient for recipient, _ in allocations],
+                                          [value for _, value in allocations])
+
+
+def distribute_havvens(havven, sender, allocations, gas_budget=None):
+    """Transfer havvens from the sender to many recipients, in as few transactions as the gas budget permits.
+    allocations is a list of (recipient, value) pairs. Returns the transaction receipts."""
+    make_call = lambda chunk: transfer_batch_call(havven, chunk)
+    chunks = gas_bounded_chunks(allocations, make_call, sender, gas_budget)
+    return submit_chunks(chunks, make_call, sender)
@@ -1,14 +1,43 @@
+import os
+import threading
 import time
+from contextlib import contextmanager
 
 from web3 import Web3, HTTPProvider
 from solc import compile_files
 from utils.generalutils import to_seconds, TERMCOLORS
 
-BLOCKCHAIN_ADDRESS = "http://localhost:8545"
-W3 = Web3(HTTPProvider(BLOCKCHAIN_ADDRESS))
+# May be overridden by the environment, for example to give each parallel test worker its own chain.
+BLOCKCHAIN_ADDRESS = os.environ.get("BLOCKCHAIN_ADDRESS", "http://localhost:8545")
+
+# "http" to use the client at BLOCKCHAIN_ADDRESS, or "tester" to run an EVM within this process.
+BLOCKCHAIN_BACKEND = os.environ.get("BLOCKCHAIN_BACKEND", "http")
+
+# The accounts created by the in-process EVM, matching ganache-cli -a 500 -e 1000000000000.
+TESTER_ACCOUNTS = 500
+TESTER_ACCOUNT_BALANCE = 10**12 * 10**18
+
+
+def make_provider(backend):
+    if backend == "http":
+        return HTTPProvider(BLOCKCHAIN_ADDRESS)
+    if backend == "tester":
+        # Imported here so that eth-tester is only required when it is used.
+        from utils.testerprovider import InProcessProvider
+        return InProcessProvider(TESTER_ACCOUNTS, TESTER_ACCOUNT_BALANCE)
+    raise Exception(f"Unknown blockchain backend '{backend}': expected 'http' or 'tester'.")
+
+
+W3 = Web3(make_provider(BLOCKCHAIN_BACKEND))
 POLLING_INTERVAL = 0.1
 STATUS_ALIGN_SPACING = 6
 
+# Functions called as hook(tx_hash, tx_receipt) whenever mine_tx or mine_txs obtains a receipt.
+RECEIPT_HOOKS = []
+
+# The name and ABI of each contract deployed through deploy_contract, by address.
+DEPLOYED_CONTRACTS = {}
+
 
 # The number representing 1 in our contracts.
 UNIT = 10**18
@@ -16,32 +45,115 @@ UNIT = 10**18
 # The number of wei per ether.
 ETHER = 10**18
 
+# Every account on the chain, fetched once.
+ACCOUNTS = W3.eth.accounts
+
 # Master test account
-MASTER = W3.eth.accounts[0]
+MASTER = ACCOUNTS[0]
 
 # Dummy account for certain tests (i.e. changing ownership)
-DUMMY = W3.eth.accounts[1]
+DUMMY = ACCOUNTS[1]
+
+
+class AccountPool:
+    """Leases out accounts, never handing the same account to two holders at once.
+    Leasing is thread safe. Processes sharing a chain should each take a different shard
+    of its accounts, which is done for the default pool by setting ACCOUNT_SHARD=i/n."""
+
+    def __init__(self, accounts, shard=0, shards=1):
+        self.lock = threading.Lock()
+        self.free = list(accounts[shard::shards])
+        self.leased = set()
+        # The thread holding each leased account, and every account each thread has leased,
+        # in order, for release_since.
+        self.holders = {}
+        self.history = {}
+
+    def lease(self, num_accounts=1):
+        with self.lock:
+            if len(self.free) < num_accounts:
+                raise Exception(f"""Only {len(self.free)} of the {num_accounts} accounts requested are free,
+                restart ganache with more accounts (i.e. ganache-cli -a 500)""")
+            leased, self.free = self.free[:num_accounts], self.free[num_accounts:]
+            self.leased.update(leased)
+            holder = threading.get_ident()
+            self.holders.update((account, holder) for account in leased)
+            self.history.setdefault(holder, []).extend(leased)
+        return leased
+
+    def claim(self, accounts):
+        """Lease the given accounts, such as those a deployment restored from a fixture was made
+        with. Accounts the current thread already holds are left as they are."""
+        holder = threading.get_ident()
+        with self.lock:
+            held = [account for account in accounts if self.holders.get(account, holder) != holder]
+            if held:
+                raise Exception(f"The accounts {held} are already leased by another thread")
+            claimed = [account for account in accounts if account not in self.leased]
+            self.free = [account for account in self.free if account not in claimed]
+            self.leased.update(claimed)
+            self.holders.update((account, holder) for account in claimed)
+            self.history.setdefault(holder, []).extend(claimed)
+
+    def release(self, accounts):
+        """Return leased accounts to the pool. They are handed out again only after every
+        account which has never been leased."""
+        with self.lock:
+            for account in accounts:
+                if account in self.leased:
+                    self.leased.remove(account)
+                    del self.holders[account]
+                    self.free.append(account)
+
+    def checkpoint(self):
+        """A mark of the leases the current thread has made so far, to be passed to release_since."""
+        with self.lock:
+            return len(self.history.get(threading.get_ident(), []))
+
+    def release_since(self, checkpoint):
+        """Return every account the current thread has leased since the checkpoint, and still holds,
+        to the pool. Accounts leased by other threads in the meantime are left alone."""
+        holder = threading.get_ident()
+        with self.lock:
+            history = self.history.get(holder, [])
+            accounts = [account for account in history[checkpoint:] if self.holders.get(account) == holder]
+            del history[checkpoint:]
+        self.release(accounts)
+
+    @contextmanager
+    def leasing(self, num_accounts=1):
+        accounts = self.lease(num_accounts)
+        try:
+            yield accounts
+        finally:
+            self.release(accounts)
+
+
+def account_shard():
+    shard, shards = os.environ.get("ACCOUNT_SHARD", "0/1").split("/")
+    return int(shard), int(shards)
+
+
+# Accounts after DUMMY, for tests needing accounts of their own.
+ACCOUNT_POOL = AccountPool(ACCOUNTS[2:], *account_shard())
 
-# what account was last accessed, assumes ganache-cli was started with enough actors
-last_accessed_account = 1
 
 def fresh_account():
-    """Return first account after DUMMY"""
-    try:
-        global last_accessed_account 
-        last_accessed_account += 1
-        return W3.eth.accounts[last_accessed_account]
-    except KeyError:
-        raise Exception("""W3.eth.accounts doesn't contain enough accounts,
-        restart ganache with more accounts (i.e. ganache-cli -a 500)""")
+    """Return an account no other test holds. Accounts leased after a snapshot is taken
+    are returned to the pool when it is restored."""
+    return ACCOUNT_POOL.lease(1)[0]
 
 
 def fresh_accounts(num_accs):
-    accs = W3.eth.accounts[last_accessed_account + 1:]
-    if len(accs) < num_accs:
-        raise Exception("""W3.eth.accounts doesn't contain enough accounts,
-                        restart ganache with more accounts (i.e. ganache-cli -a 500)""")
-    return accs[:num_accs]
+    return ACCOUNT_POOL.lease(num_accs)
+
+
+def fund_accounts(accounts, value, funder=MASTER):
+    """Top up the ether balance of each account to at least the given value.
+    Every transfer is sent before any of them is waited upon."""
+    balances = [(account, W3.eth.getBalance(account)) for account in accounts]
+    return mine_txs([W3.eth.sendTransaction({'from': funder, 'to': account, 'value': value - balance})
+                     for account, balance in balances if balance < value])
 
 
 def attempt(function, func_args, init_string, print_status=True, print_exception=True):
@@ -87,12 +199,20 @@ def fast_forward(seconds=0, minutes=0, hours=0, days=0, weeks=0):
 def take_snapshot():
     x = W3.providers[0].make_request("evm_snapshot", [])
     force_mine_block()
+    x['account_checkpoint'] = ACCOUNT_POOL.checkpoint()
     return x
 
 
 def restore_snapshot(snapshot):
     W3.providers[0].make_request("evm_revert", [snapshot['result']])
     force_mine_block()
+    # Nothing the accounts leased since the snapshot did remains on the chain, so they may be leased again.
+    ACCOUNT_POOL.release_since(snapshot['account_checkpoint'])
+
+
+def run_receipt_hooks(tx_hash, tx_receipt):
+    for hook in RECEIPT_HOOKS:
+        hook(tx_hash, tx_receipt)
 
 
 def mine_tx(tx_hash):
@@ -100,6 +220,7 @@ def mine_tx(tx_hash):
     while tx_receipt is None:
         time.sleep(POLLING_INTERVAL)
         tx_receipt = W3.eth.getTransactionReceipt(tx_hash)
+    run_receipt_hooks(tx_hash, tx_receipt)
     return tx_receipt
 
 
@@ -111,11 +232,13 @@ def mine_txs(tx_hashes):
         for tx_hash in hashes:
             tx_receipt = W3.eth.getTransactionReceipt(tx_hash)
             if tx_receipt is not None:
+                run_receipt_hooks(tx_hash, tx_receipt)
                 tx_receipts[tx_hash] = tx_receipt
                 to_remove.append(tx_hash)
         for item in to_remove:
             hashes.remove(item)
-        time.sleep(POLLING_INTERVAL)
+        if hashes:
+            time.sleep(POLLING_INTERVAL)
     return tx_receipts
 
 
@@ -128,6 +251,7 @@ def deploy_contract(compiled_sol, contract_name, deploy_account, constructor_arg
                               args=constructor_args)
     tx_receipt = mine_tx(tx_hash)
     contract_instance = W3.eth.contract(address=tx_receipt['contractAddress'], abi=contract_interface['abi'])
+    DEPLOYED_CONTRACTS[tx_receipt['contractAddress']] = (contract_name, contract_interface['abi'])
     return contract_instance, tx_receipt
 
 
@@ -0,0 +1,152 @@
+# Chain-state fixtures: a saved ganache-cli chain database holding the contracts deployed by
+# the test modules, together with their addresses and ABIs, so that later runs can start
+# from it instead of compiling and deploying everything again.
+#
+# Test modules mark their deployment functions with @fixture_deployment. Such a function must
+# itself make any other change to the chain its deployment needs, such as moving the clock
+# forward, as the rest of setUpClass runs again when the deployment is restored.
+# It runs as usual unless the CHAIN_FIXTURE_MODE environment variable is set:
+#   "build": the function runs, and the contracts it returns are recorded in the fixture;
+#   "load":  nothing is compiled or sent, and the contracts are instead taken from the fixture
+#            at CHAIN_FIXTURE, whose chain the harness must be connected to.
+# As in utils.parallelrunner, utils.deployutils is only imported once the chain has been chosen.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import wraps
+
+from utils.parallelrunner import CHAIN_COMMAND, start_chain
+from utils.rpcutils import rpc_request
+
+MANIFEST_FILE = "fixture.json"
+CHAIN_DIRECTORY = "chain"
+
+# Deployment functions by key, in the order their modules registered them.
+FIXTURE_DEPLOYMENTS = {}
+
+# The deployments recorded while building a fixture, or read from the one being loaded.
+MANIFEST = {}
+
+
+def fixture_chain_command(chain_directory, chain_command=CHAIN_COMMAND):
+    # Deterministic accounts, so that the accounts which own the saved contracts are recreated on reload.
+    return chain_command[:1] + ["--db", chain_directory, "-d"] + chain_command[1:]
+
+
+def fixture_mode():
+    return os.environ.get("CHAIN_FIXTURE_MODE")
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def record_deployment(result):
+    """Describe each item a deployment function returned: a contract by its name, address and ABI,
+    and anything else by its value, which must be serialisable as JSON."""
+    from utils.deployutils import DEPLOYED_CONTRACTS
+    items = []
+    for item in result:
+        if hasattr(item, 'address') and hasattr(item, 'abi'):
+            name = DEPLOYED_CONTRACTS.get(item.address, (None, None))[0]
+            items.append({'contract': name, 'address': item.address, 'abi': item.abi})
+        else:
+            items.append({'value': item})
+    return items
+
+
+def restore_deployment(items):
+    from utils.deployutils import W3, DEPLOYED_CONTRACTS
+    result = []
+    for item in items:
+        if 'address' in item:
+            DEPLOYED_CONTRACTS[item['address']] = (item['contract'], item['abi'])
+            result.append(W3.eth.contract(address=item['address'], abi=item['abi']))
+        else:
+            result.append(item['value'])
+    return tuple(result)
+
+
+def fixture_deployment(key):
+    """Mark a function which deploys contracts and returns a tuple of them, along with any other
+    JSON-serialisable values, so that its deployment can be saved in and restored from a fixture."""
+    def decorator(deploy):
+        @wraps(deploy)
+        def deploy_or_restore():
+            mode = fixture_mode()
+            if mode == "load":
+                if not MANIFEST:
+                    MANIFEST.update(load_manifest(os.environ["CHAIN_FIXTURE"]))
+                if key in MANIFEST.get('deployments', {}):
+                    return restore_deployment(MANIFEST['deployments'][key])
+            result = deploy()
+            if mode == "build":
+                MANIFEST.setdefault('deployments', {})[key] = record_deployment(result)
+            return result
+        FIXTURE_DEPLOYMENTS[key] = deploy_or_restore
+        return deploy_or_restore
+    return decorator
+
+
+def build_fixture(path, chain_command=CHAIN_COMMAND):
+    """Deploy every registered deployment onto a new chain, saving its database and a manifest at path."""
+    if os.environ.get("BLOCKCHAIN_BACKEND", "http") != "http":
+        raise Exception("Chain fixtures can only be built with ganache-cli.")
+    shutil.rmtree(path, ignore_errors=True)
+    chain_directory = os.path.join(path, CHAIN_DIRECTORY)
+    os.makedirs(chain_directory)
+
+    process, address = start_chain(fixture_chain_command(chain_directory, chain_command))
+    try:
+        os.environ["BLOCKCHAIN_ADDRESS"] = address
+        os.environ["CHAIN_FIXTURE_MODE"] = "build"
+        # Importing the test modules registers their deployment functions.
+        import tests
+
+        # Any time the deployments need to have passed is passed by the deployment functions themselves,
+        # so that it is saved with the chain rather than passed again each time they are restored.
+        for deploy in FIXTURE_DEPLOYMENTS.values():
+            deploy()
+        save_manifest(path, MANIFEST)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def start_fixture_chain(path):
+    """Start a chain from a copy of the fixture's database, so that the fixture itself is never modified.
+    Returns the chain process, its RPC address, and the temporary directory holding the copy."""
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        raise Exception(f"No chain fixture at {path}; build one with run_tests.py --build-fixture {path}")
+    directory = tempfile.mkdtemp(prefix="havven-fixture-")
+    chain_directory = os.path.join(directory, CHAIN_DIRECTORY)
+    shutil.copytree(os.path.join(path, CHAIN_DIRECTORY), chain_directory)
+    process, address = start_chain(fixture_chain_command(chain_directory))
+
+    # The chain's clock offset is not saved with it, but new blocks must not predate those already mined.
+    latest = int(rpc_request(address, "eth_getBlockByNumber", ["latest", False])["timestamp"], 16)
+    ahead = latest - int(time.time())
+    if ahead > 0:
+        rpc_request(address, "evm_increaseTime", [ahead + 1])
+    return process, address, directory
+
+
+def use_fixture(path):
+    """Direct this process, and any processes it spawns, to load deployments from the fixture."""
+    os.environ["CHAIN_FIXTURE"] = path
+    os.environ["CHAIN_FIXTURE_MODE"] = "load"
+
+
+def stop_fixture_chain(process, directory):
+    process.terminate()
+    process.wait()
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,141 @@
+import json
+from statistics import median
+from unittest import TextTestResult
+
+from eth_utils import function_abi_to_4byte_selector
+
+from utils.generalutils import TERMCOLORS
+
+# utils.deployutils is imported only where it is needed, since it connects to a chain on import,
+# while summaries can be aggregated and compared after a parallel run's chains have shut down.
+
+# Gas used by transactions sent outside of any test, for example in setUpClass.
+NO_TEST = "(setup)"
+
+# By default, a function is considered to have regressed if its median gas
+# cost rises by more than this fraction of its baseline.
+DEFAULT_TOLERANCE = 0.02
+
+
+class GasProfiler:
+    """Records the gas used by every transaction mined through mine_tx or mine_txs,
+    attributed to the contract and function called, and the test that called it."""
+
+    def __init__(self):
+        self.current_test = None
+        # (address, selector, test, gas) for each mined transaction.
+        self.records = []
+
+    def record(self, tx_hash, tx_receipt):
+        from utils.deployutils import W3
+        tx = W3.eth.getTransaction(tx_hash)
+        if tx['to'] is None:
+            address, selector = tx_receipt['contractAddress'], None
+        else:
+            address, selector = tx['to'], tx['input'][2:10].lower()
+        self.records.append((address, selector, self.current_test or NO_TEST, tx_receipt['gasUsed']))
+
+    def function_name(self, address, selector):
+        """Resolve a transaction's target and selector into a 'Contract.function' name.
+        Contracts are resolved lazily, since a deployment is only registered after it is mined."""
+        from utils.deployutils import DEPLOYED_CONTRACTS
+        if address not in DEPLOYED_CONTRACTS:
+            return f"{address}.{selector or 'constructor'}"
+        name, abi = DEPLOYED_CONTRACTS[address]
+        if selector is None:
+            return f"{name}.constructor"
+        if selector == "":
+            return f"{name}.fallback"
+        for item in abi:
+            if item['type'] == 'function' and function_abi_to_4byte_selector(item).hex() == selector:
+                return f"{name}.{item['name']}"
+        return f"{name}.{selector}"
+
+    def resolved_records(self):
+        """Return a (function, test, gas) triple for each recorded transaction."""
+        return [(self.function_name(address, selector), test, gas)
+                for address, selector, test, gas in self.records]
+
+    def summary(self):
+        """Aggregate the records into min, median and max gas per function, overall and per test."""
+        return summarise_records(self.resolved_records())
+
+    def save_baseline(self, path):
+        save_baseline(self.summary(), path)
+
+
+def summarise_records(resolved_records):
+    """Aggregate (function, test, gas) triples, which may have been gathered by several profilers."""
+    functions, tests = {}, {}
+    for function, test, gas in resolved_records:
+        functions.setdefault(function, []).append(gas)
+        tests.setdefault(test, {}).setdefault(function, []).append(gas)
+    return {
+        'functions': {function: summarise(gas) for function, gas in functions.items()},
+        'tests': {test: {function: summarise(gas) for function, gas in test_functions.items()}
+                  for test, test_functions in tests.items()}
+    }
+
+
+def summarise(gas):
+    return {'calls': len(gas), 'min': min(gas), 'median': median(gas), 'max': max(gas)}
+
+
+def save_baseline(summary, path):
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(summary, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return a list of (function, baseline median, current median) for every function
+    whose median gas cost exceeds its baseline by more than the given fraction."""
+    regressions = []
+    for function, current in sorted(summary['functions'].items()):
+        previous = baseline['functions'].get(function)
+        if previous is not None and current['median'] > previous['median'] * (1 + tolerance):
+            regressions.append((function, previous['median'], current['median']))
+    return regressions
+
+
+def format_table(function_summary):
+    rows = [(function, str(s['calls']), str(s['min']), str(int(s['median'])), str(s['max']))
+            for function, s in sorted(function_summary.items())]
+    header = ("Function", "Calls", "Min", "Median", "Max")
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+                       for i, cell in enumerate(row))
+             for row in [header] + rows]
+    return "\n".join(lines)
+
+
+def format_regressions(regressions):
+    return "\n".join(f"{TERMCOLORS.YELLOW}{function}{TERMCOLORS.RESET}: median gas {int(previous)} -> {int(current)}"
+                     f" (+{100 * (current - previous) / previous:.1f}%)"
+                     for function, previous, current in regressions)
+
+
+PROFILER = GasProfiler()
+
+
+def enable_gas_profiling():
+    from utils.deployutils import RECEIPT_HOOKS
+    if PROFILER.record not in RECEIPT_HOOKS:
+        RECEIPT_HOOKS.append(PROFILER.record)
+    return PROFILER
+
+
+class GasProfilingTestResult(TextTestResult):
+    """A test result which attributes recorded gas usage to the running test."""
+
+    def startTest(self, test):
+        PROFILER.current_test = test.id()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        PROFILER.current_test = None
@@ -0,0 +1,226 @@
+# Run the test suite across several worker processes, each with its own local chain.
+# Nothing that connects to a chain on import (such as utils.deployutils) may be imported
+# at the top of this module, since each worker selects its chain through the
+# BLOCKCHAIN_ADDRESS environment variable before that connection is made.
+
+import io
+import multiprocessing
+import os
+import queue
+import socket
+import subprocess
+import time
+from contextlib import redirect_stdout
+
+from utils.generalutils import TERMCOLORS
+from utils.rpcutils import rpc_request
+
+# The command used to start each worker's chain; the port is appended.
+CHAIN_COMMAND = ["ganache-cli", "-a", "500", "-e", "1000000000000", "-p"]
+
+# How long to wait for a freshly started chain to accept requests.
+CHAIN_STARTUP_TIMEOUT = 60
+CHAIN_POLLING_INTERVAL = 0.25
+
+# How often to check that the workers are still alive while waiting for their results.
+RESULT_POLLING_INTERVAL = 1
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def chain_is_ready(address):
+    try:
+        rpc_request(address, "web3_clientVersion", [], timeout=1)
+        return True
+    except OSError:
+        return False
+
+
+def start_chain(command=CHAIN_COMMAND):
+    """Start a local chain on a free port, returning the process and its RPC address."""
+    port = free_port()
+    process = subprocess.Popen(command + [str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    address = f"http://localhost:{port}"
+
+    deadline = time.time() + CHAIN_STARTUP_TIMEOUT
+    while not chain_is_ready(address):
+        if process.poll() is not None or time.time() > deadline:
+            process.kill()
+            raise Exception(f"Could not start a chain with: {' '.join(command + [str(port)])}")
+        time.sleep(CHAIN_POLLING_INTERVAL)
+    return process, address
+
+
+def run_worker(address, module_queue, result_queue, profile_gas, profile_rpc, package="tests"):
+    """Run test modules taken from the queue against the chain at the given address,
+    until the queue yields None. One result dict is put on the result queue per module."""
+    # Every module-level connection, account counter and so on in this process
+    # is created after this point, and so belongs to this worker's chain alone.
+    os.environ["BLOCKCHAIN_ADDRESS"] = address
+
+    import importlib
+    from unittest import TestLoader, TextTestRunner, TextTestResult
+
+    profiler = None
+    rpc_profiler = None
+    resultclass = TextTestResult
+    if profile_gas:
+        from utils.gasprofiler import enable_gas_profiling, GasProfilingTestResult
+        profiler = enable_gas_profiling()
+        resultclass = GasProfilingTestResult
+    if profile_rpc:
+        from utils.rpcprofiler import enable_rpc_profiling, ProfilingTestResult
+        rpc_profiler = enable_rpc_profiling()
+        resultclass = ProfilingTestResult
+
+    while True:
+        module_name = module_queue.get()
+        if module_name is None:
+            break
+
+        output = io.StringIO()
+        start = time.time()
+        with redirect_stdout(output):
+            try:
+                module = importlib.import_module(f"{package}.{module_name}")
+                suite = TestLoader().loadTestsFromModule(module)
+                result = TextTestRunner(stream=output, verbosity=2, resultclass=resultclass).run(suite)
+                outcome = {
+                    "run": result.testsRun,
+                    "failures": [(test.id(), trace) for test, trace in result.failures],
+                    "errors": [(test.id(), trace) for test, trace in result.errors],
+                    "skipped": len(result.skipped)
+                }
+            except Exception as e:
+                outcome = {"run": 0, "failures": [], "errors": [(module_name, repr(e))], "skipped": 0}
+
+        outcome.update({
+            "module": module_name,
+            "address": address,
+            "duration": time.time() - start,
+            "output": output.getvalue(),
+            "gas": profiler.resolved_records() if profiler is not None else [],
+            "rpc": rpc_profiler.dump() if rpc_profiler is not None else None
+        })
+        if profiler is not None:
+            profiler.records = []
+        if rpc_profiler is not None:
+            rpc_profiler.reset()
+        result_queue.put(outcome)
+
+
+def run_parallel(module_names, workers, profile_gas=False, profile_rpc=False, chain_command=CHAIN_COMMAND,
+                 fixture=None):
+    """Shard the given test modules across worker processes, each with its own chain.
+    Modules are handed out one at a time as workers become free.
+    If a fixture path is given, each chain starts from its own copy of that fixture.
+    Returns the list of per-module results, in the order they completed."""
+    workers = max(1, min(workers, len(module_names)))
+    # Workers inherit the environment, so with the in-process backend each one already has its own chain.
+    in_process = os.environ.get("BLOCKCHAIN_BACKEND") == "tester"
+
+    # Spawned (rather than forked) workers start with fresh module state.
+    context = multiprocessing.get_context("spawn")
+    module_queue = context.Queue()
+    result_queue = context.Queue()
+    for module_name in module_names:
+        module_queue.put(module_name)
+    for _ in range(workers):
+        module_queue.put(None)
+
+    if fixture is not None:
+        from utils.fixtures import start_fixture_chain, stop_fixture_chain, use_fixture
+        use_fixture(fixture)
+
+    chains = []
+    fixture_chains = []
+    processes = []
+    try:
+        for i in range(workers):
+            if in_process:
+                address = f"in-process-{i}"
+            elif fixture is not None:
+                chain, address, directory = start_fixture_chain(fixture)
+                fixture_chains.append((chain, directory))
+            else:
+                chain, address = start_chain(chain_command)
+                chains.append(chain)
+            process = context.Process(target=run_worker,
+                                      args=(address, module_queue, result_queue, profile_gas, profile_rpc))
+            process.start()
+            processes.append(process)
+
+        results = collect_results(module_names, processes, result_queue)
+        for process in processes:
+            process.join()
+        return results
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for chain in chains:
+            chain.terminate()
+            chain.wait()
+        for chain, directory in fixture_chains:
+            stop_fixture_chain(chain, directory)
+
+
+def collect_results(module_names, processes, result_queue):
+    """Wait for a result for each module from the worker processes, printing each one's output
+    as it arrives. Should every worker exit while some modules are unreported, for example because
+    a worker crashed or was killed part way through a module, each of those modules is reported
+    with an error rather than waited for. Returns the results in the order they completed."""
+    results = []
+    while len(results) < len(module_names):
+        try:
+            result = result_queue.get(timeout=RESULT_POLLING_INTERVAL)
+        except queue.Empty:
+            if any(process.is_alive() for process in processes):
+                continue
+            # A worker's last result may have been sent just before it exited.
+            try:
+                result = result_queue.get(timeout=RESULT_POLLING_INTERVAL)
+            except queue.Empty:
+                break
+        print(result["output"], end="", flush=True)
+        results.append(result)
+
+    reported = {result["module"] for result in results}
+    exit_codes = [process.exitcode for process in processes]
+    for module_name in module_names:
+        if module_name not in reported:
+            results.append(lost_module_result(module_name, exit_codes))
+    return results
+
+
+def lost_module_result(module_name, exit_codes):
+    message = f"No result was received for {module_name} before every worker exited (exit codes: {exit_codes})."
+    return {"module": module_name, "address": None, "duration": 0, "output": "",
+            "run": 0, "failures": [], "errors": [(module_name, message)], "skipped": 0, "gas": [], "rpc": None}
+
+
+def print_summary(results, duration):
+    run = sum(result["run"] for result in results)
+    failures = [failure for result in results for failure in result["failures"]]
+    errors = [error for result in results for error in result["errors"]]
+    skipped = sum(result["skipped"] for result in results)
+
+    for kind, problems in [("ERROR", errors), ("FAIL", failures)]:
+        for test_id, trace in problems:
+            print("=" * 70)
+            print(f"{kind}: {test_id}")
+            print("-" * 70)
+            print(trace)
+
+    print("-" * 70)
+    chains = len({result['address'] for result in results if result['address'] is not None})
+    print(f"Ran {run} tests in {duration:.3f}s across {chains} chains\n")
+    if failures or errors:
+        print(f"{TERMCOLORS.RED}FAILED (failures={len(failures)}, errors={len(errors)}, skipped={skipped}){TERMCOLORS.RESET}")
+    else:
+        print(f"{TERMCOLORS.GREEN}OK (skipped={skipped}){TERMCOLORS.RESET}")
+    return not (failures or errors)
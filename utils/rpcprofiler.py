@@ -0,0 +1,210 @@
+import json
+import math
+import time
+
+from utils.gasprofiler import GasProfilingTestResult, NO_TEST
+
+# Latencies are recorded in microseconds, to this many significant figures,
+# so the relative error of any recorded value is bounded regardless of its magnitude.
+SIGNIFICANT_FIGURES = 2
+
+# The number of slowest tests to report.
+SLOWEST_TESTS = 10
+
+
+class LatencyHistogram:
+    """A histogram with logarithmically sized buckets, in the manner of an HDR histogram:
+    each value is stored rounded to a fixed number of significant figures."""
+
+    def __init__(self, buckets=None):
+        # {bucket value: count}
+        self.buckets = dict(buckets or {})
+
+    @staticmethod
+    def bucket(value):
+        if value <= 0:
+            return 0
+        magnitude = 10 ** (int(math.floor(math.log10(value))) - SIGNIFICANT_FIGURES + 1)
+        return int(round(value / magnitude) * magnitude)
+
+    def record(self, value):
+        b = self.bucket(value)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    def merge(self, other):
+        for b, count in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + count
+
+    def count(self):
+        return sum(self.buckets.values())
+
+    def percentile(self, p):
+        """The smallest recorded bucket value at or below which p percent of the values lie."""
+        total = self.count()
+        if total == 0:
+            return 0
+        threshold = math.ceil(total * p / 100)
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= threshold:
+                return b
+        return max(self.buckets)
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        # Calls made with the same parameters, and receiving the same response,
+        # as an earlier call within the same test.
+        self.redundant_calls = 0
+        self.latency = LatencyHistogram()
+
+    def dump(self):
+        return {
+            'calls': self.calls,
+            'total_time': self.total_time,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'redundant_calls': self.redundant_calls,
+            'latency_us': {str(b): count for b, count in self.latency.buckets.items()},
+        }
+
+    def merge_dump(self, dump):
+        self.calls += dump['calls']
+        self.total_time += dump['total_time']
+        self.request_bytes += dump['request_bytes']
+        self.response_bytes += dump['response_bytes']
+        self.redundant_calls += dump['redundant_calls']
+        self.latency.merge(LatencyHistogram({int(b): count for b, count in dump['latency_us'].items()}))
+
+
+class RpcProfiler:
+    """Records the count, latency and payload size of every JSON-RPC request made through W3,
+    per method and per test, and notices requests which merely repeat an earlier one."""
+
+    def __init__(self):
+        self.current_test = None
+        self.reset()
+
+    def reset(self):
+        self.methods = {}
+        # {test: {'calls': n, 'time': seconds}}
+        self.tests = {}
+        # (method, params, response) of each request already made in the current test.
+        self.seen = set()
+
+    def set_current_test(self, test):
+        self.current_test = test
+        self.seen = set()
+
+    def record(self, method, params, response, duration):
+        request = json.dumps(params, default=str)
+        reply = json.dumps(response, default=str)
+
+        stats = self.methods.setdefault(method, MethodStats())
+        stats.calls += 1
+        stats.total_time += duration
+        stats.request_bytes += len(request)
+        stats.response_bytes += len(reply)
+        stats.latency.record(duration * 10**6)
+
+        key = (method, request, reply)
+        if key in self.seen:
+            stats.redundant_calls += 1
+        else:
+            self.seen.add(key)
+
+        test = self.tests.setdefault(self.current_test or NO_TEST, {'calls': 0, 'time': 0})
+        test['calls'] += 1
+        test['time'] += duration
+
+    def middleware(self, make_request, web3):
+        def middleware_fn(method, params):
+            start = time.perf_counter()
+            response = make_request(method, params)
+            self.record(method, params, response, time.perf_counter() - start)
+            return response
+        return middleware_fn
+
+    def dump(self):
+        """A JSON-serialisable record of everything profiled, which can be merged with other dumps."""
+        return {
+            'methods': {method: stats.dump() for method, stats in self.methods.items()},
+            'tests': self.tests
+        }
+
+    def merge_dump(self, dump):
+        for method, method_dump in dump['methods'].items():
+            self.methods.setdefault(method, MethodStats()).merge_dump(method_dump)
+        for test, test_dump in dump['tests'].items():
+            test_stats = self.tests.setdefault(test, {'calls': 0, 'time': 0})
+            test_stats['calls'] += test_dump['calls']
+            test_stats['time'] += test_dump['time']
+
+    def report(self):
+        """Return a machine-readable summary: per-method statistics, the slowest tests by time
+        spent in RPC requests, and the methods with redundant calls."""
+        methods = {
+            method: {
+                'calls': stats.calls,
+                'total_time': stats.total_time,
+                'p50_us': stats.latency.percentile(50),
+                'p99_us': stats.latency.percentile(99),
+                'max_us': stats.latency.percentile(100),
+                'request_bytes': stats.request_bytes,
+                'response_bytes': stats.response_bytes,
+                'redundant_calls': stats.redundant_calls
+            }
+            for method, stats in self.methods.items()
+        }
+        slowest = sorted(self.tests.items(), key=lambda item: item[1]['time'], reverse=True)[:SLOWEST_TESTS]
+        redundant = sorted(((method, stats.redundant_calls) for method, stats in self.methods.items()
+                            if stats.redundant_calls), key=lambda item: item[1], reverse=True)
+        return {
+            'methods': methods,
+            'slowest_tests': [{'test': test, **stats} for test, stats in slowest],
+            'redundant_calls': [{'method': method, 'calls': calls} for method, calls in redundant]
+        }
+
+
+def format_report(report):
+    lines = ["RPC methods:\n",
+             f"{'Method':<32}{'Calls':>8}{'Time (s)':>10}{'p50 (us)':>10}{'p99 (us)':>10}{'Bytes out':>12}{'Bytes in':>12}"]
+    for method, s in sorted(report['methods'].items(), key=lambda item: item[1]['total_time'], reverse=True):
+        lines.append(f"{method:<32}{s['calls']:>8}{s['total_time']:>10.2f}{s['p50_us']:>10}{s['p99_us']:>10}"
+                     f"{s['request_bytes']:>12}{s['response_bytes']:>12}")
+
+    lines.append("\nSlowest tests by RPC time:\n")
+    for test in report['slowest_tests']:
+        lines.append(f"{test['time']:>8.2f}s {test['calls']:>7} calls  {test['test']}")
+
+    if report['redundant_calls']:
+        lines.append("\nRedundant calls (repeating an earlier request and response in the same test):\n")
+        for redundant in report['redundant_calls']:
+            lines.append(f"{redundant['calls']:>8}  {redundant['method']}")
+    return "\n".join(lines)
+
+
+RPC_PROFILER = RpcProfiler()
+
+
+def enable_rpc_profiling():
+    from utils.deployutils import W3
+    W3.middleware_stack.add(RPC_PROFILER.middleware, name='rpc_profiler')
+    return RPC_PROFILER
+
+
+class ProfilingTestResult(GasProfilingTestResult):
+    """A test result which attributes both gas usage and RPC requests to the running test."""
+
+    def startTest(self, test):
+        RPC_PROFILER.set_current_test(test.id())
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        RPC_PROFILER.set_current_test(None)
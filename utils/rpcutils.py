@@ -0,0 +1,38 @@
+import json
+import urllib.request
+
+# Plain JSON-RPC over HTTP, for requests web3 cannot make: batches of many requests in a
+# single round trip, and requests made before web3 (which connects on import) can be used.
+
+
+def post(address, payload, timeout=None):
+    request = urllib.request.Request(address, data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode())
+
+
+def rpc_request(address, method, params, timeout=None):
+    """Make a single JSON-RPC request, returning its result."""
+    return post(address, {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}, timeout).get("result")
+
+
+def batch_request(address, calls, timeout=None):
+    """Send several JSON-RPC requests in one HTTP request. calls is a list of (method, params) pairs;
+    returns a list of (result, error) pairs in the same order."""
+    if not calls:
+        return []
+    payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+               for i, (method, params) in enumerate(calls)]
+    replies = {reply["id"]: reply for reply in post(address, payload, timeout)}
+    return [(replies[i].get("result"), replies[i].get("error")) for i in range(len(calls))]
+
+
+def batch_call_uints(address, calls, block="latest"):
+    """Call many contract view functions returning a single uint (or bool) in one batched request.
+    calls is a list of (contract, function name, args) triples; returns a list of integers,
+    with None in place of any call which reverted."""
+    requests = [("eth_call", [{"to": contract.address, "data": contract.encodeABI(fn_name=name, args=args)}, block])
+                for contract, name, args in calls]
+    return [None if error is not None or result in (None, "0x") else int(result, 16)
+            for result, error in batch_request(address, requests)]
@@ -0,0 +1,47 @@
+# An in-process EVM for the test harness, so that tests need neither a separately
+# running client nor a round trip over HTTP for every request.
+# Requires eth-tester with the py-evm backend: pip3 install "eth-tester[py-evm]"
+
+from eth_tester import EthereumTester, PyEVMBackend
+from eth_tester.backends.pyevm.main import generate_genesis_state_for_keys, get_default_account_keys
+from web3.providers.eth_tester import EthereumTesterProvider
+
+
+class InProcessProvider(EthereumTesterProvider):
+    """An eth-tester provider which also answers the ganache-cli specific methods
+    the harness relies upon: evm_snapshot, evm_revert, evm_increaseTime and evm_mine."""
+
+    def __init__(self, num_accounts, balance):
+        genesis_state = dict(generate_genesis_state_for_keys(get_default_account_keys(quantity=num_accounts),
+                                                             overrides={'balance': balance}))
+        self.tester = EthereumTester(backend=PyEVMBackend(genesis_state=genesis_state))
+        super().__init__(ethereum_tester=self.tester)
+        self.chain_methods = {
+            "evm_snapshot": self.evm_snapshot,
+            "evm_revert": self.evm_revert,
+            "evm_increaseTime": self.evm_increaseTime,
+            "evm_mine": self.evm_mine
+        }
+
+    def make_request(self, method, params):
+        if method in self.chain_methods:
+            return {'jsonrpc': '2.0', 'id': 0, 'result': self.chain_methods[method](*params)}
+        return super().make_request(method, params)
+
+    def evm_snapshot(self):
+        return self.tester.take_snapshot()
+
+    def evm_revert(self, snapshot_id):
+        self.tester.revert_to_snapshot(snapshot_id)
+        return True
+
+    def evm_increaseTime(self, seconds):
+        # Like ganache-cli, the increase applies to the blocks mined from now on.
+        if seconds > 0:
+            pending_time = self.tester.get_block_by_number('pending')['timestamp']
+            self.tester.time_travel(pending_time + seconds)
+        return seconds
+
+    def evm_mine(self):
+        self.tester.mine_blocks(1)
+        return "0x0"
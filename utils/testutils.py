@@ -1,8 +1,14 @@
+import threading
+from contextlib import contextmanager
+
 from web3.utils.events import get_event_data
 from eth_utils import event_abi_to_log_topic
 
 from utils.deployutils import mine_tx, W3
 
+# Whether assertReverts detects reverts by simulating transactions with eth_call, rather than by mining them.
+SIMULATE_REVERTS = True
+
 
 def assertClose(testcase, actual, expected, precision=5, msg=''):
     if expected == 0:
@@ -20,9 +26,50 @@ def assertClose(testcase, actual, expected, precision=5, msg=''):
     )
 
 
-def assertReverts(testcase, function, *args):
+# Whether the current thread is inside simulated_reverts.
+SIMULATION_STATE = threading.local()
+
+
+def revert_simulation_middleware(make_request, web3):
+    """Within simulated_reverts, simulate each transaction the same thread sends with eth_call,
+    against the pending block, before sending it. A transaction which would revert is never sent;
+    the call's error is returned in its place. Other threads' requests pass straight through."""
+    def middleware(method, params):
+        if method == "eth_sendTransaction" and getattr(SIMULATION_STATE, 'active', False):
+            call = {key: value for key, value in params[0].items() if key != 'nonce'}
+            response = make_request("eth_call", [call, "pending"])
+            if 'error' in response:
+                return response
+        return make_request(method, params)
+    return middleware
+
+
+# Installed once, on import, so that the middleware stack shared by every thread is never changed
+# while tests are running; simulated_reverts only sets a flag for its own thread.
+if 'revert_simulation' not in W3.middleware_stack:
+    W3.middleware_stack.add(revert_simulation_middleware, name='revert_simulation')
+
+
+@contextmanager
+def simulated_reverts():
+    SIMULATION_STATE.active = True
+    try:
+        yield
+    finally:
+        SIMULATION_STATE.active = False
+
+
+def assertReverts(testcase, function, *args, mine=False):
+    """Assert that calling the function with the given arguments reverts.
+    Unless mine is set, or SIMULATE_REVERTS is disabled, any transaction that would revert
+    is caught by simulating it with eth_call instead of being mined. Mining may still be
+    needed where the outcome depends on the block the transaction is mined in."""
     with testcase.assertRaises(ValueError) as error:
-        function(*args)
+        if mine or not SIMULATE_REVERTS:
+            function(*args)
+        else:
+            with simulated_reverts():
+                function(*args)
     testcase.assertTrue("revert" in error.exception.args[0]['message'])
     # The ganache-cli 6.1.0 beta does not include an error code field.
     # testcase.assertEqual(-32000, error.exception.args[0]['code'])
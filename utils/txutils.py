@@ -0,0 +1,77 @@
+import threading
+import time
+
+from utils.deployutils import W3, run_receipt_hooks
+
+# The factor by which a transaction's gas estimate is raised, in case it costs more once mined.
+GAS_MARGIN = 1.2
+
+
+class NonceManager:
+    """Allocates consecutive nonces for an account locally, so that many transactions can be sent
+    without waiting on one another, and without asking the node for each nonce."""
+
+    def __init__(self, account):
+        self.account = account
+        self.lock = threading.Lock()
+        self.next_nonce = None
+
+    def allocate(self):
+        with self.lock:
+            if self.next_nonce is None:
+                self.next_nonce = W3.eth.getTransactionCount(self.account, 'pending')
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def resync(self):
+        """Fetch the nonce from the node again, for example after a transaction was rejected
+        without consuming the nonce allocated to it."""
+        with self.lock:
+            self.next_nonce = None
+
+
+def send_transaction(contract_function, sender, nonces, gas=None, gas_price=None, value=0, nonce=None):
+    """Send a transaction with a nonce from the given NonceManager, without waiting for it to be mined.
+    Unless gas is given, it is estimated with a margin. A nonce already allocated from the manager
+    may be given instead. Returns the transaction hash."""
+    if gas is None:
+        gas = int(contract_function.estimateGas({'from': sender, 'value': value}) * GAS_MARGIN)
+    if nonce is None:
+        nonce = nonces.allocate()
+    transaction = {'from': sender, 'gas': gas, 'value': value, 'nonce': nonce}
+    if gas_price is not None:
+        transaction['gasPrice'] = gas_price
+    try:
+        return contract_function.transact(transaction)
+    except ValueError:
+        nonces.resync()
+        raise
+
+
+class PendingTransactions:
+    """Transactions which have been sent, but are not yet known to have been mined.
+    They are checked with poll, which never waits for a receipt."""
+
+    def __init__(self):
+        # {tx_hash: (time sent, context)}
+        self.sent = {}
+
+    def __len__(self):
+        return len(self.sent)
+
+    def add(self, tx_hash, context=None):
+        self.sent[tx_hash] = (time.time(), context)
+
+    def poll(self):
+        """Return a (tx_hash, receipt, seconds to confirm, context) tuple for each transaction
+        which has been mined since the last poll."""
+        mined = []
+        for tx_hash, (sent_time, context) in list(self.sent.items()):
+            receipt = W3.eth.getTransactionReceipt(tx_hash)
+            if receipt is None:
+                continue
+            run_receipt_hooks(tx_hash, receipt)
+            del self.sent[tx_hash]
+            mined.append((tx_hash, receipt, time.time() - sent_time, context))
+        return mined